@@ -14,6 +14,9 @@ def basket_products_context(request) -> Dict[str, Union[int, QuerySet]]:
     :return: A dictionary containing the context variables 'PRODUCTS_BASKET_LIST'
             and 'PRODUCTS_BASKET_NMB'.
     """
+    if getattr(request, 'cacheable_shell', False):
+        # The shared page gets the basket of the visitor from UserStateView
+        return {'PRODUCTS_BASKET_LIST': [], 'PRODUCTS_BASKET_NMB': 0}
     user_authenticated = request.session['user_authenticated']
     basket_list, basket_nmb = get_basket_list(user_authenticated)
 
@@ -103,3 +103,14 @@ def get_basket_list(user_authenticated: str) -> tuple:
     except Exception as error:
         logger.error(f"Error retrieving products in the basket {user_authenticated}: {error}")
         raise error
+
+
+def get_basket_count(user_authenticated: str) -> int:
+    """
+    Counts the products in a user's basket, for the basket badge.
+
+    :param user_authenticated: The unique identifier of the session or user's email.
+    :return: The number of products in the user's basket.
+    """
+    return ProductInBasket.objects.filter(user_authenticated=user_authenticated,
+                                          is_active=True).count()
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from online_store.settings import ASYNC_VIEWS
 from .views import *
 
 urlpatterns = [
@@ -7,4 +8,6 @@ urlpatterns = [
     path('add_basket/<id>/', view=BasketAddView.as_view(), name='add_basket'),
     path('remove_basket/<id>/', view=BasketRemoveView.as_view(), name='remove_basket'),
     path('edit_basket/<id>/', view=EditCartView.as_view(), name='edit_basket'),
+    path('count/', view=(AsyncBasketCountView if ASYNC_VIEWS else BasketCountView).as_view(),
+         name='basket_count'),
 ]
@@ -1,4 +1,6 @@
+from asgiref.sync import sync_to_async
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import View
@@ -6,6 +8,7 @@ from django.views.generic import View
 from .models import ProductInBasket
 from .services import add_products_to_basket
 from .services import edit_product_from_basket
+from .services import get_basket_count
 from .services import remove_product_from_basket
 from .ultis import BasketMixin
 
@@ -77,3 +80,23 @@ class EditCartView(BasketMixin, View):
             nmb=self.nmb)
 
         return HttpResponseRedirect(self.current)
+
+
+class BasketCountView(View):
+    """
+    View to return the number of products in the user's basket in JSON, for the basket badge.
+    """
+
+    def get(self, request):
+        return JsonResponse({'count': get_basket_count(request.session['user_authenticated'])})
+
+
+class AsyncBasketCountView(View):
+    """
+    The async version of BasketCountView.
+    """
+
+    async def get(self, request):
+        # The session is already loaded by SessionAuthenticationMiddleware
+        count = await sync_to_async(get_basket_count)(request.session['user_authenticated'])
+        return JsonResponse({'count': count})
@@ -8,4 +8,5 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'online_store.settings')
 app = Celery('online_store')
 app.config_from_object('django.conf:settings')
 app.conf.broker_url = settings.CELERY_BROKER_URL
+app.conf.beat_schedule = settings.CELERY_BEAT_SCHEDULE
 app.autodiscover_tasks()
@@ -13,3 +13,9 @@ DATABASE_NAME = os.getenv('DATABASE_NAME')
 DATABASE_HOST = os.getenv('DATABASE_HOST')
 DATABASE_PORT = os.getenv('DATABASE_PORT')
 DATABASE_USER = os.getenv('DATABASE_USER')
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'redis')
+SERVER = os.getenv('SERVER', 'wsgi')
+ASYNC_QUERIES = os.getenv('ASYNC_QUERIES', 'concurrent')
+EMAIL_DELIVERY = os.getenv('EMAIL_DELIVERY', 'smtp')
+FILE_DELIVERY = os.getenv('FILE_DELIVERY', 'nginx')
+CATALOG_FEED_KEYS = os.getenv('CATALOG_FEED_KEYS', '')
@@ -15,6 +15,9 @@ def favorite_products_context(request) -> Dict[str, Union[int, QuerySet]]:
     :return: A dictionary containing the number of favorite items and the QuerySet
         of favorite products.
     """
+    if getattr(request, 'cacheable_shell', False):
+        # The shared page gets the favorites of the visitor from UserStateView
+        return {'PRODUCTS_FAVORITE_NMB': 0, 'PRODUCTS_FAVORITE_LIST': []}
     user_authenticated = request.session['user_authenticated']
     favorite_list, favorite_nmb = get_favorite_list(user_authenticated)
 
@@ -5,6 +5,9 @@ from modeltranslation.admin import TranslationAdmin
 
 from .models import Category
 from .models import News
+from .models import Newsletter
+from .services import create_newsletter
+from .services import get_newsletter_stats
 
 
 class NewsAdminForm(forms.ModelForm):
@@ -25,6 +28,14 @@ class NewsAdmin(TranslationAdmin):
     list_editable = ('is_published',)
     fields = ('title', 'photo', 'content', 'is_published', 'category', 'slug')
     save_on_top = True
+    actions = ['send_newsletter']
+
+    @admin.action(description='Send to the subscribers')
+    def send_newsletter(self, request, queryset):
+        from news.tasks import start_newsletter
+
+        for news in queryset:
+            start_newsletter.delay(create_newsletter(news).pk)
 
 
 @admin.register(Category)
@@ -33,3 +44,23 @@ class CategoryAdmin(TranslationAdmin):
     list_display = ('id', 'title')
     list_display_links = ('id', 'title')
     search_fields = ('title',)
+
+
+@admin.register(Newsletter)
+class NewsletterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'news', 'created', 'started', 'finished', 'stats')
+    list_display_links = ('id', 'news')
+    readonly_fields = ('news', 'created', 'started', 'finished', 'stats')
+    exclude = ('content',)
+    actions = ['resume']
+
+    @admin.display(description='Deliveries')
+    def stats(self, obj):
+        return ', '.join(f'{name}: {value}' for name, value in get_newsletter_stats(obj).items())
+
+    @admin.action(description='Resume sending')
+    def resume(self, request, queryset):
+        from news.tasks import start_newsletter
+
+        for newsletter in queryset:
+            start_newsletter.delay(newsletter.pk)
@@ -4,3 +4,24 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from django.db.models.signals import post_delete
+        from django.db.models.signals import post_save
+        from django.db.models.signals import pre_save
+        from news.models import Category
+        from news.models import News
+        from news.signals import news_category_changed
+        from news.signals import news_post_delete
+        from news.signals import news_post_save
+        from news.signals import news_pre_save
+        from shop.signals import image_pre_save
+        from shop.signals import image_saved
+
+        pre_save.connect(image_pre_save, sender=News)
+        post_save.connect(image_saved, sender=News)
+        pre_save.connect(news_pre_save, sender=News)
+        post_save.connect(news_post_save, sender=News)
+        post_delete.connect(news_post_delete, sender=News)
+        post_save.connect(news_category_changed, sender=Category)
+        post_delete.connect(news_category_changed, sender=Category)
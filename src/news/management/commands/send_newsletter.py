@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from news.models import News
+from news.models import Newsletter
+from news.services import create_newsletter
+from news.services import get_newsletter_stats
+from news.services import send_newsletter_chunk
+from news.services import start_newsletter
+
+
+class Command(BaseCommand):
+    help = 'Sends a news item to the subscribers of the mailing list, or resumes a newsletter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', nargs='?', help='The slug of the news item to send')
+        parser.add_argument('--resume', type=int, metavar='NEWSLETTER_ID',
+                            help='Resume an interrupted newsletter')
+        parser.add_argument('--sync', action='store_true',
+                            help='Send in this process instead of the Celery workers')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            newsletter = Newsletter.objects.filter(pk=options['resume']).first()
+        elif options['slug']:
+            news = News.objects.filter(slug=options['slug']).first()
+            if news is None:
+                raise CommandError(f'No news with the slug {options["slug"]}')
+            newsletter = create_newsletter(news)
+        else:
+            raise CommandError('Pass the slug of a news item or --resume')
+        if newsletter is None:
+            raise CommandError(f'No newsletter {options["resume"]}')
+
+        started_at = time.monotonic()
+        send_chunk = send_newsletter_chunk if options['sync'] else None
+        chunks = start_newsletter(newsletter, send_chunk=send_chunk)
+        self.stdout.write(f'Newsletter {newsletter.pk}: {chunks} chunks '
+                          f'{"sent" if options["sync"] else "queued"} '
+                          f'in {time.monotonic() - started_at:.1f} s')
+        for name, value in get_newsletter_stats(newsletter).items():
+            self.stdout.write(f'{name}: {value}')
@@ -0,0 +1,56 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_emailfornews_language'),
+        ('news', '0004_alter_news_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Newsletter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, default=None, null=True)),
+                ('finished', models.DateTimeField(blank=True, default=None, null=True)),
+                ('news', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='newsletters', to='news.news')),
+            ],
+            options={
+                'verbose_name': 'Newsletter',
+                'verbose_name_plural': 'Newsletters',
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NewsletterDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=7)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('sent', models.DateTimeField(blank=True, default=None, null=True)),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='news.newsletter')),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='users.emailfornews')),
+            ],
+            options={
+                'verbose_name': 'Newsletter delivery',
+                'verbose_name_plural': 'Newsletter deliveries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='newsletterdelivery',
+            index=models.Index(fields=['newsletter', 'status'], name='news_newsle_newslet_7c677d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='newsletterdelivery',
+            unique_together={('newsletter', 'subscriber')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.3 on 2026-10-19 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_newsletter_newsletterdelivery_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_published', 'category', '-created_at'], name='news_news_is_publ_e7627c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_published', '-created_at'], name='news_news_is_publ_c9d734_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
+from users.models import EmailForNews
+
 
 class News(models.Model):
     title = models.CharField(max_length=100)
@@ -24,6 +26,8 @@ class News(models.Model):
         verbose_name = _('News')
         verbose_name_plural = _('News')
         ordering = ['-created_at', 'title']
+        indexes = [models.Index(fields=['is_published', 'category', '-created_at']),
+                   models.Index(fields=['is_published', '-created_at'])]
 
 
 class Category(models.Model):
@@ -40,3 +44,59 @@ class Category(models.Model):
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
         ordering = ['title']
+
+
+class Newsletter(models.Model):
+    """
+    A sending of a news item to the subscribers of the mailing list.
+    The content holds the subject, the text and the html of the email per language.
+    """
+    news = models.ForeignKey(News, related_name='newsletters', on_delete=models.PROTECT)
+    content = models.JSONField(default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True, default=None)
+    finished = models.DateTimeField(blank=True, null=True, default=None)
+
+    def __str__(self):
+        return f'{self.news} ({self.created:%Y-%m-%d %H:%M})'
+
+    class Meta:
+        verbose_name = _('Newsletter')
+        verbose_name_plural = _('Newsletters')
+        ordering = ['-created']
+
+
+class NewsletterDelivery(models.Model):
+    """
+    The delivery state of a newsletter to a subscriber.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    newsletter = models.ForeignKey(Newsletter, related_name='deliveries',
+                                   on_delete=models.CASCADE)
+    subscriber = models.ForeignKey(EmailForNews, related_name='deliveries',
+                                   on_delete=models.CASCADE)
+    language = models.CharField(max_length=7)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    claimed = models.DateTimeField(blank=True, null=True, default=None)
+    sent = models.DateTimeField(blank=True, null=True, default=None)
+
+    def __str__(self):
+        return f'{self.newsletter_id}: {self.subscriber_id} {self.status}'
+
+    class Meta:
+        verbose_name = _('Newsletter delivery')
+        verbose_name_plural = _('Newsletter deliveries')
+        unique_together = ('newsletter', 'subscriber')
+        indexes = [models.Index(fields=['newsletter', 'status'])]
@@ -1,32 +1,176 @@
+import datetime
 import logging
+import time
+from smtplib import SMTPException
+from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import List
+from typing import Optional
 from typing import Tuple
 
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
 from django.db.models import Count
 from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
 from django.db.models import QuerySet
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils import translation
+from django.utils.html import strip_tags
 
 from news.models import Category
 from news.models import News
+from news.models import Newsletter
+from news.models import NewsletterDelivery
+from online_store.settings import EMAIL_HOST_USER
+from online_store.settings import LANGUAGE_CODE
+from online_store.settings import LANGUAGES
+from online_store.settings import NEWS_CACHE_TIMEOUT
+from online_store.settings import NEWS_PAGINATE_BY
+from online_store.settings import NEWSLETTER_BATCH_SIZE
+from online_store.settings import NEWSLETTER_CHUNK_SIZE
+from online_store.settings import NEWSLETTER_MAX_ATTEMPTS
+from online_store.settings import NEWSLETTER_RATE_LIMIT
+from online_store.settings import NEWSLETTER_SENDING_TIMEOUT
+from online_store.settings import SITE_URL
+from outbox.services import get_delivery_connection
+from outbox.services import reopen_connection
+from shop.services import get_cache_version
+from shop.services import get_or_set_locked
+from users.models import EmailForNews
 
 logger = logging.getLogger(__name__)
 
+NEWS_COUNTS_CACHE_NAME = 'news_category_counts'
+NEWS_CURSOR_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+# The largest ID of a news item, the cursors with larger IDs are not valid
+NEWS_CURSOR_MAX_ID = 2 ** 63 - 1
 
-def count_news_from_categories() -> Tuple[QuerySet, Dict[str, int]]:
+
+def get_news_counts() -> Dict[Optional[int], int]:
+    """
+    Gets the number of published news in each category with one grouped query.
+
+    The counts are cached until a news item is published, unpublished, moved to another category
+    or deleted, see news.signals.
+
+    :return: A dictionary of the numbers of news by the ID of their category, None for the news
+        without a category.
+    """
+    return get_or_set_locked(
+        NEWS_COUNTS_CACHE_NAME,
+        lambda: dict(News.objects.filter(is_published=True).order_by().values_list(
+            'category').annotate(Count('pk'))),
+        NEWS_CACHE_TIMEOUT)
+
+
+def invalidate_news_counts() -> None:
+    """
+    Removes the cached numbers of published news in the categories.
+    """
+    cache.delete(NEWS_COUNTS_CACHE_NAME)
+
+
+def get_news_categories() -> List[Category]:
+    """
+    Gets all the news categories from the cache, until a news item or a category changes.
+    """
+    return get_or_set_locked(f'news_categories:{get_cache_version("news")}',
+                             lambda: list(get_all_categories()), NEWS_CACHE_TIMEOUT)
+
+
+def count_news_from_categories() -> Tuple[List[Category], int]:
     """
     Retrieves categories with published articles and counts the number of news in each category.
 
-    :return: A tuple containing a queryset of categories with published articles and a
-        dictionary of category counts.
+    :return: A tuple containing the list of categories with published articles, most news first,
+        each with the number of its news in cnt, and the number of all published news.
+    """
+    counts = get_news_counts()
+    categories = [category for category in get_news_categories() if counts.get(category.pk)]
+    for category in categories:
+        category.cnt = counts[category.pk]
+    categories.sort(key=lambda category: -category.cnt)
+    return categories, sum(counts.values())
+
+
+def get_news_cursor(value: Optional[str]) -> Optional[Tuple[datetime.datetime, int]]:
+    """
+    Converts the news page cursor from the request, see get_news_page.
+
+    :param value: The cursor received in the request.
+    :return: The creation date and the ID of the last news item on the previous page, or None if
+        the cursor is invalid, for the first page.
     """
     try:
-        categories = Category.objects.annotate(
-            cnt=Count('news', filter=F('news__is_published'))).filter(cnt__gt=0).order_by('-cnt')
-        cnt_news = News.objects.filter(is_published=True).aggregate(Count('pk'))
-        return categories, cnt_news
-    except Exception as error:
-        logger.error(f"Error getting categories and counts: {error}")
-        return None, None
+        microseconds, pk = (int(part) for part in value.split('-'))
+        if microseconds < 0 or not 0 < pk <= NEWS_CURSOR_MAX_ID:
+            raise ValueError(value)
+        return NEWS_CURSOR_EPOCH + datetime.timedelta(microseconds=microseconds), pk
+    except (AttributeError, ValueError, OverflowError):
+        if value:
+            logger.warning(f'Invalid news cursor: {value}')
+        return None
+
+
+def format_news_cursor(created_at: datetime.datetime, pk: int) -> str:
+    """
+    Formats the cursor of the page after a news item, the exact creation date in microseconds
+    and the ID of the item.
+    """
+    delta = created_at - NEWS_CURSOR_EPOCH
+    return f'{(delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds}-{pk}'
+
+
+def get_news_page(category: Optional[Category] = None,
+                  after: Optional[Tuple[datetime.datetime, int]] = None,
+                  limit: int = NEWS_PAGINATE_BY) -> Tuple[List[News], Optional[str]]:
+    """
+    Gets a page of the published news using keyset pagination, newest news first.
+
+    The pages are read by the (is_published, category, created_at) indexes. The first page of
+    each category is cached until a news item or a category changes, the next pages are not,
+    a cursor from the request would add a cache entry of its own.
+
+    :param category: The category of the news, or None for all the news.
+    :param after: The creation date and the ID of the last news item on the previous page,
+        or None for the first page, see get_news_cursor.
+    :param limit: The number of news on the page.
+    :return: A tuple containing the list of news and the cursor of the next page, or None if
+        this is the last page.
+    """
+    if after:
+        return read_news_page(category, after, limit)
+
+    cache_name = f'news:{get_cache_version("news")}:{category.pk if category else 0}:{limit}'
+    page = cache.get(cache_name)
+    if page is None:
+        page = read_news_page(category, after, limit)
+        cache.set(cache_name, page, NEWS_CACHE_TIMEOUT)
+    return page
+
+
+def read_news_page(category: Optional[Category], after: Optional[Tuple[datetime.datetime, int]],
+                   limit: int) -> Tuple[List[News], Optional[str]]:
+    """
+    Reads a page of the published news from the database, see get_news_page.
+    """
+    news = News.objects.filter(is_published=True).select_related('category')
+    if category is not None:
+        news = news.filter(category=category)
+    if after:
+        news = news.filter(Q(created_at__lt=after[0]) |
+                           Q(created_at=after[0], pk__lt=after[1]))
+    news = list(news.order_by('-created_at', '-pk')[:limit + 1])
+    next_cursor = (format_news_cursor(news[limit - 1].created_at, news[limit - 1].pk)
+                   if len(news) > limit else None)
+    return news[:limit], next_cursor
 
 
 def get_all_categories() -> QuerySet:
@@ -40,3 +184,263 @@ def get_all_categories() -> QuerySet:
     except Exception as error:
         logger.error(f"Error getting categories: {error}")
         return None
+
+
+def render_newsletter(news: News) -> Dict[str, Dict[str, str]]:
+    """
+    Renders the email of a news item once per language.
+
+    :param news: The news item.
+    :return: A dictionary of languages with the subject, the text and the html of the email.
+    """
+    content = {}
+    for language, _name in LANGUAGES:
+        with translation.override(language):
+            html = render_to_string('news/email/newsletter.html',
+                                    {'item': news, 'site_url': SITE_URL})
+            content[language] = {'subject': news.title,
+                                 'text': strip_tags(html).strip(),
+                                 'html': html}
+    return content
+
+
+def create_newsletter(news: News) -> Newsletter:
+    """
+    Creates a newsletter of a news item with its email rendered in every language.
+
+    :param news: The news item.
+    :return: The newsletter.
+    """
+    return Newsletter.objects.create(news=news, content=render_newsletter(news))
+
+
+def add_newsletter_deliveries(newsletter: Newsletter,
+                              chunk_size: int = NEWSLETTER_CHUNK_SIZE) -> int:
+    """
+    Creates a pending delivery for every active subscriber. The subscribers are read in chunks,
+    the subscribers that already have a delivery are skipped.
+
+    :param newsletter: The newsletter.
+    :param chunk_size: The number of subscribers read and created at once.
+    :return: The number of subscribers.
+    """
+    subscribers = EmailForNews.objects.filter(is_active=True).order_by('pk').values_list(
+        'pk', 'language')
+    count = 0
+    deliveries = []
+    for subscriber_id, language in subscribers.iterator(chunk_size=chunk_size):
+        deliveries.append(NewsletterDelivery(newsletter=newsletter,
+                                             subscriber_id=subscriber_id,
+                                             language=language))
+        if len(deliveries) == chunk_size:
+            NewsletterDelivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+            count += len(deliveries)
+            deliveries = []
+    NewsletterDelivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+    return count + len(deliveries)
+
+
+def get_pending_chunks(newsletter: Newsletter,
+                       chunk_size: int = NEWSLETTER_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    Splits the pending deliveries of a newsletter into ranges of ids.
+
+    :param newsletter: The newsletter.
+    :param chunk_size: The number of deliveries per range.
+    :return: A list of the first and the last delivery id of each range.
+    """
+    ids = NewsletterDelivery.objects.filter(
+        newsletter=newsletter, status=NewsletterDelivery.PENDING).order_by('pk').values_list(
+        'pk', flat=True)
+    chunks = []
+    for number, delivery_id in enumerate(ids.iterator(chunk_size=chunk_size)):
+        if number % chunk_size == 0:
+            chunks.append([delivery_id, delivery_id])
+        chunks[-1][1] = delivery_id
+    return [tuple(chunk) for chunk in chunks]
+
+
+def start_newsletter(newsletter: Newsletter,
+                     send_chunk: Callable[[int, int, int], Any] = None,
+                     chunk_size: int = NEWSLETTER_CHUNK_SIZE) -> int:
+    """
+    Starts sending a newsletter, or resumes an interrupted one.
+
+    The deliveries are created on the first start, then the ranges of pending deliveries are
+    sent by parallel Celery tasks. Sent deliveries are never sent again, so it is safe to call
+    it again after the workers were stopped, see release_stale_deliveries.
+
+    :param newsletter: The newsletter.
+    :param send_chunk: A function that sends a range of deliveries, the Celery task by default.
+    :param chunk_size: The number of deliveries per task.
+    :return: The number of ranges to send.
+    """
+    if send_chunk is None:
+        from news.tasks import send_newsletter_chunk
+        send_chunk = send_newsletter_chunk.delay
+
+    if newsletter.started is None:
+        add_newsletter_deliveries(newsletter, chunk_size)
+        newsletter.started = timezone.now()
+        newsletter.save(update_fields=['started'])
+
+    release_stale_deliveries(newsletter)
+    chunks = get_pending_chunks(newsletter, chunk_size)
+    for first_id, last_id in chunks:
+        send_chunk(newsletter.pk, first_id, last_id)
+    return len(chunks)
+
+
+def release_stale_deliveries(newsletter: Newsletter) -> int:
+    """
+    Makes the deliveries taken for sending more than NEWSLETTER_SENDING_TIMEOUT seconds ago
+    pending again, the worker that took them stopped before it marked them. The interrupted
+    sending counts as an attempt. Such an email may have been sent, so it can be delivered
+    twice, but it is not lost.
+
+    :param newsletter: The newsletter.
+    :return: The number of deliveries made pending again.
+    """
+    stale = newsletter.deliveries.filter(
+        status=NewsletterDelivery.SENDING,
+        claimed__lte=timezone.now() - datetime.timedelta(seconds=NEWSLETTER_SENDING_TIMEOUT))
+    error = 'The worker stopped while sending the email'
+    stale.filter(attempts__gte=NEWSLETTER_MAX_ATTEMPTS - 1).update(
+        status=NewsletterDelivery.FAILED, attempts=F('attempts') + 1, last_error=error)
+    return stale.update(status=NewsletterDelivery.PENDING, attempts=F('attempts') + 1,
+                        last_error=error)
+
+
+def wait_for_rate_limit(rate_limit: int = NEWSLETTER_RATE_LIMIT) -> None:
+    """
+    Waits until one more message fits in the rate limit shared by all workers.
+    The messages are counted per second in the cache.
+
+    :param rate_limit: The maximum number of messages per second.
+    """
+    while True:
+        second = int(time.time())
+        cache_name = f'newsletter_rate:{second}'
+        cache.add(cache_name, 0, 5)
+        try:
+            count = cache.incr(cache_name)
+        except ValueError:
+            continue
+        if count <= rate_limit:
+            return
+        time.sleep(max(second + 1 - time.time(), 0))
+
+
+def get_newsletter_message(newsletter: Newsletter, delivery: NewsletterDelivery,
+                           connection: BaseEmailBackend) -> EmailMultiAlternatives:
+    """
+    Builds the email of a delivery from the content rendered in the language of the subscriber.
+    """
+    content = newsletter.content.get(delivery.language) or newsletter.content[LANGUAGE_CODE]
+    message = EmailMultiAlternatives(subject=content['subject'],
+                                     body=content['text'],
+                                     from_email=EMAIL_HOST_USER,
+                                     to=[delivery.subscriber.email],
+                                     connection=connection)
+    message.attach_alternative(content['html'], 'text/html')
+    return message
+
+
+def claim_newsletter_deliveries(newsletter: Newsletter, after_id: int, last_id: int,
+                                batch_size: int = NEWSLETTER_BATCH_SIZE) \
+        -> List[NewsletterDelivery]:
+    """
+    Takes the next pending deliveries of a range for sending: marks them as being sent and
+    commits, so concurrent workers skip them.
+
+    :param newsletter: The newsletter.
+    :param after_id: The deliveries with greater ids are taken.
+    :param last_id: The last delivery id of the range.
+    :param batch_size: The maximum number of deliveries to take.
+    :return: The taken deliveries.
+    """
+    with transaction.atomic():
+        deliveries = list(NewsletterDelivery.objects.select_for_update(
+            skip_locked=True).select_related('subscriber').filter(
+            newsletter=newsletter, status=NewsletterDelivery.PENDING,
+            pk__gt=after_id, pk__lte=last_id).order_by('pk')[:batch_size])
+        NewsletterDelivery.objects.filter(pk__in=[delivery.pk for delivery in deliveries]).update(
+            status=NewsletterDelivery.SENDING, claimed=timezone.now())
+    return deliveries
+
+
+def send_newsletter_chunk(newsletter_id: int, first_id: int, last_id: int,
+                          connection: BaseEmailBackend = None,
+                          batch_size: int = NEWSLETTER_BATCH_SIZE) -> int:
+    """
+    Sends the pending deliveries of a range over one connection, within the rate limit. The
+    connection is opened once per chunk.
+
+    Each pending delivery is attempted once, the failed ones stay pending until the newsletter
+    is resumed, up to NEWSLETTER_MAX_ATTEMPTS attempts. The deliveries are taken for sending
+    first, see claim_newsletter_deliveries, and each of them is marked right after its attempt.
+    No transaction is open while the worker waits for the rate limit and sends the messages.
+
+    :param newsletter_id: The id of the newsletter.
+    :param first_id: The first delivery id of the range.
+    :param last_id: The last delivery id of the range.
+    :param connection: The connection of the delivery backend, a new one by default.
+    :param batch_size: The number of deliveries taken at once.
+    :return: The number of sent emails.
+    """
+    newsletter = Newsletter.objects.get(pk=newsletter_id)
+    connection = connection or get_delivery_connection()
+    connection.open()
+    sent = 0
+    cursor = first_id - 1
+    try:
+        while True:
+            deliveries = claim_newsletter_deliveries(newsletter, cursor, last_id, batch_size)
+            if not deliveries:
+                break
+
+            for delivery in deliveries:
+                wait_for_rate_limit()
+                delivery.attempts += 1
+                try:
+                    connection.send_messages(
+                        [get_newsletter_message(newsletter, delivery, connection)])
+                except (SMTPException, OSError) as error:
+                    delivery.last_error = str(error)
+                    delivery.status = (NewsletterDelivery.FAILED
+                                       if delivery.attempts >= NEWSLETTER_MAX_ATTEMPTS
+                                       else NewsletterDelivery.PENDING)
+                    # The connection may be broken, the next email is sent over a new one
+                    reopen_connection(connection)
+                else:
+                    delivery.status = NewsletterDelivery.SENT
+                    delivery.sent = timezone.now()
+                    sent += 1
+                delivery.save(update_fields=['status', 'attempts', 'last_error', 'sent'])
+            cursor = deliveries[-1].pk
+    finally:
+        connection.close()
+
+    if not newsletter.deliveries.filter(
+            status__in=[NewsletterDelivery.PENDING, NewsletterDelivery.SENDING]).exists():
+        Newsletter.objects.filter(pk=newsletter.pk, finished__isnull=True).update(
+            finished=timezone.now())
+    return sent
+
+
+def get_newsletter_stats(newsletter: Newsletter) -> Dict[str, Any]:
+    """
+    Counts the deliveries of a newsletter by status and the sending rate.
+
+    :param newsletter: The newsletter.
+    :return: A dictionary with the number of pending, sending, sent and failed deliveries and
+        the number of messages sent per second.
+    """
+    stats = dict.fromkeys((NewsletterDelivery.PENDING, NewsletterDelivery.SENDING,
+                           NewsletterDelivery.SENT, NewsletterDelivery.FAILED), 0)
+    stats.update(newsletter.deliveries.values_list('status').annotate(Count('pk')))
+    period = newsletter.deliveries.aggregate(first=Min('sent'), last=Max('sent'))
+    seconds = (period['last'] - period['first']).total_seconds() if period['first'] else 0
+    # The first message starts the period, the rate counts the messages sent after it
+    stats['messages_per_second'] = round((stats['sent'] - 1) / seconds, 1) if seconds else None
+    return stats
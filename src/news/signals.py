@@ -0,0 +1,45 @@
+from news.models import News
+from news.services import invalidate_news_counts
+from shop.services import invalidate_cache_version
+
+
+def news_pre_save(sender, instance, **kwargs) -> None:
+    """
+    Remembers whether the news item was published and its category before it is changed.
+    """
+    instance.previous_state = None
+    if instance.pk:
+        instance.previous_state = News.objects.filter(pk=instance.pk).values_list(
+            'is_published', 'category_id').first()
+
+
+def news_post_save(sender, instance, created=None, **kwargs) -> None:
+    """
+    Reacts to the change or addition of news.
+    Invalidates the cached news pages and, if the item was published, unpublished or moved to
+    another category, the cached numbers of news in the categories.
+    """
+    invalidate_cache_version('news')
+    previous_state = None if created else getattr(instance, 'previous_state', None)
+    state = (instance.is_published, instance.category_id)
+    if previous_state != state and (instance.is_published or
+                                    (previous_state and previous_state[0])):
+        invalidate_news_counts()
+
+
+def news_post_delete(sender, instance, **kwargs) -> None:
+    """
+    Reacts to the removal of news.
+    Invalidates the cached news pages and the numbers of news in the categories.
+    """
+    invalidate_cache_version('news')
+    if instance.is_published:
+        invalidate_news_counts()
+
+
+def news_category_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of news categories.
+    Invalidates the cached news pages, they show the titles of the categories.
+    """
+    invalidate_cache_version('news')
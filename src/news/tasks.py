@@ -0,0 +1,27 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+
+@shared_task(base=Singleton)
+def start_newsletter(newsletter_id: int) -> int:
+    """
+    Starts or resumes sending a newsletter.
+
+    :return: The number of ranges of deliveries sent by the send_newsletter_chunk tasks.
+    """
+    from news import services
+    from news.models import Newsletter
+
+    return services.start_newsletter(Newsletter.objects.get(pk=newsletter_id))
+
+
+@shared_task(base=Singleton)
+def send_newsletter_chunk(newsletter_id: int, first_id: int, last_id: int) -> int:
+    """
+    Sends a range of deliveries of a newsletter.
+
+    :return: The number of sent emails.
+    """
+    from news import services
+
+    return services.send_newsletter_chunk(newsletter_id, first_id, last_id)
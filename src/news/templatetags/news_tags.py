@@ -1,10 +1,12 @@
 import logging
 from typing import Dict
+from typing import List
 from typing import Union
 
 from django import template
 from django.db.models import QuerySet
 
+from news.models import Category
 from news.services import count_news_from_categories
 from news.services import get_all_categories
 
@@ -27,11 +29,12 @@ def get_categories() -> QuerySet:
 
 
 @register.inclusion_tag('news/list_categories.html')
-def show_categories() -> Dict[str, Union[QuerySet, int]]:
+def show_categories() -> Dict[str, Union[List[Category], int]]:
     """
-    Renders a list of categories with articles and counts the number of news in each category.
+    Renders a list of categories with articles and the number of news in each category, both
+    read from the cache.
 
-    :return: A dictionary containing the categories queryset and a dictionary of category counts.
+    :return: A dictionary containing the list of categories and the number of all news.
     """
     try:
         categories, cnt_news = count_news_from_categories()
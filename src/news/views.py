@@ -1,66 +1,86 @@
 import logging
 
 from django.http import HttpResponseNotFound
+from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView
 from django.views.generic import ListView
 
+from news.services import get_news_cursor
+from news.services import get_news_page
+from online_store.shell import CacheableShellMixin
 from .models import Category
 from .models import News
 
 logger = logging.getLogger(__name__)
 
 
-class NewsView(ListView):
+class NewsPageMixin:
     """
-    Renders a list of published news.
+    Renders a page of published news with keyset pagination: the after parameter of the request
+    is the cursor of the page and news_next is the cursor of the next one, see get_news_page.
     """
     model = News
     template_name = 'news/news.html'
     context_object_name = 'news'
     allow_empty = True
-    paginate_by = 5
+    category = None
+
+    def get_queryset(self):
+        """
+        Gets the cached page of published news.
+
+        :return: The list of news on the page.
+        """
+        after = get_news_cursor(self.request.GET.get('after'))
+        news, self.next_cursor = get_news_page(self.category, after)
+        return news
 
     def get_context_data(self, *, object_list=None, **kwargs):
         """
-        Adds the title to the context data.
+        Adds the cursor of the next page to the context data.
 
         :param object_list: The list of objects.
         :param kwargs: Additional keyword arguments.
         :return: The modified context data.
         """
         context = super().get_context_data(**kwargs)
-        context['title'] = _('News')
+        context['news_next'] = self.next_cursor
         return context
 
-    def get_queryset(self):
+
+class NewsView(CacheableShellMixin, NewsPageMixin, ListView):
+    """
+    Renders a list of published news.
+    """
+
+    def get_context_data(self, *, object_list=None, **kwargs):
         """
-        Filters the queryset to only include published news.
+        Adds the title to the context data.
 
-        :return: The filtered queryset.
+        :param object_list: The list of objects.
+        :param kwargs: Additional keyword arguments.
+        :return: The modified context data.
         """
-        return News.objects.filter(is_published=True).select_related('category')
+        context = super().get_context_data(**kwargs)
+        context['title'] = _('News')
+        return context
 
 
-class NewsCategoryView(ListView):
+class NewsCategoryView(CacheableShellMixin, NewsPageMixin, ListView):
     """
     Renders a list of published news for a given category.
     """
-    model = News
-    template_name = 'news/news.html'
-    context_object_name = 'news'
     slug_url_kwarg = 'slug'
-    allow_empty = True
-    paginate_by = 5
 
     def get_queryset(self):
         """
-        Filters the queryset to only include published news in the specified category.
+        Gets the page of published news in the specified category.
 
-        :return: The filtered queryset.
+        :return: The list of news on the page.
         """
-        return News.objects.filter(category__slug=self.kwargs['slug'],
-                                   is_published=True).select_related('category')
+        self.category = get_object_or_404(Category, slug=self.kwargs['slug'])
+        return super().get_queryset()
 
     def get_context_data(self, *, object_list=None, **kwargs):
         """
@@ -71,7 +91,7 @@ class NewsCategoryView(ListView):
         :return: The modified context data.
         """
         context = super().get_context_data(**kwargs)
-        context['title'] = Category.objects.get(slug=self.kwargs['slug'])
+        context['title'] = self.category
         return context
 
 
@@ -0,0 +1,40 @@
+import asyncio
+from functools import wraps
+from typing import Any
+from typing import Callable
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def with_own_connection(func: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Wraps a blocking function that runs in a thread of the pool, so the database connection
+    of the thread is closed when it is no longer usable, like Django does after each request.
+    """
+    @wraps(func)
+    def inner():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+
+    return inner
+
+
+async def run_concurrently(*funcs: Callable[[], Any]) -> List[Any]:
+    """
+    Runs independent blocking functions, e.g. queries or cache lookups, from an async view.
+
+    The functions run at the same time in the thread pool, unless ASYNC_CONCURRENT_QUERIES is off.
+
+    :param funcs: The functions to run, without arguments.
+    :return: A list of the results in the order of the functions.
+    """
+    if not settings.ASYNC_CONCURRENT_QUERIES:
+        return [await sync_to_async(func)() for func in funcs]
+    return list(await asyncio.gather(
+        *(sync_to_async(with_own_connection(func), thread_sensitive=False)() for func in funcs)))
@@ -0,0 +1,126 @@
+from typing import Dict
+from typing import List
+
+from cachalot.settings import cachalot_settings
+from django.apps import apps
+from django.core.cache import caches
+
+from online_store.cache_stats import CacheCounters
+from online_store.settings import CACHE_TABLE_POLICY
+from online_store.settings import DATABASES
+from online_store.two_tier_cache import TwoTierCache
+
+CACHE_STATS_EVENTS = ('hit', 'miss', 'invalidation')
+
+
+def get_table_policy(table: str) -> str:
+    """
+    Gets the cache policy of a table from the CACHE_TABLE_POLICY setting.
+
+    :param table: The name of the table.
+    :return: 'cachalot', 'read_model' or 'never', tables that are not listed are never cached.
+    """
+    for policy, tables in CACHE_TABLE_POLICY.items():
+        if table in tables:
+            return policy
+    return 'never'
+
+
+def get_tables() -> List[str]:
+    """
+    Gets the names of the tables of all models, including the many-to-many tables.
+
+    :return: A sorted list of table names.
+    """
+    tables = {model._meta.db_table for model in apps.get_models(include_auto_created=True)}
+    return sorted(tables)
+
+
+class TableStats(CacheCounters):
+    """
+    Counts the hits, misses and invalidations of the query cache per table.
+    """
+
+    def __init__(self):
+        super().__init__('cache_table_stats', lambda: caches['default'])
+
+    def get(self) -> Dict[str, Dict[str, object]]:
+        """
+        Gets the shared counters of all tables.
+
+        :return: A dictionary of tables with their policy and the number of each event.
+        """
+        tables = sorted(set(get_tables()).union(*CACHE_TABLE_POLICY.values()))
+        return {table: {'policy': get_table_policy(table), **counts}
+                for table, counts in self.get_counts(tables, CACHE_STATS_EVENTS).items()}
+
+    def reset(self) -> None:
+        """
+        Resets the counters of the process and the shared counters.
+        """
+        super().reset(set(get_tables()).union(*CACHE_TABLE_POLICY.values()), CACHE_STATS_EVENTS)
+
+
+table_stats = TableStats()
+
+
+class CachalotCache(TwoTierCache):
+    """
+    Two-tier cache backend for django-cachalot that counts the hits and misses of the queries
+    per table.
+
+    Cachalot reads a query with a single get_many of the cache keys of its tables followed by
+    the key of the query. The keys of the tables hold the time of their last invalidation,
+    the key of the query holds the time the result was cached and the result.
+
+    The keys of the tables are always read from Redis, so a result kept in the local cache is
+    not used after another process changed one of its tables.
+    """
+    _table_cache_names = None
+
+    @classmethod
+    def get_table_by_cache_name(cls) -> Dict[str, str]:
+        """
+        Maps the cachalot keys of the tables to the table names.
+        """
+        if cls._table_cache_names is None:
+            cls._table_cache_names = {
+                cachalot_settings.CACHALOT_TABLE_KEYGEN(db_alias, table): table
+                for db_alias in DATABASES for table in get_tables()}
+        return cls._table_cache_names
+
+    def is_local_key(self, key: str) -> bool:
+        return key not in self.get_table_by_cache_name() and super().is_local_key(key)
+
+    @staticmethod
+    def is_hit(keys: List[str], data: dict) -> bool:
+        """
+        Checks whether cachalot can use the cached result of the query, like it does itself:
+        the result must be newer than the last invalidation of each of its tables.
+        """
+        if len(data) != len(keys):
+            return False
+        try:
+            timestamp = data[keys[-1]][0]
+            return all(timestamp >= data[key] for key in keys[:-1])
+        except (KeyError, IndexError, TypeError):
+            return False
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        data = super().get_many(keys, version=version)
+
+        table_by_cache_name = self.get_table_by_cache_name()
+        tables = [table_by_cache_name[key] for key in keys[:-1] if key in table_by_cache_name]
+        event = 'hit' if self.is_hit(keys, data) else 'miss'
+        for table in tables:
+            table_stats.record(table, event)
+        return data
+
+
+def cachalot_invalidation(sender, **kwargs) -> None:
+    """
+    Reacts to the invalidation of the cachalot queries of a table.
+    Counts the invalidation.
+    """
+    table_stats.record(sender, 'invalidation')
@@ -0,0 +1,345 @@
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.utils.module_loading import import_string
+from redis.exceptions import ResponseError
+
+from online_store.settings import CACHE_STATS_FLUSH_INTERVAL
+from online_store.two_tier_cache import TwoTierCache
+
+CACHE_KEY_EVENTS = ('hit', 'miss', 'set', 'delete', 'eviction')
+
+_MISSING = object()
+
+
+def get_key_namespace(key: str) -> str:
+    """
+    Gets the namespace of a cache key, the part of the key before the first colon.
+
+    :param key: The cache key, e.g. 'listing:1675:ShopView::en:d41d8'.
+    :return: The namespace of the key, e.g. 'listing'.
+    """
+    return str(key).split(':', 1)[0]
+
+
+class CacheCounters:
+    """
+    Counts events of a cache by name.
+
+    The counters are kept in the process and added to the shared counters in a cache
+    every CACHE_STATS_FLUSH_INTERVAL seconds, so counting does not cost a request to the cache
+    for every event.
+    """
+
+    def __init__(self, prefix: str, get_cache: Callable[[], BaseCache]):
+        """
+        :param prefix: The prefix of the cache keys of the shared counters.
+        :param get_cache: A function that returns the cache of the shared counters.
+        """
+        self.prefix = prefix
+        self._get_cache = get_cache
+        self._counter = Counter()
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def get_cache_name(self, name: str, event: str) -> str:
+        """
+        Builds the cache key of a shared counter.
+
+        :param name: The counted name, e.g. a table or a key namespace.
+        :param event: The counted event, e.g. 'hit'.
+        :return: The cache key of the counter.
+        """
+        return f'{self.prefix}:{name}:{event}'
+
+    def record(self, name: str, event: str, count: int = 1) -> None:
+        """
+        Counts an event.
+
+        :param name: The counted name, e.g. a table or a key namespace.
+        :param event: The counted event, e.g. 'hit'.
+        :param count: The number of events.
+        """
+        with self._lock:
+            self._counter[name, event] += count
+            flush = time.monotonic() - self._flushed_at >= CACHE_STATS_FLUSH_INTERVAL
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Adds the counters of the process to the shared counters and remembers the counted names.
+        """
+        with self._lock:
+            counter, self._counter = self._counter, Counter()
+            self._flushed_at = time.monotonic()
+        if not counter:
+            return
+
+        cache = self._get_cache()
+        for (name, event), count in counter.items():
+            cache_name = self.get_cache_name(name, event)
+            if not cache.add(cache_name, count, None):
+                cache.incr(cache_name, count)
+
+        # Names may be lost when two processes flush at once, they are added back on the next flush
+        names = set(cache.get(f'{self.prefix}:names') or ())
+        new_names = {name for name, event in counter}
+        if not new_names <= names:
+            cache.set(f'{self.prefix}:names', sorted(names | new_names), None)
+
+    def get_names(self) -> List[str]:
+        """
+        Gets the names counted by all processes.
+
+        :return: A sorted list of names.
+        """
+        self.flush()
+        return self._get_cache().get(f'{self.prefix}:names') or []
+
+    def get_counts(self, names: Iterable[str], events: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Gets the shared counters.
+
+        :param names: The counted names.
+        :param events: The counted events.
+        :return: A dictionary of names with the number of each event.
+        """
+        self.flush()
+        names, events = list(names), list(events)
+        counters = self._get_cache().get_many(
+            [self.get_cache_name(name, event) for name in names for event in events])
+        return {name: {event: counters.get(self.get_cache_name(name, event), 0)
+                       for event in events}
+                for name in names}
+
+    def reset(self, names: Iterable[str], events: Iterable[str]) -> None:
+        """
+        Resets the counters of the process and the shared counters.
+
+        :param names: The counted names.
+        :param events: The counted events.
+        """
+        with self._lock:
+            self._counter.clear()
+        cache = self._get_cache()
+        cache.delete_many([self.get_cache_name(name, event) for name in names for event in events])
+        cache.delete(f'{self.prefix}:names')
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Cache backend that wraps the backend given in WRAPPED_BACKEND and counts hits, misses, sets,
+    deletes and evictions per key namespace.
+
+    The counters are stored in the wrapped cache, so they are shared by all processes.
+    Evictions are counted per namespace for LocMemCache only, Redis evicts keys on the server,
+    its evictions are reported in get_backend_info. Lookups served by the local tier of
+    TwoTierCache are counted as hits too.
+
+    Example:
+        'default': {
+            'BACKEND': 'online_store.cache_stats.InstrumentedCache',
+            'WRAPPED_BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://redis:6379',
+        }
+    """
+
+    def __init__(self, location: str, params: dict):
+        params = params.copy()
+        backend = params.pop('WRAPPED_BACKEND')
+        super().__init__(params)
+        self._cache = import_string(backend)(location, params)
+        self.counters = CacheCounters('cache_stats', lambda: self._cache)
+
+    def _record(self, key: str, event: str, count: int = 1) -> None:
+        self.counters.record(get_key_namespace(key), event, count)
+
+    def _record_evictions(self) -> None:
+        """
+        Counts the keys LocMemCache is going to cull to make room for a new key.
+        """
+        if not isinstance(self._cache, LocMemCache) or self._cache._cull_frequency == 0:
+            return
+        if len(self._cache._cache) < self._cache._max_entries:
+            return
+        prefix_length = len(self._cache.make_key(''))
+        count = len(self._cache._cache) // self._cache._cull_frequency
+        for _x, key in zip(range(count), reversed(self._cache._cache)):
+            self._record(key[prefix_length:], 'eviction')
+
+    def make_key(self, key, version=None):
+        return self._cache.make_key(key, version=version)
+
+    def validate_key(self, key):
+        return self._cache.validate_key(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._record_evictions()
+        added = self._cache.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._record(key, 'set')
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self._cache.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(key, 'miss')
+            return default
+        self._record(key, 'hit')
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._record_evictions()
+        self._cache.set(key, value, timeout=timeout, version=version)
+        self._record(key, 'set')
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self._cache.delete(key, version=version)
+        self._record(key, 'delete')
+        return deleted
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        data = self._cache.get_many(keys, version=version)
+        for key in keys:
+            self._record(key, 'hit' if key in data else 'miss')
+        return data
+
+    def has_key(self, key, version=None):
+        return self._cache.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            value = self._cache.incr(key, delta=delta, version=version)
+        except ValueError:
+            self._record(key, 'miss')
+            raise
+        self._record(key, 'set')
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._cache.set_many(data, timeout=timeout, version=version)
+        for key in data:
+            self._record(key, 'set')
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._cache.delete_many(keys, version=version)
+        for key in keys:
+            self._record(key, 'delete')
+
+    def clear(self):
+        self.counters.flush()
+        return self._cache.clear()
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
+
+    def _get_storage(self) -> BaseCache:
+        """
+        Gets the cache that stores the keys, the shared cache of a TwoTierCache.
+        """
+        if isinstance(self._cache, TwoTierCache):
+            return self._cache.remote
+        return self._cache
+
+    def get_backend_info(self) -> Dict[str, Any]:
+        """
+        Gets the size, the memory and the evictions of the wrapped cache.
+
+        :return: A dictionary of the backend information.
+        """
+        storage = self._get_storage()
+        info = {'backend': f'{type(self._cache).__module__}.{type(self._cache).__name__}'}
+        if isinstance(self._cache, TwoTierCache):
+            info.update(self._cache.get_local_info())
+        if isinstance(storage, RedisCache):
+            client = storage._cache.get_client()
+            server = client.info()
+            info.update({
+                'keys': client.dbsize(),
+                'used_memory': server.get('used_memory'),
+                'evicted_keys': server.get('evicted_keys'),
+                'expired_keys': server.get('expired_keys'),
+            })
+        elif isinstance(storage, LocMemCache):
+            info.update({
+                'keys': len(storage._cache),
+                'max_entries': storage._max_entries,
+            })
+        return info
+
+    def get_keys_by_namespace(self) -> Dict[str, Dict[str, int]]:
+        """
+        Counts the keys of the wrapped cache and the memory they use per namespace.
+        Scans all the keys, so it is only meant for occasional reports.
+
+        :return: A dictionary of namespaces with the number of keys and their size in bytes.
+        """
+        storage = self._get_storage()
+        namespaces = defaultdict(lambda: {'keys': 0, 'memory': 0})
+        prefix = storage.make_key('')
+
+        if isinstance(storage, RedisCache):
+            client = storage._cache.get_client()
+            for key in client.scan_iter(match=f'{prefix}*', count=1000):
+                namespace = namespaces[get_key_namespace(key.decode()[len(prefix):])]
+                namespace['keys'] += 1
+                try:
+                    namespace['memory'] += client.memory_usage(key) or 0
+                except ResponseError:
+                    # MEMORY is disabled on some hosted Redis, count the size of the value
+                    namespace['memory'] += client.strlen(key)
+        elif isinstance(storage, LocMemCache):
+            with storage._lock:
+                items = list(storage._cache.items())
+            for key, value in items:
+                namespace = namespaces[get_key_namespace(key[len(prefix):])]
+                namespace['keys'] += 1
+                namespace['memory'] += len(value)
+        return dict(namespaces)
+
+    def get_stats(self, keys: bool = False) -> Dict[str, Any]:
+        """
+        Gets the counters of all namespaces and the information about the wrapped cache.
+
+        :param keys: Whether to scan the keys to count them and their memory per namespace.
+        :return: A dictionary with the backend information and the counters per namespace.
+        """
+        namespaces = self.counters.get_counts(self.counters.get_names(), CACHE_KEY_EVENTS)
+        for counts in namespaces.values():
+            lookups = counts['hit'] + counts['miss']
+            counts['hit_rate'] = round(counts['hit'] / lookups, 3) if lookups else None
+
+        if keys:
+            for namespace, usage in self.get_keys_by_namespace().items():
+                namespaces.setdefault(namespace,
+                                      {**dict.fromkeys(CACHE_KEY_EVENTS, 0), 'hit_rate': None})
+                namespaces[namespace].update(usage)
+
+        return {**self.get_backend_info(), 'namespaces': namespaces}
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters of all namespaces.
+        """
+        self.counters.reset(self.counters.get_names(), CACHE_KEY_EVENTS)
@@ -0,0 +1,26 @@
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse
+from django.http import HttpResponse
+
+
+def get_protected_file_response(path: str, content_type: str) -> HttpResponse:
+    """
+    Sends a media file that is not public, after the view has checked the access to it.
+
+    Behind nginx the response only carries X-Accel-Redirect to the internal location of the file
+    under PROTECTED_MEDIA_URL, and nginx sends the file itself, so no worker is busy reading it.
+    Without nginx, in the development, Django streams the file.
+
+    :param path: The path of the file under MEDIA_ROOT.
+    :param content_type: The content type of the response, nginx keeps it.
+    :return: The response.
+    """
+    if not settings.SERVE_FILES_WITH_NGINX:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+    name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = quote(f'{settings.PROTECTED_MEDIA_URL}{name}')
+    return response
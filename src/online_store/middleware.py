@@ -1,52 +1,82 @@
 import logging
 
 from django.contrib import messages
+from django.http import Http404
 from django.http import HttpResponseServerError
+from django.utils.deprecation import MiddlewareMixin
 from django.utils.translation import gettext_lazy as _
 
+from online_store.settings import AUTHENTICATED_COOKIE_NAME
 from online_store.settings import DEBUG
+from online_store.settings import SESSION_COOKIE_AGE
+from online_store.shell import get_shell_response
+from online_store.shell import is_shell_request
 
 logger = logging.getLogger(__name__)
 
 
-class SessionAuthenticationMiddleware:
+class SessionAuthenticationMiddleware(MiddlewareMixin):
     """
     Middleware that adds a 'user_authenticated' key to the request session.
 
     If the user is authenticated, the 'user_authenticated' key is set to the
     user's email address. If the user is not authenticated, the 'user_authenticated'
     key is set to the session key.
-    """
 
-    def __init__(self, get_response):
-        self._get_response = get_response
+    The session is not touched by the shells shared by the anonymous visitors, so they do not
+    create a session or set a cookie, see CacheableShellMiddleware.
+
+    MiddlewareMixin makes it work under both WSGI and ASGI, so async views are not switched
+    to a thread.
+    """
 
-    def __call__(self, request):
+    def process_request(self, request):
         if request.user.is_authenticated:
             request.session['user_authenticated'] = request.user.email
-        else:
+        elif not getattr(request, 'cacheable_shell', False):
             request.session['user_authenticated'] = request.session.session_key
-        response = self._get_response(request)
+
+
+class CacheableShellMiddleware(MiddlewareMixin):
+    """
+    Middleware that serves the catalog pages to the anonymous visitors as shells shared by all of
+    them, see CacheableShellMixin.
+
+    It sets request.cacheable_shell, and adds the ETag and the public Cache-Control headers
+    to the shells, so nginx and the browsers can cache them. It also keeps the cookie that tells
+    nginx the visitor is signed in, such visitors are never served the cached shells.
+    """
+
+    def process_request(self, request):
+        request.cacheable_shell = is_shell_request(request)
+
+    def process_response(self, request, response):
+        if getattr(request, 'cacheable_shell', False):
+            response = get_shell_response(request, response)
+
+        user = getattr(request, 'user', None)
+        authenticated = user is not None and user.is_authenticated
+        if authenticated and AUTHENTICATED_COOKIE_NAME not in request.COOKIES:
+            response.set_cookie(AUTHENTICATED_COOKIE_NAME, '1', max_age=SESSION_COOKIE_AGE,
+                                secure=True, httponly=True, samesite='Lax')
+        elif not authenticated and AUTHENTICATED_COOKIE_NAME in request.COOKIES:
+            response.delete_cookie(AUTHENTICATED_COOKIE_NAME, samesite='Lax')
         return response
 
 
-class ExceptionLoggingMiddleware:
+class ExceptionLoggingMiddleware(MiddlewareMixin):
     """
     Middleware that checks and logs exceptions at the top level.
 
     If the DEBUG flag is set to True, this middleware simply logs the exception
     and displays an error message to the user. If the DEBUG flag is set to False,
     this middleware logs the exception and returns a 500 Internal Server Error
-    response to the user.
+    response to the user. Http404 is left to handler404.
     """
 
-    def __init__(self, get_response):
-        self._get_response = get_response
-
-    def __call__(self, request):
-        return self._get_response(request)
-
     def process_exception(self, request, exception):
+        if isinstance(exception, Http404):
+            return None
         logger.error(str(exception) + ' : ' + str(request.user.is_authenticated))
         messages.error(request, _(
             'An error occurred while executing the request. Try again later'))
@@ -0,0 +1,53 @@
+from typing import Optional
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from online_store.settings import ESTIMATED_COUNT_THRESHOLD
+
+
+def get_estimated_count(queryset: QuerySet) -> Optional[int]:
+    """
+    Gets the number of rows of an unfiltered queryset from the table statistics of the database,
+    without scanning the table like COUNT(*) does on MySQL and PostgreSQL.
+
+    :param queryset: The queryset to count.
+    :return: The estimated number of rows, or None if the queryset is filtered or the database
+             has no statistics.
+    """
+    if not isinstance(queryset, QuerySet) or queryset.query.has_filters() or \
+            queryset.query.distinct:
+        return None
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                           'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large tables that estimates the number of rows of an unfiltered queryset.
+
+    The estimate is used above ESTIMATED_COUNT_THRESHOLD rows, where it is close enough for the
+    page links. Smaller tables and filtered querysets, which should use an index, are counted.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        estimated_count = get_estimated_count(self.object_list)
+        if estimated_count is not None and estimated_count >= ESTIMATED_COUNT_THRESHOLD:
+            return estimated_count
+        return super().count
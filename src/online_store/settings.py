@@ -4,10 +4,16 @@ from pathlib import Path
 
 from django.utils.translation import gettext_lazy as _
 
+from config import ASYNC_QUERIES
+from config import CACHE_BACKEND
+from config import CATALOG_FEED_KEYS
 from config import DATABASE_PASSWORD, DATABASE_NAME, DATABASE_HOST, DATABASE_PORT, DATABASE_USER
+from config import EMAIL_DELIVERY
 from config import EMAIL_HOST_PASSWORD
 from config import EMAIL_HOST_USER
+from config import FILE_DELIVERY
 from config import SECRET_KEY
+from config import SERVER
 from config import SERVER_EMAIL
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -15,6 +21,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
+SESSION_COOKIE_AGE = 60 * 60 * 24 * 14
 CSRF_COOKIE_SECURE = True
 
 SECRET_KEY = SECRET_KEY
@@ -34,7 +41,6 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'django_filters',
-    'debug_toolbar',
     'cachalot',
     'ckeditor',
     'mptt',
@@ -47,6 +53,8 @@ INSTALLED_APPS = [
     'users',
     'orders',
     'news',
+    'outbox',
+    'stock',
 ]
 
 MIDDLEWARE = [
@@ -58,13 +66,27 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'online_store.middleware.CacheableShellMiddleware',
     'online_store.middleware.SessionAuthenticationMiddleware',
     'online_store.middleware.ExceptionLoggingMiddleware'
 ]
 
+# The debug toolbar middleware is sync only, it would make every request under ASGI
+# switch to a thread
+if DEBUG:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('cachalot'), 'debug_toolbar')
+    MIDDLEWARE.insert(MIDDLEWARE.index('online_store.middleware.SessionAuthenticationMiddleware'),
+                      'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'online_store.urls'
 
+# SERVER=asgi serves the hot read paths with the async views under uvicorn workers
+ASYNC_VIEWS = SERVER == 'asgi'
+# Blocking queries of the async views run concurrently in the thread pool, each with its own
+# database connection. ASYNC_QUERIES=serial runs them one by one in the thread of the request,
+# like the tests do to see the data of the test transaction.
+ASYNC_CONCURRENT_QUERIES = ASYNC_QUERIES == 'concurrent'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -148,8 +170,100 @@ MEDIA_URL = '/media/'
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_ROOT = '/var/www/media'
 
+# FILE_DELIVERY=nginx leaves the static and media files to nginx: the collected static files get
+# hashed names and compressed copies for the far-future cache headers, and the protected media
+# files are sent with X-Accel-Redirect. FILE_DELIVERY=django serves them from Django, for the
+# development only.
+SERVE_FILES_WITH_NGINX = FILE_DELIVERY == 'nginx'
+if SERVE_FILES_WITH_NGINX:
+    STATICFILES_STORAGE = 'online_store.storage.CompressedManifestStaticFilesStorage'
+# The internal location of nginx that sends the protected media files, e.g. the catalog feeds
+PROTECTED_MEDIA_URL = '/protected/'
+
 EMPTY_IMAGE = '/media/images/empty/empty.png'
 
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 0.05
+
+REVIEWS_PAGINATE_BY = 10
+REVIEWS_CACHE_TIMEOUT = 60 * 60
+
+BANNER_REGISTRY_CACHE_TIMEOUT = 60 * 60
+
+NEWS_PAGINATE_BY = 5
+# The news pages and counts are invalidated by the signals, the timeout only limits how long
+# a change made by a queryset update, which sends no signals, stays unseen
+NEWS_CACHE_TIMEOUT = 60 * 60
+
+PRODUCT_RAIL_LIMIT = 8
+PRODUCT_RAIL_CACHE_TIMEOUT = 60 * 60
+
+LISTING_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a list response of the product API is cached, it is invalidated by product changes
+PRODUCT_API_CACHE_TIMEOUT = 60 * 60
+# Products a client may request at once with ?ids=
+PRODUCT_API_MAX_IDS = 100
+
+# The popularity of a product halves every SALES_RANK_HALF_LIFE days without sales,
+# the scores are stored relative to SALES_RANK_EPOCH, 2023-01-01 UTC, on a log2 scale,
+# see get_popularity_log_weight
+SALES_RANK_HALF_LIFE = 14
+SALES_RANK_EPOCH = 1672531200
+
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 10
+
+# Orders recalculated by each pair of UPDATE statements in bulk recalculations
+ORDER_PRICING_BATCH_SIZE = 1000
+# Orders read by each query of the CSV export
+ORDER_EXPORT_BATCH_SIZE = 2000
+
+# Admin changelists with EstimatedCountPaginator count tables up to this number of rows
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Seconds the units in a basket are held for the checkout
+STOCK_RESERVATION_TIMEOUT = 60 * 15
+
+# Rows read by each query of a sales report
+SALES_REPORT_CHUNK_SIZE = 2000
+# Days before today checked for changed orders by the hourly sales rollup
+SALES_ROLLUP_DAYS = 7
+
+# Seconds a looked up promo code is cached, unknown codes are cached too
+PROMO_CODE_CACHE_TIMEOUT = 60 * 10
+# Promo codes inserted by each statement of a bulk generation
+PROMO_CODE_BATCH_SIZE = 1000
+
+# The formats of the catalog feeds, the first one by default
+CATALOG_FEED_FORMATS = ('jsonl', 'xml')
+# Products read by each query of a catalog feed
+CATALOG_FEED_BATCH_SIZE = 500
+# The gzipped snapshots of the full catalog feeds written by write_catalog_feeds
+CATALOG_FEED_ROOT = os.path.join(MEDIA_ROOT, 'feeds')
+# The API keys of the partners, comma separated in CATALOG_FEED_KEYS, the staff needs no key
+CATALOG_FEED_API_KEYS = [key.strip() for key in CATALOG_FEED_KEYS.split(',') if key.strip()]
+# Feeds read from the database, delta feeds and feeds without a snapshot, a partner may
+# download per CATALOG_FEED_RATE_PERIOD seconds
+CATALOG_FEED_RATE_LIMIT = 12
+CATALOG_FEED_RATE_PERIOD = 60 * 60
+
+# Seconds nginx and the browsers cache the catalog pages shared by the anonymous visitors
+SHELL_CACHE_TIMEOUT = 60
+# The cookie of the signed in visitors, nginx never answers them with the cached pages
+AUTHENTICATED_COOKIE_NAME = 'authenticated'
+
+# The bounding boxes of the derivatives of the uploaded images, smallest first
+THUMBNAIL_SIZES = {'card': (400, 400), 'detail': (800, 800), 'zoom': (1600, 1600)}
+# The quality of the JPEG and WebP derivatives
+THUMBNAIL_QUALITY = 85
+# Seconds the names of the generated derivatives of an image are cached, the generation
+# replaces them
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+# Seconds the derivatives found in the storage are cached while some of them are missing
+THUMBNAIL_MISSING_CACHE_TIMEOUT = 60
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 INTERNAL_IPS = ['127.0.0.1']
@@ -158,13 +272,42 @@ CKEDITOR_UPLOAD_PATH = "uploads/"
 
 LOGIN_URL = 'login'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Emails are stored in the outbox and sent by a Celery task with OUTBOX_DELIVERY_BACKEND
+EMAIL_BACKEND = 'outbox.backends.OutboxEmailBackend'
 EMAIL_HOST = 'smtp.ukr.net'
 EMAIL_PORT = 465
 EMAIL_HOST_USER = EMAIL_HOST_USER
 EMAIL_HOST_PASSWORD = EMAIL_HOST_PASSWORD
 EMAIL_USE_TLS = False
 EMAIL_USE_SSL = True
+EMAIL_TIMEOUT = 10
+# EMAIL_DELIVERY=locmem or file sends the emails offline, file writes them to EMAIL_FILE_PATH
+OUTBOX_DELIVERY_BACKENDS = {
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+}
+OUTBOX_DELIVERY_BACKEND = OUTBOX_DELIVERY_BACKENDS[
+    'locmem' if 'test' in sys.argv else EMAIL_DELIVERY]
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'logs', 'emails')
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled after each failed attempt
+OUTBOX_RETRY_BACKOFF = 60
+# Seconds after which an email taken by a worker that stopped before marking it is sent again
+OUTBOX_SENDING_TIMEOUT = 600
+
+# The address of the site in the links of the emails
+SITE_URL = 'https://multishop.pp.ua'
+# Subscribers per Celery task, the tasks run in parallel on the workers
+NEWSLETTER_CHUNK_SIZE = 500
+# Deliveries locked and updated at once by a task
+NEWSLETTER_BATCH_SIZE = 50
+# Messages per second over all workers, most SMTP providers throttle bulk senders
+NEWSLETTER_RATE_LIMIT = 20
+NEWSLETTER_MAX_ATTEMPTS = 3
+# Seconds after which a delivery taken by a worker that stopped before marking it is resumed
+NEWSLETTER_SENDING_TIMEOUT = 600
 SERVER_EMAIL = SERVER_EMAIL
 ADMINS = [
     ('Rocky', 'rocky01396@gmail.com'),
@@ -240,12 +383,124 @@ REST_FRAMEWORK = {
 
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 
+CELERY_BEAT_SCHEDULE = {
+    'warm-product-rails': {
+        'task': 'shop.tasks.warm_product_rails',
+        'schedule': 60 * 15,
+    },
+    'send-outbox': {
+        'task': 'outbox.tasks.send_outbox',
+        'schedule': 60,
+    },
+    'release-stock-reservations': {
+        'task': 'stock.tasks.release_expired_reservations',
+        'schedule': 60,
+    },
+    'update-daily-sales': {
+        'task': 'orders.tasks.update_daily_sales',
+        'schedule': 60 * 60,
+    },
+    'write-catalog-feeds': {
+        'task': 'shop.tasks.write_catalog_feeds',
+        'schedule': 60 * 60,
+    },
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'BACKEND': 'online_store.cache_stats.InstrumentedCache',
+        'WRAPPED_BACKEND': 'online_store.two_tier_cache.TwoTierCache',
+        'LOCATION': 'redis://redis:6379',
+        'LOCAL_MAX_ENTRIES': 1000,
+        'LOCAL_TIMEOUT': 5,
+        # The versions the keys of the cached values are built with are read from Redis only
+        'REMOTE_ONLY_KEYS': ['*_version', 'product_stamp'],
+        'OPTIONS': {
+            'db': '1',
+        }
+    },
+    'cachalot': {
+        'BACKEND': 'online_store.cache_policy.CachalotCache',
         'LOCATION': 'redis://redis:6379',
+        'LOCAL_MAX_ENTRIES': 5000,
+        'LOCAL_TIMEOUT': 5,
+        'INVALIDATION_CHANNEL': 'cachalot_invalidation',
         'OPTIONS': {
             'db': '1',
         }
+    },
+}
+
+# CACHE_BACKEND=locmem keeps the caches in the process for local development without Redis
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'online_store.cache_stats.InstrumentedCache',
+            'WRAPPED_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'default',
+        },
+        'cachalot': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cachalot',
+        },
     }
+
+# How the queries to each table are cached:
+#   cachalot - rarely written tables, the queries are cached by django-cachalot;
+#   read_model - hot catalog tables, read through the explicit caches of the services
+#                (product rails, listings, banners, reviews) that are invalidated by signals;
+#   never - tables written on nearly every request, the queries are never cached.
+CACHE_TABLE_POLICY = {
+    'cachalot': (
+        'shop_category',
+        'shop_tag',
+        'shop_country',
+        'shop_manufacturer',
+        'shop_color',
+        'shop_size',
+        'shop_delivery',
+        'shop_banner',
+        'shop_currency',
+        'news_category',
+        'news_news',
+        'orders_status',
+        'orders_paymentmethod',
+        'django_content_type',
+    ),
+    'read_model': (
+        'shop_product',
+        'shop_product_tags',
+        'shop_attributecolor',
+        'shop_attributesize',
+        'shop_attributecolorimage',
+        'shop_defaultvarieties',
+        'shop_reviews',
+        'shop_ratinghistogram',
+    ),
+    'never': (
+        'basket_productinbasket',
+        'favorite_favorite',
+        'django_session',
+        'users_user',
+        'users_emailfornews',
+        'orders_order',
+        'orders_goodsintheorder',
+        'orders_promocode',
+        'django_admin_log',
+        'outbox_outgoingemail',
+        'news_newsletter',
+        'stock_stockreservation',
+        'orders_salesday',
+        'orders_productsales',
+        'news_newsletterdelivery',
+    ),
 }
+CACHE_STATS_FLUSH_INTERVAL = 10
+
+CACHALOT_CACHE = 'cachalot'
+CACHALOT_ONLY_CACHABLE_TABLES = CACHE_TABLE_POLICY['cachalot']
+CACHALOT_UNCACHABLE_TABLES = ('django_migrations',) + CACHE_TABLE_POLICY['read_model'] + \
+    CACHE_TABLE_POLICY['never']
+
+# CachalotCache only counts the hits and misses of TwoTierCache
+SILENCED_SYSTEM_CHECKS = ['cachalot.W001']
@@ -0,0 +1,50 @@
+from django.contrib.messages import get_messages
+from django.urls import Resolver404
+from django.urls import resolve
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+from django.utils.cache import set_response_etag
+
+from online_store.settings import SHELL_CACHE_TIMEOUT
+
+
+class CacheableShellMixin:
+    """
+    Marks a view whose pages are the same for all the anonymous visitors, so they can be cached
+    by nginx and the browsers, see CacheableShellMiddleware.
+
+    The templates of a shell have no CSRF token and no basket or favorite state, the script of
+    inc/_user_state.html fills them in from UserStateView.
+    """
+    cacheable_shell = True
+
+
+def is_shell_request(request) -> bool:
+    """
+    Checks whether a request is answered with the shell shared by the anonymous visitors: a GET
+    request of an anonymous visitor, without messages to show, to a CacheableShellMixin view.
+    """
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    try:
+        view = resolve(request.path_info).func
+    except Resolver404:
+        return False
+    return getattr(getattr(view, 'view_class', None), 'cacheable_shell', False) and \
+        not len(get_messages(request))
+
+
+def get_shell_response(request, response):
+    """
+    Adds the headers of a shared cache to a shell page and answers a conditional request for
+    the same page with 304 Not Modified.
+
+    :param request: The request of the shell.
+    :param response: The rendered page.
+    :return: The page, or the 304 response.
+    """
+    if response.status_code != 200 or response.streaming:
+        return response
+    patch_cache_control(response, public=True, max_age=SHELL_CACHE_TIMEOUT)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
@@ -0,0 +1,64 @@
+import gzip
+import os
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, without it only the gzipped copies are written
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Collects the static files with the hash of their content in their names, so nginx can send
+    them with far-future cache headers, and writes compressed copies of the text files beside
+    them: name.gz for gzip_static and, if brotli is installed, name.br for brotli_static.
+
+    The files put in STATIC_ROOT by hand are not collected, they keep their names and get short
+    cache headers.
+    """
+    compressed_extensions = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html',
+                             '.ico', '.eot', '.otf', '.ttf')
+    # Smaller files are not worth the decompression
+    min_compressed_size = 256
+
+    def stored_name(self, name: str) -> str:
+        if self.hash_key(urlsplit(unquote(name)).path.strip()) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        compressed = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and hashed_name and not isinstance(processed, Exception) and \
+                    hashed_name not in compressed and hashed_name.endswith(
+                        self.compressed_extensions):
+                compressed.add(hashed_name)
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name: str) -> None:
+        """
+        Writes the compressed copies of a collected file, unless they are not smaller.
+
+        :param name: The name of the collected file.
+        """
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            content = file.read()
+        if len(content) < self.min_compressed_size:
+            return
+
+        copies = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            copies['.br'] = brotli.compress(content)
+        for extension, compressed_content in copies.items():
+            if len(compressed_content) >= len(content):
+                continue
+            with open(f'{path}{extension}', 'wb') as file:
+                file.write(compressed_content)
+            os.utime(f'{path}{extension}', (os.path.getatime(path), os.path.getmtime(path)))
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+from typing import List
+from urllib.parse import unquote
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.core.files.storage import default_storage
+from PIL import Image
+from PIL import ImageOps
+
+from online_store.settings import THUMBNAIL_CACHE_TIMEOUT
+from online_store.settings import THUMBNAIL_MISSING_CACHE_TIMEOUT
+from online_store.settings import THUMBNAIL_QUALITY
+from online_store.settings import THUMBNAIL_SIZES
+
+logger = logging.getLogger(__name__)
+
+# The formats of the originals that get a derivative in the same format besides the WebP one
+THUMBNAIL_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def get_thumbnail_name(name: str, size: str, webp: bool = False) -> str:
+    """
+    Gets the name of a derivative of an image, stored beside the original.
+
+    Example: photo/2023/01/01/bag.jpg gives photo/2023/01/01/bag.card.jpg
+    and photo/2023/01/01/bag.card.webp.
+
+    :param name: The name of the original image in the storage.
+    :param size: The size of the derivative, one of THUMBNAIL_SIZES.
+    :param webp: Whether to get the WebP derivative.
+    :return: The name of the derivative.
+    """
+    root, extension = os.path.splitext(name)
+    return f'{root}.{size}{".webp" if webp else extension}'
+
+
+def is_thumbnail_name(name: str) -> bool:
+    """
+    Checks whether a file of the storage is a derivative of another image.
+    """
+    root = os.path.splitext(name)[0]
+    return os.path.splitext(root)[1][1:] in THUMBNAIL_SIZES
+
+
+def has_thumbnails(name: str, storage: Storage = default_storage) -> bool:
+    """
+    Checks whether the derivatives of an image were generated, the WebP derivative of the
+    largest size is saved last.
+    """
+    return storage.exists(get_thumbnail_name(name, list(THUMBNAIL_SIZES)[-1], webp=True))
+
+
+def get_thumbnails_cache_name(name: str) -> str:
+    """
+    Builds the cache key of the names of the derivatives of an image.
+    """
+    return f'thumbnails:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def record_thumbnails(name: str, thumbnail_names: List[str]) -> None:
+    """
+    Caches the names of the derivatives of an image once they are generated, see get_thumbnails.
+
+    :param name: The name of the original image in the storage.
+    :param thumbnail_names: The names of the saved derivatives.
+    """
+    cache.set(get_thumbnails_cache_name(name), list(thumbnail_names), THUMBNAIL_CACHE_TIMEOUT)
+
+
+def get_thumbnails(name: str, storage: Storage = default_storage) -> List[str]:
+    """
+    Gets the names of the generated derivatives of an image from the cache. They are recorded
+    when the derivatives are generated, the storage is only checked when they are not cached.
+    The names found in the storage are cached for THUMBNAIL_MISSING_CACHE_TIMEOUT seconds only
+    while some derivatives are missing, the generation records the full set.
+
+    :param name: The name of the original image in the storage.
+    :param storage: The storage of the image.
+    :return: The names of the derivatives, empty while they are being generated.
+    """
+    thumbnail_names = cache.get(get_thumbnails_cache_name(name))
+    if thumbnail_names is None:
+        thumbnail_names = [get_thumbnail_name(name, size, webp)
+                           for size in THUMBNAIL_SIZES for webp in (False, True)]
+        thumbnail_names = [thumbnail_name for thumbnail_name in thumbnail_names
+                           if storage.exists(thumbnail_name)]
+        if get_thumbnail_name(name, list(THUMBNAIL_SIZES)[-1], webp=True) in thumbnail_names:
+            record_thumbnails(name, thumbnail_names)
+        else:
+            cache.set(get_thumbnails_cache_name(name), thumbnail_names,
+                      THUMBNAIL_MISSING_CACHE_TIMEOUT)
+    return thumbnail_names
+
+
+def get_thumbnail_url(url: str, size: str, webp: bool = False) -> str:
+    """
+    Gets the URL of a derivative of an image of the media storage from the URL of the original.
+
+    :param url: The URL of the original image.
+    :param size: The size of the derivative, one of THUMBNAIL_SIZES.
+    :param webp: Whether to get the WebP derivative.
+    :return: The URL of the derivative, or the URL of the original if the image is not stored
+             in the media storage or its derivative has not been generated yet.
+    """
+    base_url = default_storage.base_url
+    if not url or not url.startswith(base_url):
+        return url
+    name = unquote(url[len(base_url):])
+    thumbnail_name = get_thumbnail_name(name, size, webp)
+    if thumbnail_name not in get_thumbnails(name):
+        return url
+    return default_storage.url(thumbnail_name)
+
+
+def get_thumbnail_srcset(url: str, size: str, webp: bool = False) -> str:
+    """
+    Gets the srcset of an image with the derivative of the size for the standard screens and the
+    derivative of the next size, twice as large, for the high density screens.
+
+    :param url: The URL of the original image.
+    :param size: The size of the derivatives, one of THUMBNAIL_SIZES.
+    :param webp: Whether to use the WebP derivatives.
+    :return: The srcset, empty if the derivatives have not been generated yet.
+    """
+    sizes = list(THUMBNAIL_SIZES)
+    candidates = []
+    for density, name in enumerate(sizes[sizes.index(size):][:2], start=1):
+        thumbnail_url = get_thumbnail_url(url, name, webp)
+        if thumbnail_url == url:
+            break
+        candidates.append(f'{thumbnail_url} {density}x')
+    return ', '.join(candidates)
+
+
+def make_thumbnails(name: str, storage: Storage = default_storage) -> List[str]:
+    """
+    Generates the derivatives of an image for each of THUMBNAIL_SIZES, in the format of the
+    original and in WebP, and saves them beside the original, replacing the old ones.
+
+    :param name: The name of the original image in the storage.
+    :param storage: The storage of the image.
+    :return: The names of the saved derivatives, empty if the file is not a readable image.
+    """
+    try:
+        with storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+    except OSError as error:
+        logger.warning('Thumbnails of %s are not generated: %s', name, error)
+        return []
+
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    names = []
+    for size, dimensions in THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(dimensions, Image.LANCZOS)
+        for webp in (False, True):
+            output_format = 'WEBP' if webp else image_format
+            if output_format not in THUMBNAIL_FORMATS:
+                continue
+            picture = thumbnail
+            if output_format == 'JPEG' and picture.mode != 'RGB':
+                picture = picture.convert('RGB')
+            elif output_format == 'WEBP' and picture.mode not in ('RGB', 'RGBA'):
+                picture = picture.convert('RGBA')
+            buffer = BytesIO()
+            picture.save(buffer, output_format, quality=THUMBNAIL_QUALITY, optimize=True)
+
+            thumbnail_name = get_thumbnail_name(name, size, webp)
+            if storage.exists(thumbnail_name):
+                storage.delete(thumbnail_name)
+            names.append(storage.save(thumbnail_name, ContentFile(buffer.getvalue())))
+    return names
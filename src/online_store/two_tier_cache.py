@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from fnmatch import translate
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# The local caches and their invalidation listeners are shared by the threads of a process
+_local_caches = {}
+_listeners = {}
+_registry_lock = threading.Lock()
+_host_id = uuid.uuid4().hex
+
+
+def get_process_id() -> str:
+    """
+    Gets an identifier of the process that differs between hosts and forked processes.
+    """
+    return f'{_host_id}:{os.getpid()}'
+
+
+class LocalCache:
+    """
+    A bounded LRU of pickled values with a time to live, kept in the memory of the process.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Gets a pickled value, or None if it is missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            pickled, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return pickled
+
+    def set(self, key: str, pickled: bytes, timeout: float) -> None:
+        """
+        Stores a pickled value and removes the least recently used values above max_entries.
+        """
+        with self._lock:
+            self._data[key] = (pickled, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Removes the keys changed by other processes from the local cache.
+
+    Listens to the Redis channel the processes publish the changed keys to. While the connection
+    is lost, the local cache is cleared, the values of the local cache expire anyway after
+    LOCAL_TIMEOUT seconds.
+    """
+
+    def __init__(self, cache: 'TwoTierCache'):
+        super().__init__(name=f'cache-invalidation-{cache.channel}', daemon=True)
+        self.cache = cache
+
+    def run(self):
+        while True:
+            try:
+                pubsub = self.cache.get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.cache.channel)
+                # Changes published before the subscription are lost
+                self.cache.local.clear()
+                for message in pubsub.listen():
+                    self.cache.apply_invalidation(message['data'])
+            except RedisError as error:
+                logger.warning(f'Cache invalidation channel {self.cache.channel} is lost: {error}')
+                self.cache.local.clear()
+                time.sleep(1)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Cache backend that keeps the recently read values in the memory of the process in front of
+    a shared cache, Redis by default.
+
+    Values are read from the local LRU first, so hot keys do not cost a request to Redis.
+    Every change is written to Redis and published to the INVALIDATION_CHANNEL, the other
+    processes remove the changed keys from their local caches. Local values live no longer
+    than LOCAL_TIMEOUT seconds, which limits how stale they can be if a message is lost.
+
+    The keys matching the shell-style patterns of REMOTE_ONLY_KEYS are always read from Redis,
+    e.g. the version keys the keys of other values are built from: a stale version in one
+    process would serve its stale values for as long as the values live.
+
+    Example:
+        'default': {
+            'BACKEND': 'online_store.two_tier_cache.TwoTierCache',
+            'LOCATION': 'redis://redis:6379',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'REMOTE_ONLY_KEYS': ['*_version'],
+        }
+    """
+
+    def __init__(self, location: str, params: dict):
+        params = params.copy()
+        backend = params.pop('REMOTE_BACKEND', 'django.core.cache.backends.redis.RedisCache')
+        local_max_entries = params.pop('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = params.pop('LOCAL_TIMEOUT', 5)
+        self.channel = params.pop('INVALIDATION_CHANNEL', 'cache_invalidation')
+        remote_only_keys = params.pop('REMOTE_ONLY_KEYS', ())
+        self.remote_only_pattern = (re.compile('|'.join(map(translate, remote_only_keys)))
+                                    if remote_only_keys else None)
+        super().__init__(params)
+        self.remote = import_string(backend)(location, params)
+
+        with _registry_lock:
+            self.local = _local_caches.setdefault(self.channel, LocalCache(local_max_entries))
+
+    def get_redis_client(self):
+        return self.remote._cache.get_client(write=True)
+
+    def _start_listener(self) -> None:
+        """
+        Starts listening to the invalidation channel once per process, and again after a fork.
+        """
+        if not isinstance(self.remote, RedisCache):
+            return
+        listener_name = (os.getpid(), self.channel)
+        if listener_name in _listeners:
+            return
+        with _registry_lock:
+            if listener_name not in _listeners:
+                _listeners[listener_name] = InvalidationListener(self)
+                _listeners[listener_name].start()
+
+    def _invalidate(self, keys: List[str]) -> None:
+        """
+        Removes the changed keys from the local cache of this and the other processes.
+        The new values are read from the shared cache when they are needed.
+
+        :param keys: The changed keys.
+        """
+        for key in keys:
+            self.local.delete(key)
+        self._publish(keys)
+
+    def _publish(self, keys: Optional[List[str]]) -> None:
+        """
+        Asks the other processes to remove the keys from their local caches.
+
+        :param keys: The changed keys, or None if the cache is cleared.
+        """
+        if not isinstance(self.remote, RedisCache):
+            return
+        message = json.dumps({'origin': get_process_id(), 'keys': keys})
+        try:
+            self.get_redis_client().publish(self.channel, message)
+        except RedisError as error:
+            logger.error(f'Cache invalidation is not published to {self.channel}: {error}')
+
+    def apply_invalidation(self, message: bytes) -> None:
+        """
+        Removes the keys changed by another process from the local cache.
+
+        :param message: The message of the invalidation channel.
+        """
+        message = json.loads(message)
+        if message['origin'] == get_process_id():
+            return
+        if message['keys'] is None:
+            self.local.clear()
+            return
+        for key in message['keys']:
+            self.local.delete(key)
+
+    def is_local_key(self, key: str) -> bool:
+        """
+        Checks whether the value of a key may be kept in the local cache, see REMOTE_ONLY_KEYS.
+
+        :param key: The key as given to the cache, without the prefix and the version.
+        """
+        return self.remote_only_pattern is None or not self.remote_only_pattern.match(key)
+
+    def _set_local(self, key: str, value) -> None:
+        self.local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.local_timeout)
+
+    def make_key(self, key, version=None):
+        return self.remote.make_key(key, version=version)
+
+    def validate_key(self, key):
+        return self.remote.validate_key(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._invalidate([self.make_key(key, version=version)])
+        return added
+
+    def get(self, key, default=None, version=None):
+        if not self.is_local_key(key):
+            return self.remote.get(key, default, version=version)
+
+        self._start_listener()
+        local_key = self.make_key(key, version=version)
+        pickled = self.local.get(local_key)
+        if pickled is not None:
+            return pickle.loads(pickled)
+
+        value = self.remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._set_local(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout=timeout, version=version)
+        self._invalidate([self.make_key(key, version=version)])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.remote.delete(key, version=version)
+        self._invalidate([self.make_key(key, version=version)])
+        return deleted
+
+    def get_many(self, keys, version=None):
+        self._start_listener()
+        data = {}
+        missing = []
+        for key in keys:
+            pickled = (self.local.get(self.make_key(key, version=version))
+                       if self.is_local_key(key) else None)
+            if pickled is None:
+                missing.append(key)
+            else:
+                data[key] = pickle.loads(pickled)
+
+        if missing:
+            remote_data = self.remote.get_many(missing, version=version)
+            for key, value in remote_data.items():
+                if self.is_local_key(key):
+                    self._set_local(self.make_key(key, version=version), value)
+            data.update(remote_data)
+        return data
+
+    def has_key(self, key, version=None):
+        if (self.is_local_key(key) and
+                self.local.get(self.make_key(key, version=version)) is not None):
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta=delta, version=version)
+        self._invalidate([self.make_key(key, version=version)])
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout=timeout, version=version)
+        self._invalidate([self.make_key(key, version=version) for key in data])
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.remote.delete_many(keys, version=version)
+        self._invalidate([self.make_key(key, version=version) for key in keys])
+
+    def clear(self):
+        self.remote.clear()
+        self.local.clear()
+        self._publish(None)
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+    def get_local_info(self) -> Dict[str, int]:
+        """
+        Gets the size of the local cache.
+        """
+        return {'local_keys': len(self.local), 'local_max_entries': self.local.max_entries}
@@ -26,7 +26,8 @@ urlpatterns += i18n_patterns(
 if settings.DEBUG:
     urlpatterns = [path('__debug__/', include('debug_toolbar.urls'))] + urlpatterns
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
+elif not settings.SERVE_FILES_WITH_NGINX:
+    # The development without nginx, see FILE_DELIVERY
     urlpatterns += [
         re_path(f'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$',
                 mediaserve, {'document_root': settings.MEDIA_ROOT}),
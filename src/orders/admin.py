@@ -1,11 +1,18 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 from modeltranslation.admin import TranslationAdmin
 
+from online_store.paginators import EstimatedCountPaginator
 from .models import GoodsInTheOrder
 from .models import Order
 from .models import PaymentMethod
+from .models import ProductSales
 from .models import PromoCode
+from .models import SalesDay
 from .models import Status
+from .services import export_orders_csv
+from .services import reprice_order_products
+from .services import update_order_prices
 
 
 @admin.register(Status)
@@ -13,28 +20,71 @@ class StatusAdmin(TranslationAdmin):
     list_display = ('title',)
 
 
-class ProductInOrderInline(admin.StackedInline):
+class ProductInOrderInline(admin.TabularInline):
+    """
+    The products are chosen with an autocomplete that loads them on demand, the colors and
+    sizes by their ids, so the form does not render every product for each line.
+    """
     model = GoodsInTheOrder
-    extra = 1
+    extra = 0
+    fields = ['product', 'color', 'size', 'nmb', 'price_per_item', 'total_price']
+    readonly_fields = ['total_price']
+    autocomplete_fields = ['product']
+    raw_id_fields = ['color', 'size']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'first_name', 'last_name', 'email', 'city',
-                    'phone_number', 'updated', 'total_price',
+                    'phone_number', 'created', 'status', 'total_price',
                     'payment_method']
+    list_select_related = ['status', 'payment_method']
+    list_filter = ['status', 'created']
+    search_fields = ['=id', '=phone_number', '=email']
+    ordering = ['-created']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user', 'promo_code']
     inlines = [ProductInOrderInline]
+    actions = ['recalculate_prices', 'reprice_products', 'export_csv']
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return ["total_price", 'delivery', 'user']
+            return ['subtotal', "total_price", 'delivery', 'user']
         else:
-            return []
+            return ['subtotal']
+
+    @admin.action(description='Recalculate delivery and total price')
+    def recalculate_prices(self, request, queryset):
+        updated = update_order_prices(queryset)
+        self.message_user(request, f'{updated} orders recalculated')
+
+    @admin.action(description='Reprice products with the current prices')
+    def reprice_products(self, request, queryset):
+        repriced = reprice_order_products(queryset)
+        self.message_user(request, f'{repriced} products repriced')
+
+    @admin.action(description='Export to CSV')
+    def export_csv(self, request, queryset):
+        response = StreamingHttpResponse(export_orders_csv(queryset), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+        return response
 
 
 @admin.register(GoodsInTheOrder)
 class GoodsInTheOrderAdmin(admin.ModelAdmin):
     list_display = [field.name for field in GoodsInTheOrder._meta.fields]
+    list_select_related = ['product', 'color__product', 'color__color', 'size__product__product',
+                           'size__size', 'order']
+    list_filter = ['order__status']
+    search_fields = ['=order__id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ['product']
+    raw_id_fields = ['order', 'color', 'size']
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
@@ -51,3 +101,30 @@ class PaymentMethodAdmin(TranslationAdmin):
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
     model = PromoCode
+    list_display = ['title', 'price', 'is_active', 'uses', 'max_uses', 'max_uses_per_user']
+    list_filter = ['is_active']
+    # Generated codes are many, they are found by the unique index of the title
+    search_fields = ['=title']
+    readonly_fields = ['uses']
+    show_full_result_count = False
+
+
+class ProductSalesInline(admin.TabularInline):
+    model = ProductSales
+    extra = 0
+    can_delete = False
+    readonly_fields = ['product', 'category', 'orders', 'quantity', 'revenue']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'category')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SalesDay)
+class SalesDayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'orders', 'quantity', 'revenue', 'total', 'rolled_up']
+    date_hierarchy = 'date'
+    readonly_fields = ['date', 'orders', 'quantity', 'revenue', 'total', 'rolled_up']
+    inlines = [ProductSalesInline]
@@ -9,7 +9,11 @@ class OrdersConfig(AppConfig):
         from django.db.models.signals import post_save
         from django.db.models.signals import post_delete
         from orders.models import GoodsInTheOrder
+        from orders.models import PromoCode
         from orders.signals import product_in_order_post_save
+        from orders.signals import promo_code_changed
 
         post_save.connect(product_in_order_post_save, sender=GoodsInTheOrder)
         post_delete.connect(product_in_order_post_save, sender=GoodsInTheOrder)
+        post_save.connect(promo_code_changed, sender=PromoCode)
+        post_delete.connect(promo_code_changed, sender=PromoCode)
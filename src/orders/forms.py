@@ -1,14 +1,18 @@
 import logging
+from datetime import timedelta
 
 from django import forms
 from django.core.exceptions import ValidationError
 from django.forms import ModelChoiceField
 from django.forms import ModelForm
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from orders.models import Order
 from orders.models import PaymentMethod
-from orders.models import PromoCode
+from orders.services import SALES_REPORT_FORMATS
+from orders.services import SALES_REPORT_GROUPS
+from orders.services import get_promo_code
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +66,8 @@ class CreateOrderForm(ModelForm):
                                  required=False,
                                  widget=forms.TextInput(
                                      attrs={"class": 'form-control'}))
+    # Not a field of the model form, a retried submit must not fail the unique validation
+    checkout_key = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput)
 
     class Meta:
         model = Order
@@ -72,16 +78,36 @@ class CreateOrderForm(ModelForm):
     def clean_promo_code(self):
         """
         Checks the promo code for validity
+
+        :return: The promo code object, or None if no code was entered.
         """
-        promo_code = self.cleaned_data['promo_code']
-        if not promo_code:
-            return promo_code
-        try:
-            promo_code = PromoCode.objects.get(title=promo_code)
-            if promo_code.is_active:
-                return self.cleaned_data['promo_code']
-            else:
-                raise ValidationError(_('Promo code is not active'))
-        except Exception as error:
-            logger.warning(error)
+        if not self.cleaned_data['promo_code']:
+            return None
+        promo_code = get_promo_code(self.cleaned_data['promo_code'])
+        if promo_code is None or not promo_code.is_usable:
+            logger.warning(f"Promo code {self.cleaned_data['promo_code']} is not active")
             raise ValidationError(_('Promo code is not active'))
+        return promo_code
+
+
+class SalesReportForm(forms.Form):
+    """
+    The parameters of a sales report, the last 30 days by day in CSV by default.
+    """
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    group_by = forms.ChoiceField(choices=[(group, group) for group in SALES_REPORT_GROUPS],
+                                 required=False)
+    format = forms.ChoiceField(choices=[(name, name) for name in SALES_REPORT_FORMATS],
+                               required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['end'] = cleaned_data.get('end') or timezone.localdate()
+        cleaned_data['start'] = cleaned_data.get('start') or \
+            cleaned_data['end'] - timedelta(days=30)
+        cleaned_data['group_by'] = cleaned_data.get('group_by') or SALES_REPORT_GROUPS[0]
+        cleaned_data['format'] = cleaned_data.get('format') or SALES_REPORT_FORMATS[0]
+        if cleaned_data['start'] > cleaned_data['end']:
+            raise ValidationError(_('The start is after the end'))
+        return cleaned_data
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from orders.services import generate_promo_codes
+
+
+class Command(BaseCommand):
+    help = 'Creates unique random promo codes in bulk and prints them, one per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('number', type=int, help='The number of codes')
+        parser.add_argument('price', type=int, help='The discount of the codes')
+        parser.add_argument('--prefix', default='', help='The beginning of each code')
+        parser.add_argument('--length', type=int, default=10,
+                            help='The number of random characters after the prefix')
+        parser.add_argument('--max-uses', type=int, default=1,
+                            help='The number of orders that may use each code, 0 for no limit')
+        parser.add_argument('--max-uses-per-user', type=int, default=None,
+                            help='The number of orders of a customer that may use each code')
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        try:
+            codes = generate_promo_codes(options['number'], options['price'],
+                                         prefix=options['prefix'], length=options['length'],
+                                         max_uses=options['max_uses'] or None,
+                                         max_uses_per_user=options['max_uses_per_user'])
+        except ValueError as error:
+            raise CommandError(error)
+        for code in codes:
+            self.stdout.write(code)
+        self.stderr.write(f'{len(codes)} promo codes created in '
+                          f'{time.monotonic() - started_at:.2f} s')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from orders.services import rebuild_sales_ranks
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the sold units and the popularity of all products from the orders'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{rebuild_sales_ranks()} products ranked')
@@ -0,0 +1,53 @@
+from datetime import date
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from orders.services import SALES_REPORT_FORMATS
+from orders.services import SALES_REPORT_GROUPS
+from orders.services import format_sales_report
+from orders.services import get_sales_report
+from orders.services import update_daily_sales
+
+
+def parse_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value}, use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = ('Reports the sales by day, product or category from the daily rollup, '
+            'after rolling up the days that changed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_day,
+                            help='The first day, YYYY-MM-DD, 30 days ago by default')
+        parser.add_argument('--end', type=parse_day, help='The last day, today by default')
+        parser.add_argument('--group-by', choices=SALES_REPORT_GROUPS, default='day')
+        parser.add_argument('--format', choices=SALES_REPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='The file to write, the standard output by default')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Roll up all the days of the range again, e.g. after orders '
+                                 'were deleted')
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or end - timedelta(days=30)
+        if start > end:
+            raise CommandError('The start is after the end')
+
+        days = update_daily_sales(start, end, rebuild=options['rebuild'])
+        self.stderr.write(f'{len(days)} days rolled up')
+
+        lines = format_sales_report(get_sales_report(start, end, options['group_by']),
+                                    options['group_by'], options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
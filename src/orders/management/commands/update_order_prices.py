@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.models import Order
+from orders.services import reprice_order_products
+from orders.services import update_all_order_prices
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the subtotal, the delivery and the total price of orders in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int,
+                            help='The ids of the orders, all by default')
+        parser.add_argument('--reprice', action='store_true',
+                            help='Replace the frozen prices of the products with the current ones')
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        if options['reprice']:
+            orders = Order.objects.all()
+            if options['ids']:
+                orders = orders.filter(pk__in=options['ids'])
+            repriced = reprice_order_products(orders)
+            self.stdout.write(f'{repriced} products repriced')
+
+        updated = update_all_order_prices(options['ids'] or None)
+        self.stdout.write(f'{updated} orders recalculated in {time.monotonic() - started_at:.2f} s')
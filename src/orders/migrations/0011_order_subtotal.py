@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:45
+
+from django.db import migrations, models
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_subtotal(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    GoodsInTheOrder = apps.get_model('orders', 'GoodsInTheOrder')
+    subtotal = GoodsInTheOrder.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        subtotal=Sum('total_price')).values('subtotal')
+    Order.objects.update(subtotal=Coalesce(Subquery(subtotal), 0,
+                                           output_field=models.DecimalField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_alter_goodsintheorder_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_subtotal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_ratinghistogram'),
+        ('orders', '0012_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Product sales',
+                'verbose_name_plural': 'Product sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rolled_up', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Sales day',
+                'verbose_name_plural': 'Sales days',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated'], name='orders_order_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.category'),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='day',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='orders.salesday'),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product'),
+        ),
+    ]
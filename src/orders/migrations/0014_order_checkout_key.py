@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_key',
+            field=models.CharField(blank=True, default=None, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.3 on 2026-10-19 16:18
+
+from django.db import migrations, models
+
+
+def normalize_titles(apps, schema_editor):
+    """
+    Stores the titles of the promo codes normalized like PromoCode.normalize_title before they
+    become unique. A code that only differs from an older one in case or spacing keeps its id
+    as a suffix and is deactivated.
+    """
+    PromoCode = apps.get_model('orders', 'PromoCode')
+    titles = set()
+    for promo_code in PromoCode.objects.order_by('pk'):
+        title = ' '.join(promo_code.title.split()).lower()
+        if title in titles:
+            title = f'{title}-{promo_code.pk}'
+            promo_code.is_active = False
+        titles.add(title)
+        promo_code.title = title
+        promo_code.save(update_fields=['title', 'is_active'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_order_checkout_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses_per_user',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='uses',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(normalize_titles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='promocode',
+            name='title',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+    ]
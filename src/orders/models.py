@@ -5,6 +5,7 @@ from django.utils.translation import gettext_lazy as _
 
 from shop.models import AttributeColor
 from shop.models import AttributeSize
+from shop.models import Category
 from shop.models import Delivery
 from shop.models import Product
 from users.models import User
@@ -24,6 +25,7 @@ class Order(models.Model):
     created = models.DateTimeField(auto_now_add=True, auto_now=False)
     updated = models.DateTimeField(auto_now_add=False, auto_now=True)
     additional_information = models.TextField(max_length=300, blank=True)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.ForeignKey('Status', default=1, on_delete=models.SET_NULL, blank=True,
                                null=True)
@@ -32,6 +34,10 @@ class Order(models.Model):
     payment_method = models.ForeignKey('PaymentMethod', on_delete=models.SET_NULL, blank=True,
                                        null=True, default=None)
     promo_code = models.ForeignKey('PromoCode', on_delete=models.SET_NULL, blank=True, null=True)
+    # The key of the checkout form, a submit with the key of an existing order does not create
+    # another one
+    checkout_key = models.CharField(max_length=64, unique=True, blank=True, null=True,
+                                    default=None, editable=False)
 
     def __str__(self):
         return str(self.id)
@@ -39,6 +45,11 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            models.Index(fields=['created'], name='orders_order_created_idx'),
+            models.Index(fields=['status', 'created'], name='orders_status_created_idx'),
+            models.Index(fields=['updated'], name='orders_order_updated_idx'),
+        ]
 
 
 class GoodsInTheOrder(models.Model):
@@ -65,16 +76,18 @@ class GoodsInTheOrder(models.Model):
         """
         Save the product and update the price fields.
 
-        This method updates the `price_per_item` field with the current price of the product and
-        the `total_price` field with the total price based on the quantity of the product. It then
-        saves the object to the database.
+        The `price_per_item` is frozen when the product is added to the order: it is taken from
+        the current price of the product only for a new item without a price, so later changes of
+        the product price do not rewrite the order. The `total_price` field is updated with the
+        total price based on the quantity of the product.
 
         :param args: Additional positional arguments passed to the parent class's save method.
         :param kwargs: Additional keyword arguments passed to the parent class's save method.
         :return: None
         """
         try:
-            self.price_per_item = self.product.price_now
+            if self._state.adding and not self.price_per_item:
+                self.price_per_item = self.product.price_now
             self.total_price = self.nmb * self.price_per_item
             super(GoodsInTheOrder, self).save(*args, **kwargs)
         except Exception as error:
@@ -100,27 +113,93 @@ class PaymentMethod(models.Model):
 
 
 class PromoCode(models.Model):
-    title = models.CharField(max_length=200)
+    # Stored normalized, see normalize_title
+    title = models.CharField(max_length=200, unique=True)
     price = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # The number of orders that may use the code in total and per customer, None for no limit
+    max_uses = models.PositiveIntegerField(blank=True, null=True)
+    max_uses_per_user = models.PositiveIntegerField(blank=True, null=True)
+    # Counted by redeem_promo_code
+    uses = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return str(self.price)
 
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """
+        Normalizes a promo code the way it is stored, so codes are entered in any case and with
+        any spacing.
+
+        :param title: The promo code as entered.
+        :return: The promo code in lower case with single spaces.
+        """
+        return ' '.join(str(title).split()).lower()
+
+    @property
+    def is_usable(self) -> bool:
+        """
+        Whether the promo code is active and has uses left.
+        """
+        return self.is_active and (self.max_uses is None or self.uses < self.max_uses)
+
+    def save(self, *args, **kwargs):
+        self.title = self.normalize_title(self.title)
+        super().save(*args, **kwargs)
+
     @staticmethod
     def get_promo_code(title: str) -> 'PromoCode':
         """
         Get a promo code by its title, handling exceptions if necessary.
 
-        :param title: The title of the promo code to retrieve.
+        :param title: The title of the promo code to retrieve, in any case.
         :return: The promo code object.
         :raises PromoCode.DoesNotExist: If the promo code with the given title does not exist.
         """
         try:
-            return PromoCode.objects.get(title=title)
+            return PromoCode.objects.get(title=PromoCode.normalize_title(title))
         except PromoCode.DoesNotExist as error:
             logger.error(f"Promo code with title {title} does not exist: {error}")
             raise error
         except Exception as error:
             logger.error(f"Error getting promo code with title {title}: {error}")
             raise error
+
+
+class SalesDay(models.Model):
+    """
+    The sales of a day rolled up from the orders created that day, see update_daily_sales.
+    """
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rolled_up = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.date)
+
+    class Meta:
+        verbose_name = _('Sales day')
+        verbose_name_plural = _('Sales days')
+
+
+class ProductSales(models.Model):
+    """
+    The sales of a product on a day rolled up from the goods in the orders.
+    """
+    day = models.ForeignKey(SalesDay, related_name='products', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True)
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.day} {self.product_id}'
+
+    class Meta:
+        verbose_name = _('Product sales')
+        verbose_name_plural = _('Product sales')
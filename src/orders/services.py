@@ -1,21 +1,223 @@
+import csv
+import hashlib
+import json
 import logging
+import math
+import secrets
+from collections import Counter
+from collections import defaultdict
+from datetime import date
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
 
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import DecimalField
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Q
 from django.db.models import QuerySet
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+from django.db.models.functions import Length
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 
+from basket.models import ProductInBasket
+from online_store.settings import ORDER_EXPORT_BATCH_SIZE
+from online_store.settings import ORDER_PRICING_BATCH_SIZE
+from online_store.settings import PROMO_CODE_BATCH_SIZE
+from online_store.settings import PROMO_CODE_CACHE_TIMEOUT
+from online_store.settings import SALES_REPORT_CHUNK_SIZE
 from orders.models import GoodsInTheOrder
 from orders.models import Order
+from orders.models import ProductSales
+from orders.models import PromoCode
+from orders.models import SalesDay
+from shop.models import Delivery
+from shop.models import Product
+from shop.services import get_cache_version
+from shop.services import add_popularity
+from shop.services import get_popularity_log_weight
+from shop.services import invalidate_cache_version
+from shop.services import record_product_sales
+from stock.services import reserve_stock
 
 logger = logging.getLogger(__name__)
 
+SALES_REPORT_COLUMNS = {
+    'day': ('date', 'orders', 'quantity', 'revenue', 'total'),
+    'product': ('product', 'product__title', 'orders', 'quantity', 'revenue'),
+    'category': ('category', 'category__title', 'orders', 'quantity', 'revenue'),
+}
+SALES_REPORT_GROUPS = tuple(SALES_REPORT_COLUMNS)
+SALES_REPORT_FORMATS = ('csv', 'jsonl')
+
+ORDER_EXPORT_FIELDS = ('id', 'created', 'status__title', 'first_name', 'last_name', 'email',
+                       'phone_number', 'city', 'address', 'postcode', 'payment_method__title',
+                       'delivery__title', 'promo_code__title', 'subtotal', 'total_price')
+
+# Letters and digits that are not confused with each other when a code is typed
+PROMO_CODE_ALPHABET = 'abcdefghjkmnpqrstuvwxyz23456789'
+
+
+class PromoCodeUnavailable(Exception):
+    """
+    Raised to roll back an order when its promo code is inactive or has no uses left.
+    """
+
+    def __init__(self, promo_code_id: int):
+        super().__init__(f'Promo code {promo_code_id} is not available')
+        self.promo_code_id = promo_code_id
+
+
+def get_promo_code(title: str) -> Optional[PromoCode]:
+    """
+    Gets a promo code by its title in any case from the cache, or selects it from the database.
+
+    Unknown codes are cached too, so guessing codes does not reach the database. The cached
+    codes are invalidated when a promo code is saved, deleted or generated. The number of uses
+    may be out of date, it is checked again by redeem_promo_code.
+
+    :param title: The promo code as entered.
+    :return: The promo code, or None if it does not exist.
+    """
+    title = PromoCode.normalize_title(title)
+    if not title:
+        return None
+    version = get_cache_version('promo_code')
+    cache_name = f'promo_code:{version}:{hashlib.md5(title.encode()).hexdigest()}'
+    promo_code = cache.get(cache_name)
+    if promo_code is None:
+        promo_code = PromoCode.objects.filter(title=title).first() or False
+        cache.set(cache_name, promo_code, PROMO_CODE_CACHE_TIMEOUT)
+    return promo_code or None
+
+
+def redeem_promo_code(order: Order) -> None:
+    """
+    Counts the use of the promo code of a new order with a single conditional UPDATE, which
+    checks that the code is active, that it has uses left and that the customer has not used
+    it up in earlier orders, so concurrent checkouts can never use it more often than allowed.
+
+    The customer is the user of the order, or the phone number of an order without a user.
+    Call it in the transaction that saves the order, before the order is saved.
+
+    :param order: The new order with a promo code.
+    :raises PromoCodeUnavailable: If the promo code cannot be used.
+    """
+    if order.user_id:
+        customer_orders = Order.objects.filter(user=order.user_id)
+    else:
+        customer_orders = Order.objects.filter(user__isnull=True, phone_number=order.phone_number)
+    customer_uses = customer_orders.filter(promo_code=OuterRef('pk')).order_by().values(
+        'promo_code').annotate(count=Count('pk')).values('count')
+
+    redeemed = PromoCode.objects.filter(
+        Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses')),
+        Q(max_uses_per_user__isnull=True) |
+        Q(max_uses_per_user__gt=Coalesce(Subquery(customer_uses), Value(0))),
+        pk=order.promo_code_id, is_active=True).update(uses=F('uses') + 1)
+    if not redeemed:
+        raise PromoCodeUnavailable(order.promo_code_id)
+
+
+def generate_promo_codes(number: int, price: int, prefix: str = '', length: int = 10,
+                         max_uses: Optional[int] = 1, max_uses_per_user: Optional[int] = None,
+                         batch_size: int = PROMO_CODE_BATCH_SIZE) -> List[str]:
+    """
+    Creates unique random promo codes in bulk, single-use codes by default.
+
+    Each batch of candidates is checked against the existing codes with one query on the
+    unique index of the title and inserted with one statement.
+
+    :param number: The number of codes to create.
+    :param price: The discount of the codes.
+    :param prefix: The beginning of each code, e.g. the name of a campaign.
+    :param length: The number of random characters after the prefix.
+    :param max_uses: The number of orders that may use each code, None for no limit.
+    :param max_uses_per_user: The number of orders of a customer that may use each code.
+    :param batch_size: The number of codes inserted by each statement.
+    :return: The created codes.
+    :raises ValueError: If there are fewer unused codes of the length than requested.
+    """
+    if length < 1:
+        raise ValueError('The length of the codes must be at least 1')
+    prefix = PromoCode.normalize_title(prefix)
+    codes = []
+    with transaction.atomic():
+        # Otherwise the candidates would be drawn forever once all the codes are used
+        used = PromoCode.objects.filter(title__startswith=prefix).annotate(
+            length=Length('title')).filter(length=len(prefix) + length).count()
+        unused = len(PROMO_CODE_ALPHABET) ** length - used
+        if number > unused:
+            raise ValueError(f'There are {max(unused, 0)} unused codes of length {length}')
+        while len(codes) < number:
+            candidates = {prefix + ''.join(secrets.choice(PROMO_CODE_ALPHABET)
+                                           for _x in range(length))
+                          for _x in range(min(batch_size, number - len(codes)))}
+            candidates -= set(PromoCode.objects.filter(title__in=candidates).values_list(
+                'title', flat=True))
+            PromoCode.objects.bulk_create(
+                [PromoCode(title=title, price=price, max_uses=max_uses,
+                           max_uses_per_user=max_uses_per_user) for title in candidates],
+                batch_size=batch_size)
+            codes.extend(candidates)
+    # bulk_create does not send post_save, unknown codes may be cached
+    invalidate_cache_version('promo_code')
+    return codes
+
+
+def move_products_to_order(products_in_basket: Iterable[ProductInBasket], order: Order) -> None:
+    """
+    Moves products from a shopping cart to an order list and records the sales of the products.
+
+    For each item it creates a new `GoodsInTheOrder` object of the order and removes the item
+    from the shopping cart. Finally, the sold units are added to the sales count and the
+    popularity of the products, see record_product_sales. Errors are raised, so the transaction
+    of the order is rolled back.
+
+    :param products_in_basket: The items in the shopping cart.
+    :param order: The order to which the products should be added.
+    :return: None
+    """
+    units = Counter()
+    for item in products_in_basket:
+        GoodsInTheOrder.objects.create(product=item.product,
+                                       order=order,
+                                       total_price=item.total_price,
+                                       nmb=item.nmb,
+                                       price_per_item=item.price_per_item,
+                                       color=item.color,
+                                       size=item.size)
+        if item.product_id:
+            units[item.product_id] += item.nmb
+        item.delete()
+    record_product_sales(units)
+
 
 def add_products_to_the_order_list(products_in_basket: QuerySet, order_id: int) -> None:
     """
-    Add products from a shopping cart to an order list and update the product's sale count.
+    Add products from a shopping cart to an order list and record the sales of the products.
 
-    This function retrieves an order by its ID, then iterates over the items in the shopping cart.
-    For each item, it creates a new `GoodsInTheOrder` object and associates it with the order.
-    The function then increments the product's sale count by 1 and saves the changes to the
-    database. Finally, the function removes the item from the shopping cart.
+    This function retrieves an order by its ID and moves the items of the shopping cart to it,
+    see move_products_to_order. Errors are logged.
 
     :param products_in_basket: A queryset of items in the shopping cart.
     :param order_id: The ID of the order to which the products should be added.
@@ -23,18 +225,359 @@ def add_products_to_the_order_list(products_in_basket: QuerySet, order_id: int)
     """
     try:
         order = Order.objects.get(pk=order_id)
-        for item in products_in_basket:
-            GoodsInTheOrder.objects.create(product=item.product,
-                                           order=order,
-                                           total_price=item.total_price,
-                                           nmb=item.nmb,
-                                           price_per_item=item.price_per_item,
-                                           color=item.color,
-                                           size=item.size)
-            item.product.count_sale += 1
-            item.product.save()
-            item.delete()
+        move_products_to_order(products_in_basket, order)
     except Order.DoesNotExist as error:
         logger.error(f"Order with ID {order_id} does not exist: {error}")
     except Exception as error:
         logger.error(f"Error adding products to order list: {error}")
+
+
+def get_order_by_checkout_key(checkout_key: str) -> Optional[Order]:
+    """
+    Returns the order created with a checkout key.
+
+    :param checkout_key: The checkout key of the order form.
+    :return: The order or None if there is no order with the key.
+    """
+    return Order.objects.filter(checkout_key=checkout_key).first()
+
+
+def place_order(order: Order, user_authenticated: str) \
+        -> Tuple[Optional[Order], List[ProductInBasket]]:
+    """
+    Creates an order of the products in a basket in one transaction: takes the units from the
+    stock, saves the order and moves the products from the basket to the order.
+
+    The rows of the basket are locked first, so submits of the same basket run one after
+    another. If an order with the checkout key of the new order exists, it is returned and
+    nothing else is done, so a repeated submit does not create another order.
+
+    :param order: The new order, not saved yet.
+    :param user_authenticated: The key of the basket.
+    :return: The created or the existing order, or None if the basket is empty or some products
+             are not in stock, and the products without enough stock.
+    :raises PromoCodeUnavailable: If the promo code of the order cannot be used.
+    """
+    try:
+        with transaction.atomic():
+            # Only the rows of the basket, not the products and sizes they are selected with
+            list(ProductInBasket.objects.select_for_update().filter(
+                user_authenticated=user_authenticated, is_active=True).values_list('pk'))
+            if order.checkout_key:
+                existing_order = get_order_by_checkout_key(order.checkout_key)
+                if existing_order is not None:
+                    return existing_order, []
+
+            products_in_basket = list(
+                ProductInBasket.get_products_from_user_basket(user_authenticated))
+            if not products_in_basket:
+                return None, []
+            missing = reserve_stock(user_authenticated, products_in_basket, hold=False)
+            if missing:
+                return None, missing
+
+            if order.promo_code_id:
+                redeem_promo_code(order)
+            order.save()
+            move_products_to_order(products_in_basket, order)
+            return order, []
+    except IntegrityError:
+        # A parallel submit of another basket with the same key created the order first
+        existing_order = get_order_by_checkout_key(order.checkout_key)
+        if existing_order is None:
+            raise
+        return existing_order, []
+
+
+def get_delivery_subquery(field: str) -> Subquery:
+    """
+    Selects a field of the delivery of an order by its subtotal, like Delivery.get_delivery:
+    the active delivery with the highest order price not above the subtotal, or else the
+    active delivery with the lowest order price.
+
+    :param field: The field of the delivery, e.g. 'pk' or 'price'.
+    :return: A subquery of the field for the outer order.
+    """
+    deliveries = Delivery.objects.filter(is_active=True)
+    return Coalesce(
+        Subquery(deliveries.filter(order_price__lte=OuterRef('subtotal')).order_by(
+            '-order_price').values(field)[:1]),
+        Subquery(deliveries.order_by('order_price').values(field)[:1]))
+
+
+def update_order_prices(orders: QuerySet) -> int:
+    """
+    Recalculates the subtotal, the delivery and the total price of orders in the database.
+
+    The subtotals are summed from the frozen prices of the products in the orders by one
+    statement, then the delivery, the promo code and the total price are set by another one,
+    which also marks the orders as updated for the sales rollup.
+    An order without products has no delivery and costs nothing.
+
+    :param orders: The orders to update.
+    :return: The number of updated orders.
+    """
+    money = DecimalField(max_digits=10, decimal_places=2)
+    subtotal = GoodsInTheOrder.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        subtotal=Sum('total_price')).values('subtotal')
+    promo_code_price = PromoCode.objects.filter(pk=OuterRef('promo_code')).values('price')
+
+    with transaction.atomic():
+        orders.update(subtotal=Coalesce(Subquery(subtotal), Value(0), output_field=money))
+        return orders.update(
+            updated=timezone.now(),
+            delivery=Case(When(subtotal__lte=0, then=None),
+                          default=get_delivery_subquery('pk')),
+            total_price=Case(
+                When(subtotal__lte=0, then=Value(0)),
+                default=Greatest(F('subtotal')
+                                 + Coalesce(get_delivery_subquery('price'), Value(0))
+                                 - Coalesce(Subquery(promo_code_price), Value(0)),
+                                 Value(0)),
+                output_field=money))
+
+
+def update_all_order_prices(order_ids: Iterable[int] = None,
+                            batch_size: int = ORDER_PRICING_BATCH_SIZE) -> int:
+    """
+    Recalculates the prices of many orders in batches, e.g. after the deliveries were changed.
+
+    :param order_ids: The ids of the orders, all orders by default.
+    :param batch_size: The number of orders updated by each pair of statements.
+    :return: The number of updated orders.
+    """
+    if order_ids is None:
+        order_ids = Order.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=batch_size)
+    updated = 0
+    batch = []
+    for order_id in order_ids:
+        batch.append(order_id)
+        if len(batch) == batch_size:
+            updated += update_order_prices(Order.objects.filter(pk__in=batch))
+            batch = []
+    if batch:
+        updated += update_order_prices(Order.objects.filter(pk__in=batch))
+    return updated
+
+
+def reprice_order_products(orders: QuerySet) -> int:
+    """
+    Replaces the frozen prices of the products in orders with the current prices of the
+    products, for price migrations, and recalculates the orders.
+
+    :param orders: The orders to reprice.
+    :return: The number of repriced products.
+    """
+    price_now = Product.objects.filter(pk=OuterRef('product')).values('price_now')
+    with transaction.atomic():
+        repriced = GoodsInTheOrder.objects.filter(order__in=orders, product__isnull=False).update(
+            price_per_item=Subquery(price_now),
+            total_price=F('nmb') * Subquery(price_now))
+        update_order_prices(orders)
+    return repriced
+
+
+class Echo:
+    """
+    A file-like object that returns what is written to it, so csv.writer returns the lines.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_orders_csv(orders: QuerySet, batch_size: int = ORDER_EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """
+    Generates the lines of a CSV file of orders for a streaming response.
+
+    The orders are read in batches by their ids, so only one batch of rows is held in memory,
+    also on MySQL where a queryset iterator still fetches all the rows at once.
+
+    :param orders: The orders to export.
+    :param batch_size: The number of orders read by each query.
+    :return: An iterator of CSV lines, the first line is the header.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_EXPORT_FIELDS)
+
+    orders = orders.order_by('pk').values_list(*ORDER_EXPORT_FIELDS)
+    last_id = 0
+    while True:
+        rows = list(orders.filter(pk__gt=last_id)[:batch_size])
+        for row in rows:
+            yield writer.writerow(row)
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def get_day_range(day: date) -> Tuple[datetime, datetime]:
+    """
+    Gets the beginning of a day and of the next day in the current time zone, to filter by
+    a range of an indexed date and time instead of by its date.
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def rollup_sales_day(day: date) -> SalesDay:
+    """
+    Rolls up the sales of a day from the orders created that day, replacing the previous rollup.
+
+    :param day: The day to roll up.
+    :return: The rolled up day.
+    """
+    start, end = get_day_range(day)
+    # Taken before the orders are read, so the orders changed meanwhile are rolled up again
+    rolled_up = timezone.now()
+    orders = Order.objects.filter(created__gte=start, created__lt=end).aggregate(
+        orders=Count('pk'),
+        total=Coalesce(Sum('total_price'), Value(0),
+                       output_field=DecimalField(max_digits=14, decimal_places=2)))
+    products = GoodsInTheOrder.objects.filter(
+        order__created__gte=start, order__created__lt=end).values(
+        'product', 'product__category').annotate(
+        orders=Count('order', distinct=True), quantity=Sum('nmb'),
+        revenue=Sum('total_price')).order_by()
+
+    product_sales = [ProductSales(product_id=row['product'], category_id=row['product__category'],
+                                  orders=row['orders'], quantity=row['quantity'],
+                                  revenue=row['revenue'])
+                     for row in products]
+    with transaction.atomic():
+        sales_day, _created = SalesDay.objects.update_or_create(date=day, defaults={
+            'orders': orders['orders'],
+            'total': orders['total'],
+            'quantity': sum(sales.quantity for sales in product_sales),
+            'revenue': sum(sales.revenue for sales in product_sales),
+            'rolled_up': rolled_up,
+        })
+        sales_day.products.all().delete()
+        for sales in product_sales:
+            sales.day = sales_day
+        ProductSales.objects.bulk_create(product_sales)
+    return sales_day
+
+
+def get_stale_sales_days(start: date, end: date) -> List[date]:
+    """
+    Finds the days of a range that are not rolled up yet or have orders changed since their
+    rollup. The changed orders are found by the index of their update time, and the rollup time
+    of the other days is moved forward, so each check only reads the orders changed since the
+    previous one. Deleted orders are not noticed, such days must be rolled up again explicitly.
+
+    :param start: The first day.
+    :param end: The last day, the days after today are skipped.
+    :return: A sorted list of days to roll up.
+    """
+    end = min(end, timezone.localdate())
+    days = [start + timedelta(days=number) for number in range((end - start).days + 1)]
+    if not days:
+        return []
+    checked = timezone.now()
+    rolled_up = dict(SalesDay.objects.filter(date__range=(start, end)).values_list(
+        'date', 'rolled_up'))
+    stale = {day for day in days if day not in rolled_up}
+
+    if rolled_up:
+        changed_orders = Order.objects.filter(
+            updated__gte=min(rolled_up.values()), created__gte=get_day_range(start)[0],
+            created__lt=get_day_range(end)[1]).values_list('created', 'updated')
+        for created, updated in changed_orders.iterator(chunk_size=SALES_REPORT_CHUNK_SIZE):
+            day = timezone.localdate(created)
+            if day in rolled_up and updated >= rolled_up[day]:
+                stale.add(day)
+        SalesDay.objects.filter(date__in=set(rolled_up) - stale).update(rolled_up=checked)
+    return sorted(stale)
+
+
+def update_daily_sales(start: date, end: date, rebuild: bool = False) -> List[date]:
+    """
+    Rolls up the sales of the days of a range that changed since their last rollup.
+
+    :param start: The first day.
+    :param end: The last day.
+    :param rebuild: Whether to roll up all the days of the range again.
+    :return: The rolled up days.
+    """
+    if rebuild:
+        end = min(end, timezone.localdate())
+        days = [start + timedelta(days=number) for number in range((end - start).days + 1)]
+    else:
+        days = get_stale_sales_days(start, end)
+    for day in days:
+        rollup_sales_day(day)
+    return days
+
+
+def get_sales_report(start: date, end: date, group_by: str = 'day') -> Iterator[Dict[str, Any]]:
+    """
+    Reads the sales of a range of days from the rollup tables, so the cost of a report depends
+    on the number of days and products, not on the number of orders.
+
+    :param start: The first day.
+    :param end: The last day.
+    :param group_by: 'day', 'product' or 'category'.
+    :return: An iterator of rows, dictionaries of the SALES_REPORT_COLUMNS of the group.
+    """
+    if group_by == 'day':
+        rows = SalesDay.objects.filter(date__range=(start, end)).order_by('date').values(
+            *SALES_REPORT_COLUMNS['day'])
+    else:
+        rows = ProductSales.objects.filter(day__date__range=(start, end)).values(
+            *SALES_REPORT_COLUMNS[group_by][:2]).annotate(
+            orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue')).order_by(
+            '-revenue', group_by)
+    return rows.iterator(chunk_size=SALES_REPORT_CHUNK_SIZE)
+
+
+def format_sales_report(rows: Iterable[Dict[str, Any]], group_by: str = 'day',
+                        output_format: str = 'csv') -> Iterator[str]:
+    """
+    Generates the lines of a sales report for a file or a streaming response.
+
+    :param rows: The rows of the report, see get_sales_report.
+    :param group_by: 'day', 'product' or 'category'.
+    :param output_format: 'csv' with a header line, or 'jsonl' with a JSON object per line.
+    :return: An iterator of lines.
+    """
+    if output_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        return
+
+    columns = SALES_REPORT_COLUMNS[group_by]
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row[column] for column in columns)
+
+
+def rebuild_sales_ranks(batch_size: int = ORDER_PRICING_BATCH_SIZE) -> int:
+    """
+    Recalculates the sold units and the popularity of all products from the orders, e.g. after
+    SALES_RANK_HALF_LIFE was changed. The sales of each day weigh as if they were made at the
+    beginning of the day. Checkouts during the rebuild may be counted twice or not at all.
+
+    :param batch_size: The number of products updated by each statement.
+    :return: The number of products that were sold.
+    """
+    sales = defaultdict(lambda: [0, 0.0])
+    rows = GoodsInTheOrder.objects.filter(product__isnull=False).annotate(
+        day=TruncDate('order__created')).values('product', 'day').annotate(
+        units=Sum('nmb')).order_by()
+    for row in rows.iterator(chunk_size=SALES_REPORT_CHUNK_SIZE):
+        product_sales = sales[row['product']]
+        product_sales[0] += row['units']
+        product_sales[1] = add_popularity(product_sales[1], math.log2(row['units']) + (
+            get_popularity_log_weight(get_day_range(row['day'])[0])))
+
+    with transaction.atomic():
+        Product.objects.update(count_sale=0, popularity=0)
+        Product.objects.bulk_update(
+            [Product(pk=product_id, count_sale=units, popularity=popularity)
+             for product_id, (units, popularity) in sales.items()],
+            ['count_sale', 'popularity'], batch_size=batch_size)
+    invalidate_cache_version('product_rail')
+    return len(sales)
@@ -1,13 +1,14 @@
-from orders.tasks import update_order_price
+from orders.models import Order
+from orders.services import update_order_prices
+from shop.services import invalidate_cache_version
 
 
 def product_in_order_post_save(sender, instance, created=None, **kwargs):
     """
-    Update the order when changing products in the order, handling exceptions if necessary.
+    Update the order when changing products in the order.
 
-    This function retrieves all products in the order, then calculates the order total price and
-    delivery cost based on the products and promo code (if applicable). It updates the order's
-    delivery, total price, and promo code fields and saves the changes to the database.
+    Recalculates the subtotal, the delivery and the total price of the order in the database,
+    see update_order_prices.
 
     :param sender: The model class that sent the signal.
     :param instance: The instance of the model that triggered the signal.
@@ -15,4 +16,12 @@ def product_in_order_post_save(sender, instance, created=None, **kwargs):
     :param kwargs: Additional keyword arguments passed from the signal.
     :return: None
     """
-    update_order_price.delay(instance.order.pk)
+    update_order_prices(Order.objects.filter(pk=instance.order_id))
+
+
+def promo_code_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of promo codes.
+    Invalidates the cached promo codes, see get_promo_code.
+    """
+    invalidate_cache_version('promo_code')
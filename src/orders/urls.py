@@ -5,4 +5,5 @@ from .views import *
 urlpatterns = [
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('checkout/create_order/', CreateOrderView.as_view(), name='create_order'),
+    path('sales-report/', SalesReportView.as_view(), name='sales_report'),
 ]
@@ -1,14 +1,25 @@
+import uuid
+from typing import List
+
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.views import View
 from django.views.generic import CreateView
 
 from basket.models import ProductInBasket
 from orders.forms import CreateOrderForm
-from orders.models import PromoCode
-from orders.services import add_products_to_the_order_list
+from orders.forms import SalesReportForm
+from orders.services import PromoCodeUnavailable
+from orders.services import format_sales_report
+from orders.services import get_sales_report
+from orders.services import place_order
+from stock.services import reserve_stock
 
 
 class CheckoutView(CreateView):
@@ -17,31 +28,53 @@ class CheckoutView(CreateView):
 
     This view uses a form to collect order details from the user. If the form is valid and the
     shopping cart is not empty, it creates a new order and adds the products from the shopping
-    cart to the order list.
+    cart to the order list. The form carries a checkout key, so a repeated submit leads to the
+    order created by the first one.
     """
     form_class = CreateOrderForm
     template_name = 'orders/checkout.html'
     success_url = 'create_order/'
 
-    def form_valid(self, form):
+    def report_missing_stock(self, products: List[ProductInBasket]) -> None:
+        titles = ', '.join(str(item.product) for item in products)
+        messages.error(self.request, _('Not enough stock for %(products)s') % {'products': titles})
+
+    def get_initial(self):
+        return {**super().get_initial(), 'checkout_key': uuid.uuid4().hex}
+
+    def get(self, request, *args, **kwargs):
         """
-        Check the correctness of the order and create it if possible.
+        Hold the units of the products in the basket while the form is filled in.
         """
-        user_authenticated = self.request.session['user_authenticated']
+        user_authenticated = request.session.get('user_authenticated')
         products_in_basket = ProductInBasket.get_products_from_user_basket(user_authenticated)
-        if len(products_in_basket) > 0:
-            self.object = form.save()
-            if form.data['promo_code']:
-                self.object.promo_code = PromoCode.get_promo_code(title=form.data['promo_code'])
-            if self.request.user.is_authenticated:
-                self.object.user = self.request.user
-            self.object.save()
-        else:
+        missing = reserve_stock(user_authenticated, products_in_basket)
+        if missing:
+            self.report_missing_stock(missing)
+        return super().get(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        """
+        Check the correctness of the order and create it if possible, see place_order.
+        """
+        order = form.save(commit=False)
+        order.promo_code = form.cleaned_data['promo_code']
+        if self.request.user.is_authenticated:
+            order.user = self.request.user
+        order.checkout_key = form.cleaned_data['checkout_key'] or None
+
+        try:
+            self.object, missing = place_order(order, self.request.session['user_authenticated'])
+        except PromoCodeUnavailable:
+            messages.error(self.request, _('Promo code is not active'))
+            return HttpResponseRedirect(self.request.path_info)
+        if missing:
+            self.report_missing_stock(missing)
+            return HttpResponseRedirect(self.request.path_info)
+        if self.object is None:
             messages.error(self.request, _('Empty basket. First you need to add a product'))
             return HttpResponseRedirect(self.request.path_info)
 
-        add_products_to_the_order_list(products_in_basket, order_id=self.object.pk)
-
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -61,3 +94,29 @@ class CreateOrderView(View):
         :return: A rendered template with a confirmation message.
         """
         return render(request, self.template_name)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class SalesReportView(View):
+    """
+    A view for downloading a sales report in CSV or JSON lines, for staff only.
+
+    Pass start and end as YYYY-MM-DD, group_by as day, product or category and format as csv
+    or jsonl. The report reads the daily rollup only, the periodic update_daily_sales task rolls
+    up the days that changed, so the sales of the last hour may be missing.
+    """
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/jsonl'}
+
+    def get(self, request):
+        form = SalesReportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(form.errors, status=400)
+        start, end = form.cleaned_data['start'], form.cleaned_data['end']
+        group_by, output_format = form.cleaned_data['group_by'], form.cleaned_data['format']
+
+        response = StreamingHttpResponse(
+            format_sales_report(get_sales_report(start, end, group_by), group_by, output_format),
+            content_type=self.content_types[output_format])
+        response['Content-Disposition'] = \
+            f'attachment; filename="sales-by-{group_by}-{start}-{end}.{output_format}"'
+        return response
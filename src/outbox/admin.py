@@ -0,0 +1,22 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'to', 'status', 'attempts', 'send_after', 'sent']
+    list_filter = ['status']
+    search_fields = ['subject']
+    readonly_fields = ['attempts', 'last_error', 'created', 'claimed', 'sent']
+    actions = ['retry']
+
+    @admin.action(description='Send again')
+    def retry(self, request, queryset):
+        from outbox.tasks import send_outbox
+
+        # The emails being sent are released by the outbox after OUTBOX_SENDING_TIMEOUT
+        queryset.exclude(status__in=[OutgoingEmail.SENDING, OutgoingEmail.SENT]).update(
+            status=OutgoingEmail.PENDING, attempts=0, send_after=timezone.now())
+        send_outbox.delay()
@@ -0,0 +1,23 @@
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError
+
+from outbox.services import queue_emails
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    Email backend that stores the messages in the outbox instead of sending them, so a slow
+    mail server does not hold the request. The send_outbox task sends them with the
+    OUTBOX_DELIVERY_BACKEND and retries the failed ones.
+
+    Example:
+        EMAIL_BACKEND = 'outbox.backends.OutboxEmailBackend'
+    """
+
+    def send_messages(self, email_messages):
+        try:
+            return queue_emails(email_messages)
+        except DatabaseError:
+            if not self.fail_silently:
+                raise
+            return 0
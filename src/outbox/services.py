@@ -0,0 +1,228 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPException
+from typing import Iterable
+from typing import List
+from typing import Union
+
+from django.core.mail import EmailMessage
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from online_store.settings import OUTBOX_BATCH_SIZE
+from online_store.settings import OUTBOX_DELIVERY_BACKEND
+from online_store.settings import OUTBOX_MAX_ATTEMPTS
+from online_store.settings import OUTBOX_RETRY_BACKOFF
+from online_store.settings import OUTBOX_SENDING_TIMEOUT
+from outbox.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def notify_worker() -> None:
+    """
+    Asks the worker to send the pending emails. If the broker is down, the emails are sent
+    by the periodic task.
+    """
+    from outbox.tasks import send_outbox
+
+    try:
+        send_outbox.delay()
+    except OperationalError as error:
+        logger.warning(f'The outbox worker is not notified: {error}')
+
+
+def queue_emails(email_messages: Iterable[EmailMessage]) -> int:
+    """
+    Stores the messages in the outbox and asks the worker to send them once the transaction
+    is committed. Attachments are not kept.
+
+    :param email_messages: The messages to send.
+    :return: The number of queued messages.
+    """
+    emails = []
+    for message in email_messages:
+        if message.attachments:
+            logger.warning(f'The attachments of the email {message.subject} are not sent')
+        html_body = ''
+        for content, mimetype in getattr(message, 'alternatives', ()):
+            if mimetype == 'text/html':
+                html_body = content
+        emails.append(OutgoingEmail(subject=message.subject,
+                                    body=message.body,
+                                    html_body=html_body,
+                                    from_email=message.from_email,
+                                    to=list(message.to),
+                                    cc=list(message.cc),
+                                    bcc=list(message.bcc),
+                                    reply_to=list(message.reply_to),
+                                    headers=dict(message.extra_headers)))
+    if not emails:
+        return 0
+
+    OutgoingEmail.objects.bulk_create(emails)
+    transaction.on_commit(notify_worker)
+    return len(emails)
+
+
+def get_email_message(email: OutgoingEmail, connection: BaseEmailBackend) -> EmailMessage:
+    """
+    Builds the message of an email of the outbox.
+
+    :param email: The email of the outbox.
+    :param connection: The connection the message is sent over.
+    :return: The message.
+    """
+    message = EmailMultiAlternatives(subject=email.subject,
+                                     body=email.body,
+                                     from_email=email.from_email,
+                                     to=email.to,
+                                     cc=email.cc,
+                                     bcc=email.bcc,
+                                     reply_to=email.reply_to,
+                                     headers=email.headers,
+                                     connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def get_delivery_connection() -> BaseEmailBackend:
+    """
+    Returns a connection of the backend that delivers the emails, see OUTBOX_DELIVERY_BACKEND.
+    """
+    return get_connection(OUTBOX_DELIVERY_BACKEND, fail_silently=False)
+
+
+def schedule_retry(email: OutgoingEmail, error: Union[Exception, str]) -> None:
+    """
+    Schedules the email to be sent again with an exponential backoff, or marks it as failed
+    after OUTBOX_MAX_ATTEMPTS attempts.
+
+    :param email: The email that was not sent.
+    :param error: The error of the attempt.
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = OutgoingEmail.FAILED
+        # Not an error, the error emails to the admins would go through the failing outbox too
+        logger.warning(f'Email {email.pk} is not sent after {email.attempts} attempts: {error}')
+    else:
+        delay = OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+        email.status = OutgoingEmail.PENDING
+        email.send_after = timezone.now() + timedelta(seconds=delay)
+        logger.warning(f'Email {email.pk} is not sent, retry in {delay} s: {error}')
+
+
+def release_stale_emails() -> int:
+    """
+    Schedules again the emails taken for sending more than OUTBOX_SENDING_TIMEOUT seconds ago,
+    the worker that took them stopped before it marked them. Such an email may have been sent,
+    so it can be delivered twice, but it is not lost.
+
+    :return: The number of released emails.
+    """
+    with transaction.atomic():
+        emails: List[OutgoingEmail] = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                status=OutgoingEmail.SENDING,
+                claimed__lte=timezone.now() - timedelta(seconds=OUTBOX_SENDING_TIMEOUT)))
+        for email in emails:
+            schedule_retry(email, 'The worker stopped while sending the email')
+        OutgoingEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'last_error', 'send_after'])
+    return len(emails)
+
+
+def claim_outbox_batch(batch_size: int = OUTBOX_BATCH_SIZE) -> List[OutgoingEmail]:
+    """
+    Takes the pending emails that are due for sending: marks them as being sent and commits,
+    so concurrent workers skip them.
+
+    :param batch_size: The maximum number of emails to take.
+    :return: The taken emails.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        emails: List[OutgoingEmail] = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                status=OutgoingEmail.PENDING,
+                send_after__lte=now).order_by('send_after')[:batch_size])
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status=OutgoingEmail.SENDING, claimed=now)
+    return emails
+
+
+def reopen_connection(connection: BaseEmailBackend) -> None:
+    """
+    Closes the connection of the delivery backend and opens it again. If it is not opened,
+    the backend opens a connection per message.
+
+    :param connection: The connection of the delivery backend.
+    """
+    connection.close()
+    try:
+        connection.open()
+    except (SMTPException, OSError) as error:
+        logger.warning(f'The connection of the outbox is not opened again: {error}')
+
+
+def send_outbox_batch(connection: BaseEmailBackend, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Sends the pending emails that are due over one connection.
+
+    The emails are taken for sending first, see claim_outbox_batch, and each of them is marked
+    as sent or scheduled for a retry right after its attempt. No transaction is open while the
+    messages are sent, so a crash after a message is sent does not roll back its mark.
+
+    :param connection: The open connection of the delivery backend.
+    :param batch_size: The maximum number of emails to send.
+    :return: The number of emails attempted.
+    """
+    emails = claim_outbox_batch(batch_size)
+    for email in emails:
+        try:
+            connection.send_messages([get_email_message(email, connection)])
+        except (SMTPException, OSError) as error:
+            schedule_retry(email, error)
+            # The connection may be broken, the next email is sent over a new one
+            reopen_connection(connection)
+        except Exception as error:
+            # The email is not left taken until release_stale_emails schedules it
+            schedule_retry(email, error)
+        else:
+            email.status = OutgoingEmail.SENT
+            email.sent = timezone.now()
+            email.attempts += 1
+            email.last_error = ''
+        email.save(update_fields=['status', 'attempts', 'last_error', 'send_after', 'sent'])
+    return len(emails)
+
+
+def send_outbox_emails(connection: BaseEmailBackend = None,
+                       batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Sends the pending emails that are due in batches over a single connection, it is opened
+    once and closed after the last batch.
+
+    :param connection: The connection of the delivery backend, a new one by default.
+    :param batch_size: The number of emails per batch.
+    :return: The number of emails attempted.
+    """
+    release_stale_emails()
+    connection = connection or get_delivery_connection()
+    connection.open()
+    total = 0
+    try:
+        while True:
+            count = send_outbox_batch(connection, batch_size)
+            total += count
+            if count < batch_size:
+                return total
+    finally:
+        connection.close()
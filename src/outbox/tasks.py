@@ -0,0 +1,14 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+
+@shared_task(base=Singleton)
+def send_outbox() -> int:
+    """
+    Sends the pending emails of the outbox.
+
+    :return: The number of emails attempted.
+    """
+    from outbox import services
+
+    return services.send_outbox_emails()
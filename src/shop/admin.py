@@ -60,7 +60,7 @@ class ProductAdminLevel(NestedModelAdmin, TranslationAdmin):
     model = Product
     prepopulated_fields = {'slug': ('title',)}
     list_display = (
-        'id', 'title', 'price', 'price_now', 'discount', 'count_sale',
+        'id', 'title', 'price', 'price_now', 'discount', 'count_sale', 'popularity',
         'available', 'manufacturer', 'created_at',
         'category')
     list_display_links = ('id', 'title')
@@ -68,11 +68,22 @@ class ProductAdminLevel(NestedModelAdmin, TranslationAdmin):
     search_fields = ('title', 'id')
     list_editable = ('discount',)
     list_filter = ('category', 'available', 'manufacturer')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'count_sale', 'popularity')
     save_as = True
     save_on_top = True
     inlines = [AttributeColorInlineLevelOne]
 
+    def save_model(self, request, obj, form, change):
+        """
+        Saves a changed product without its sales counters, which checkouts update in the
+        meantime, see record_product_sales.
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name not in ('count_sale', 'popularity')])
+
 
 class ProductAdminForm(forms.ModelForm):
     description = forms.CharField(widget=CKEditorUploadingWidget())
@@ -155,6 +166,11 @@ class ReviewsAdmin(admin.ModelAdmin):
     list_display = [field.name for field in Reviews._meta.fields]
 
 
+@admin.register(RatingHistogram)
+class RatingHistogramAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in RatingHistogram._meta.fields]
+
+
 @admin.register(DefaultVarieties)
 class DefaultVarietiesAdmin(admin.ModelAdmin):
     list_display = [field.name for field in DefaultVarieties._meta.fields]
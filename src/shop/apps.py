@@ -7,8 +7,66 @@ class ShopConfig(AppConfig):
     verbose_name = 'shop'
 
     def ready(self):
+        from cachalot.signals import post_invalidation
+        from django.db.models.signals import m2m_changed
+        from django.db.models.signals import post_delete
         from django.db.models.signals import post_save
+        from django.db.models.signals import pre_save
+        from online_store.cache_policy import cachalot_invalidation
+        from shop.models import AttributeColor
+        from shop.models import AttributeColorImage
+        from shop.models import AttributeSize
+        from shop.models import Banner
+        from shop.models import Category
+        from shop.models import Color
+        from shop.models import DefaultVarieties
+        from shop.models import Manufacturer
+        from shop.models import Product
         from shop.models import Reviews
+        from shop.models import Size
+        from shop.models import Tag
+        from shop.signals import banner_registry_changed
+        from shop.signals import image_pre_save
+        from shop.signals import image_saved
+        from shop.signals import listing_changed
+        from shop.signals import product_rails_changed
+        from shop.signals import product_stamp_changed
+        from shop.signals import rating_histogram_post_delete
+        from shop.signals import rating_histogram_post_save
+        from shop.signals import rating_histogram_pre_save
         from shop.signals import rating_in_product_post_save
+        from shop.signals import variant_changed
 
         post_save.connect(rating_in_product_post_save, sender=Reviews)
+        pre_save.connect(rating_histogram_pre_save, sender=Reviews)
+        post_save.connect(rating_histogram_post_save, sender=Reviews)
+        post_delete.connect(rating_histogram_post_delete, sender=Reviews)
+
+        for model in (Banner, Tag):
+            post_save.connect(banner_registry_changed, sender=model)
+            post_delete.connect(banner_registry_changed, sender=model)
+
+        for model in (Product, DefaultVarieties):
+            post_save.connect(product_rails_changed, sender=model)
+            post_delete.connect(product_rails_changed, sender=model)
+        m2m_changed.connect(product_rails_changed, sender=Product.tags.through)
+
+        for model in (Product, Category, Tag, Manufacturer, Color, Size, AttributeColor,
+                      AttributeSize, DefaultVarieties):
+            post_save.connect(listing_changed, sender=model)
+            post_delete.connect(listing_changed, sender=model)
+        m2m_changed.connect(listing_changed, sender=Product.tags.through)
+
+        for model in (Product, Category):
+            post_save.connect(product_stamp_changed, sender=model)
+            post_delete.connect(product_stamp_changed, sender=model)
+
+        for model in (AttributeColor, AttributeSize):
+            post_save.connect(variant_changed, sender=model)
+            post_delete.connect(variant_changed, sender=model)
+
+        for model in (AttributeColorImage, Category, Manufacturer, Tag):
+            pre_save.connect(image_pre_save, sender=model)
+            post_save.connect(image_saved, sender=model)
+
+        post_invalidation.connect(cachalot_invalidation)
@@ -2,6 +2,8 @@ from django import forms
 from django.forms import ModelForm
 from django.forms.models import BaseInlineFormSet
 
+from online_store.settings import CATALOG_FEED_FORMATS
+
 from .models import Reviews
 
 
@@ -39,3 +41,17 @@ class ReviewsForm(ModelForm):
     class Meta:
         model = Reviews
         fields = ('rating', 'text')
+
+
+class CatalogFeedForm(forms.Form):
+    """
+    The parameters of a catalog feed, the full feed in JSON lines by default.
+    """
+    format = forms.ChoiceField(choices=[(name, name) for name in CATALOG_FEED_FORMATS],
+                               required=False)
+    since = forms.DateTimeField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['format'] = cleaned_data.get('format') or CATALOG_FEED_FORMATS[0]
+        return cleaned_data
@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from shop.models import Product
+from shop.serializers import ProductSerializer
+from shop.serializers import get_product_readers
+from shop.serializers import select_product_values
+from shop.serializers import serialize_product_values
+
+
+class Command(BaseCommand):
+    help = ('Compares the serializations per second of ProductSerializer and of the fast path '
+            'from values() rows, and checks that both render the same JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000, help='Number of products')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of runs of each serializer, the best one is reported')
+        parser.add_argument('--fields', default='',
+                            help='The fields to serialize separated by commas, all by default')
+
+    def create_products(self, number: int) -> None:
+        """
+        Adds products until there are enough of them, in the transaction rolled back at the end.
+        """
+        missing = number - Product.objects.count()
+        category_id = Product.objects.values_list('category', flat=True).first()
+        Product.objects.bulk_create(
+            [Product(title=f'Benchmark product {number}', slug=f'benchmark-{number}',
+                     description='Benchmark', param='', price=1000, discount=10, price_now=900,
+                     category_id=category_id, currency=None, country=None, manufacturer=None)
+             for number in range(missing)], batch_size=1000)
+
+    def measure(self, serialize, repeat: int):
+        """
+        Runs a serializer several times.
+
+        :return: The best duration in seconds and the rendered JSON.
+        """
+        durations = []
+        for _x in range(repeat):
+            started_at = time.perf_counter()
+            data = serialize()
+            durations.append(time.perf_counter() - started_at)
+        return min(durations), JSONRenderer().render(data)
+
+    def handle(self, *args, **options):
+        fields = [name for name in options['fields'].split(',') if name] or \
+            ProductSerializer.Meta.fields
+        with transaction.atomic():
+            self.create_products(options['number'])
+            products = Product.objects.order_by('pk')[:options['number']]
+            count = len(products.values_list('pk'))
+
+            def serialize_instances():
+                only = ProductSerializer.get_only_fields(fields)
+                queryset = Product.objects.order_by('pk').only(*only)
+                if any(field.startswith('category__') for field in only):
+                    queryset = queryset.select_related('category')
+                return ProductSerializer(queryset[:options['number']], many=True,
+                                         fields=fields).data
+
+            def serialize_values():
+                columns, readers = get_product_readers(fields)
+                return serialize_product_values(select_product_values(products, columns),
+                                                readers)
+
+            serializer_time, serializer_json = self.measure(serialize_instances,
+                                                            options['repeat'])
+            values_time, values_json = self.measure(serialize_values, options['repeat'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{count} products, fields: {", ".join(fields)}')
+        self.stdout.write(f'ProductSerializer: {count / serializer_time:.0f} products/s')
+        self.stdout.write(f'values() fast path: {count / values_time:.0f} products/s, '
+                          f'speedup x{serializer_time / values_time:.2f}')
+        if serializer_json != values_json:
+            raise CommandError('The JSON of the fast path differs from ProductSerializer')
@@ -0,0 +1,81 @@
+import random
+import timeit
+from decimal import Decimal
+
+from django import template
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template import Context
+from django.template import Engine
+
+register = template.Library()
+
+
+@register.simple_tag()
+def get_legacy_fa_star(rating: int = 5) -> str:
+    """
+    Draws product rating stars by string concatenation, as it was done before the lookup table.
+
+    :param rating: The rating to display, from 0 to 5.
+    :return: The HTML for the star icons to display the rating.
+    """
+    rating = float(rating)
+    html_stars = ""
+    for _x in range(5):
+        if rating >= 0.5:
+            html_stars += '<i class="fas fa-star text-primary mr-1"></i>'
+        elif rating > 0.3:
+            html_stars += '<i class="fas fa-star-half-alt text-primary mr-1"></i>'
+        else:
+            html_stars += '<i class="far fa-star text-primary mr-1"></i>'
+        rating -= 1
+    return html_stars
+
+
+def get_average_rating() -> Decimal:
+    """
+    Makes up the average rating of a product with a few reviews, like 4.33.
+
+    :return: The average rounded to two decimal places.
+    """
+    ratings = [random.randint(1, 5) for _x in range(random.randint(1, 30))]
+    return (Decimal(sum(ratings)) / len(ratings)).quantize(Decimal('0.01'))
+
+
+LEGACY_TEMPLATE = """{% load bench_rating_stars %}{% for item in items %}
+<div>{% get_legacy_fa_star item.rating as star %}{{ star|safe }}</div>{% endfor %}"""
+
+TABLE_TEMPLATE = """{% load shop_tags %}{% for item in items %}
+<div>{{ item.rating|rating_stars }}</div>{% endfor %}"""
+
+
+class Command(BaseCommand):
+    help = 'Compares star rating rendering by string concatenation and by the lookup table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200,
+                            help='Number of renders for each page')
+
+    def handle(self, *args, **options):
+        engine = Engine(libraries={
+            'bench_rating_stars': 'shop.management.commands.bench_rating_stars',
+            'shop_tags': 'shop.templatetags.shop_tags',
+        })
+        legacy = engine.from_string(LEGACY_TEMPLATE)
+        table = engine.from_string(TABLE_TEMPLATE)
+
+        # Listings show the averages of the reviews, a detail page the ratings of the reviews
+        pages = (
+            ('9-card listing', [get_average_rating() for _x in range(9)]),
+            ('200-review detail page', [random.randint(1, 5) for _x in range(200)]),
+        )
+        for title, ratings in pages:
+            context = Context({'items': [{'rating': rating} for rating in ratings]})
+            if legacy.render(context) != table.render(context):
+                raise CommandError(f'{title}: the lookup table draws other stars')
+            legacy_time = timeit.timeit(lambda: legacy.render(context), number=options['number'])
+            table_time = timeit.timeit(lambda: table.render(context), number=options['number'])
+            self.stdout.write(
+                f"{title}: concatenation {legacy_time * 1000 / options['number']:.3f} ms, "
+                f"lookup table {table_time * 1000 / options['number']:.3f} ms, "
+                f"speedup x{legacy_time / table_time:.2f}")
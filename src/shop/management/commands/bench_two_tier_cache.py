@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.cache.backends.redis import RedisCache
+from django.core.management.base import BaseCommand
+
+from online_store.settings import CACHES
+from online_store.two_tier_cache import TwoTierCache
+
+HOT_KEYS = ('categories', 'delivery', 'currency', 'colors', 'sizes', 'banner_registry:en',
+            'newsletter_form', 'product_rail_version', 'listing_version', 'brands')
+
+
+class Command(BaseCommand):
+    help = 'Compares the latency of reading hot keys per request from Redis and from TwoTierCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Number of simulated requests')
+        parser.add_argument('--keys', type=int, default=len(HOT_KEYS),
+                            help='Number of hot keys read by each request')
+
+    def measure(self, cache, keys, requests):
+        latencies = []
+        for _x in range(requests):
+            started_at = time.perf_counter()
+            for key in keys:
+                cache.get(key)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+        latencies.sort()
+        return statistics.mean(latencies), latencies[int(len(latencies) * 0.95)]
+
+    def handle(self, *args, **options):
+        location = CACHES['default']['LOCATION']
+        params = {'OPTIONS': CACHES['default'].get('OPTIONS', {}), 'KEY_PREFIX': 'bench'}
+        redis_cache = RedisCache(location, params)
+        two_tier_cache = TwoTierCache(location, {**params, 'INVALIDATION_CHANNEL': 'bench'})
+
+        keys = [HOT_KEYS[number % len(HOT_KEYS)] + f':{number}'
+                for number in range(options['keys'])]
+        redis_cache.set_many({key: list(range(50)) for key in keys}, 60)
+
+        results = (('Redis', redis_cache), ('TwoTierCache', two_tier_cache))
+        for title, cache in results:
+            mean, p95 = self.measure(cache, keys, options['requests'])
+            self.stdout.write(f'{title}: {mean:.3f} ms per request, p95 {p95:.3f} ms')
+        redis_cache.delete_many(keys)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from online_store.cache_policy import table_stats
+
+
+class Command(BaseCommand):
+    help = ('Shows the cache policy and the hits, misses and invalidations of the query cache '
+            'per table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', choices=('cachalot', 'read_model', 'never'),
+                            help='Show only the tables with this cache policy')
+        parser.add_argument('--reset', action='store_true', help='Reset the counters')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            table_stats.reset()
+            self.stdout.write('The counters are reset')
+            return
+
+        self.stdout.write(f"{'table':<32}{'policy':<12}{'hits':>10}{'misses':>10}"
+                          f"{'invalidations':>15}{'hit rate':>10}")
+        for table, stats in table_stats.get().items():
+            if options['policy'] and stats['policy'] != options['policy']:
+                continue
+            lookups = stats['hit'] + stats['miss']
+            hit_rate = f"{stats['hit'] * 100 / lookups:.1f}%" if lookups else '-'
+            self.stdout.write(f"{table:<32}{stats['policy']:<12}{stats['hit']:>10}"
+                              f"{stats['miss']:>10}{stats['invalidation']:>15}{hit_rate:>10}")
@@ -0,0 +1,45 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from online_store.cache_stats import InstrumentedCache
+
+
+class Command(BaseCommand):
+    help = 'Shows the hits, misses, sets, deletes and evictions of a cache per key namespace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help='The alias of the cache')
+        parser.add_argument('--keys', action='store_true',
+                            help='Scan the keys to count them and their memory per namespace')
+        parser.add_argument('--json', action='store_true', help='Print the statistics in JSON')
+        parser.add_argument('--reset', action='store_true', help='Reset the counters')
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        if not isinstance(cache, InstrumentedCache):
+            raise CommandError(f"The cache '{options['alias']}' does not use InstrumentedCache")
+
+        if options['reset']:
+            cache.reset_stats()
+            self.stdout.write('The counters are reset')
+            return
+
+        stats = cache.get_stats(keys=options['keys'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        for name, value in stats.items():
+            if name != 'namespaces':
+                self.stdout.write(f'{name}: {value}')
+
+        columns = ('hit', 'miss', 'set', 'delete', 'eviction', 'hit_rate')
+        if options['keys']:
+            columns += ('keys', 'memory')
+        self.stdout.write(f"{'namespace':<24}" + ''.join(f'{column:>10}' for column in columns))
+        for namespace, counts in sorted(stats['namespaces'].items()):
+            values = ('-' if counts.get(column) is None else counts[column] for column in columns)
+            self.stdout.write(f'{namespace:<24}' + ''.join(f'{value:>10}' for value in values))
@@ -0,0 +1,74 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+HOT_PATHS = ('/en/shop/', '/en/search/?text=a', '/en/search/autocomplete/?text=sh',
+             '/en/basket/count/')
+
+
+class Command(BaseCommand):
+    help = ('Measures the throughput of a running server on the hot read paths, '
+            'to compare the WSGI and the ASGI deployments per core')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='The address of the server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--paths', nargs='+', default=HOT_PATHS,
+                            help='The paths requested in turn by each client')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Number of clients sending requests at the same time')
+        parser.add_argument('--duration', type=float, default=10, help='Duration in seconds')
+        parser.add_argument('--cores', type=int, default=1,
+                            help='Number of cores given to the server')
+
+    def run_client(self, address, paths, deadline, latencies, errors):
+        """
+        Sends requests over one keep-alive connection until the deadline.
+        """
+        connection = http.client.HTTPConnection(address.hostname, address.port or 80, timeout=30)
+        number = 0
+        while time.monotonic() < deadline:
+            path = paths[number % len(paths)]
+            number += 1
+            started_at = time.perf_counter()
+            try:
+                # The site redirects to https unless the proxy says the request was secure
+                connection.request('GET', path, headers={'X-Forwarded-Proto': 'https'})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors.append(path)
+                connection.close()
+                continue
+            if response.status >= 400:
+                errors.append(path)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+        connection.close()
+
+    def handle(self, *args, **options):
+        address = urlsplit(options['url'])
+        latencies, errors = [], []
+        deadline = time.monotonic() + options['duration']
+        clients = [threading.Thread(target=self.run_client,
+                                    args=(address, options['paths'], deadline, latencies, errors))
+                   for _x in range(options['concurrency'])]
+        started_at = time.monotonic()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started_at
+
+        if not latencies:
+            self.stderr.write('No responses')
+            return
+        latencies.sort()
+        throughput = len(latencies) / elapsed
+        self.stdout.write(f'{len(latencies)} requests in {elapsed:.1f} s, {len(errors)} errors')
+        self.stdout.write(f'{throughput:.1f} requests/s, '
+                          f'{throughput / options["cores"]:.1f} requests/s per core')
+        self.stdout.write(f'latency mean {statistics.mean(latencies):.1f} ms, '
+                          f'p95 {latencies[int(len(latencies) * 0.95)]:.1f} ms')
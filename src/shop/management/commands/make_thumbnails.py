@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from online_store.thumbnails import has_thumbnails
+from online_store.thumbnails import is_thumbnail_name
+from online_store.thumbnails import make_thumbnails
+from online_store.thumbnails import record_thumbnails
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+
+class Command(BaseCommand):
+    help = ('Generates the missing derivatives of the images already uploaded to the media '
+            'storage, in a pool of processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help='Number of processes resizing the images')
+        parser.add_argument('--force', action='store_true',
+                            help='Generates the derivatives of the images that already have them')
+
+    def find_images(self, force: bool):
+        """
+        Walks the media storage for the originals that need derivatives.
+        """
+        root = default_storage.location
+        for directory, _directories, files in os.walk(root):
+            for file in files:
+                name = os.path.relpath(os.path.join(directory, file), root).replace(os.sep, '/')
+                if not name.lower().endswith(IMAGE_EXTENSIONS) or is_thumbnail_name(name):
+                    continue
+                if force or not has_thumbnails(name):
+                    yield name
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        names = list(self.find_images(options['force']))
+        saved = 0
+        # The images are read and resized by the processes, the Django setup is inherited
+        with ProcessPoolExecutor(max_workers=options['processes']) as executor:
+            for name, thumbnails in zip(names, executor.map(make_thumbnails, names,
+                                                            chunksize=16)):
+                record_thumbnails(name, thumbnails)
+                saved += len(thumbnails)
+        self.stdout.write(f'{saved} derivatives of {len(names)} images saved in '
+                          f'{time.monotonic() - started_at:.2f} s')
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_rating_histograms(apps, schema_editor):
+    Reviews = apps.get_model('shop', 'Reviews')
+    RatingHistogram = apps.get_model('shop', 'RatingHistogram')
+
+    histograms = {}
+    for row in Reviews.objects.values('product_id', 'rating').annotate(
+            cnt=models.Count('pk')).order_by():
+        if not row['rating']:
+            continue
+        histogram = histograms.setdefault(row['product_id'],
+                                          RatingHistogram(product_id=row['product_id']))
+        setattr(histogram, f"rating_{row['rating']}", row['cnt'])
+    RatingHistogram.objects.bulk_create(histograms.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_defaultvarieties'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_histogram', to='shop.product')),
+            ],
+            options={
+                'verbose_name': 'Rating histogram',
+                'verbose_name_plural': 'Rating histograms',
+            },
+        ),
+        migrations.RunPython(fill_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:57
+
+import time
+
+from django.db import migrations, models
+
+
+def fill_popularity(apps, schema_editor):
+    """
+    Keeps the order of the products by the sales counted so far until the ranks are rebuilt
+    from the orders with rebuild_sales_ranks, see get_popularity_weight.
+    """
+    Product = apps.get_model('shop', 'Product')
+    weight = 2 ** ((time.time() - 1672531200) / (14 * 24 * 60 * 60))
+    Product.objects.update(popularity=models.F('count_sale') * weight)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_ratinghistogram'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['-available', '-popularity', '-created_at', 'price'], 'verbose_name': 'Product', 'verbose_name_plural': 'Products'},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'popularity'], name='shop_product_popularity_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_product_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attributesize',
+            name='quantity',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models.functions import Log
+from django.db.models.functions import Power
+
+
+def to_log2(apps, schema_editor):
+    """
+    Stores the popularity as log2(1 + the sum of the weights), see get_popularity_log_weight.
+    """
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.filter(popularity__gt=0).update(
+        popularity=Log(2, models.F('popularity') + 1))
+
+
+def from_log2(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.filter(popularity__gt=0).update(
+        popularity=Power(2, models.F('popularity')) - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_log2, from_log2),
+    ]
@@ -1,4 +1,5 @@
 import logging
+from typing import List
 
 from django.db import models
 from django.db.models import Count
@@ -199,7 +200,10 @@ class Product(models.Model):
     vendor_code = models.CharField(max_length=50, blank=True)
     global_id = models.CharField(max_length=50, blank=True)
     count_sale = models.IntegerField(default=0)
+    popularity = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also set when the variants or the availability change, for the delta catalog feeds
+    updated_at = models.DateTimeField(auto_now=True)
     currency = models.ForeignKey('Currency', on_delete=models.SET_NULL, default=1, null=True)
     category = TreeForeignKey(Category, on_delete=models.PROTECT, null=True)
     country = models.ForeignKey('Country', on_delete=models.SET_NULL, null=True, default=1,
@@ -213,7 +217,11 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
-        ordering = ['-available', '-count_sale', '-created_at', 'price']
+        ordering = ['-available', '-popularity', '-created_at', 'price']
+        indexes = [
+            models.Index(fields=['available', 'popularity'], name='shop_product_popularity_idx'),
+            models.Index(fields=['updated_at'], name='shop_product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -339,8 +347,8 @@ class Product(models.Model):
         :raises Product.DoesNotExist: If no product is found with the specified slug
         """
         try:
-            return Product.objects.select_related('category', 'country', 'manufacturer').get(
-                slug=slug)
+            return Product.objects.select_related('category', 'country', 'manufacturer',
+                                                  'rating_histogram').get(slug=slug)
         except Product.DoesNotExist as error:
             logger.error(f"Error getting product with slug {slug}: {error}")
             raise error
@@ -475,6 +483,8 @@ class AttributeSize(models.Model):
     size = models.ForeignKey('Size', on_delete=models.CASCADE,
                              related_name="size", blank=True, default=None, null=True)
     available = models.BooleanField(default=True)
+    # The units in stock, the stock of sizes without a quantity is not tracked
+    quantity = models.PositiveIntegerField(blank=True, null=True, default=None)
 
     class Meta:
         verbose_name = 'AttributeSize'
@@ -487,7 +497,11 @@ class AttributeSize(models.Model):
         """
         Changes the color availability when
         the availability of its sizes is changed.
+        The availability of a size with a quantity follows the quantity.
         """
+        if self.quantity is not None:
+            self.available = self.quantity > 0
+
         # Check if the current color is set to unavailable and the main
         # product is still available
         if not self.available and self.product.available:
@@ -606,6 +620,81 @@ class Reviews(models.Model):
         return str(self.rating)
 
 
+class RatingHistogram(models.Model):
+    """
+    Number of reviews per star for a product.
+
+    The counters are changed incrementally when a review is created, updated or deleted, so the
+    distribution and the average rating can be shown without scanning `Reviews`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE,
+                                   related_name='rating_histogram')
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Rating histogram'
+        verbose_name_plural = 'Rating histograms'
+
+    def __str__(self):
+        return str(self.product_id)
+
+    def get_counts(self) -> List[int]:
+        """
+        Returns the number of reviews for each star, from 1 to 5.
+
+        :return: A list of five review counters.
+        """
+        return [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+
+    def get_count(self) -> int:
+        """
+        Returns the total number of reviews.
+
+        :return: The total number of reviews.
+        """
+        return sum(self.get_counts())
+
+    def get_average(self) -> float:
+        """
+        Calculates the average rating from the histogram.
+
+        :return: The average rating rounded to one decimal place, or 0 if there are no reviews.
+        """
+        count = self.get_count()
+        if not count:
+            return 0
+        total = sum(stars * cnt for stars, cnt in enumerate(self.get_counts(), start=1))
+        return round(total / count, 1)
+
+    def get_distribution(self) -> List[dict]:
+        """
+        Returns the rating distribution, starting from 5 stars.
+
+        :return: A list of dictionaries with the number of stars, the number of reviews and
+            the percentage of reviews.
+        """
+        count = self.get_count()
+        return [{'stars': stars,
+                 'count': cnt,
+                 'percent': round(cnt * 100 / count) if count else 0}
+                for stars, cnt in reversed(list(enumerate(self.get_counts(), start=1)))]
+
+    @staticmethod
+    def get_histogram(product_id: int) -> 'RatingHistogram':
+        """
+        Gets the rating histogram of the product, creating an empty one if it does not exist.
+
+        :param product_id: The ID of the product.
+        :return: The rating histogram of the product.
+        """
+        histogram, _created = RatingHistogram.objects.get_or_create(product_id=product_id)
+        return histogram
+
+
 class DefaultVarieties(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE,
                                    related_name='default_varieties')
@@ -1,10 +1,166 @@
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+from django.db.models import QuerySet
+from django.utils.translation import get_language
+from modeltranslation.fields import NONE
+from modeltranslation.fields import TranslationFieldDescriptor
+from modeltranslation.utils import build_localized_fieldname
+from modeltranslation.utils import fallbacks_enabled
+from modeltranslation.utils import resolution_order
 from rest_framework import serializers
 
 from shop.models import Product
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    """
+    Serializes products with the fields chosen by the client.
+
+    Pass the names of the fields in the 'fields' argument to serialize only them, see
+    get_only_fields to select only their columns.
+    """
+    category_title = serializers.CharField(source='category.title', read_only=True, default=None)
+    category_slug = serializers.CharField(source='category.slug', read_only=True, default=None)
+
     class Meta:
         model = Product
-        fields = ['title', 'slug', 'price', 'discount', 'price_now', 'description', 'category',
-                  'rating']
+        fields = ['id', 'title', 'slug', 'price', 'discount', 'price_now', 'description',
+                  'category', 'category_title', 'category_slug', 'rating', 'available']
+
+    def __init__(self, *args, fields: List[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_only_fields(cls, fields: List[str]) -> List[str]:
+        """
+        Gets the model fields to select for serializer fields, to pass to QuerySet.only.
+
+        :param fields: The names of the serializer fields.
+        :return: The paths of the model fields, e.g. 'category__title'.
+        """
+        declared = cls().fields
+        return [declared[name].source.replace('.', '__') for name in fields]
+
+
+def get_translation_reader(descriptor: TranslationFieldDescriptor, column: str) \
+        -> Tuple[List[str], Callable[[dict], Any]]:
+    """
+    Builds a reader of a translated field from values() rows that resolves the current language
+    and the fallback languages the way the field descriptor of modeltranslation does.
+
+    :param descriptor: The descriptor of the translated field.
+    :param column: The path of the field in the values() rows, e.g. 'category__title'.
+    :return: The columns of the languages in the order they are tried and the reader.
+    """
+    undefined = descriptor.fallback_undefined
+    if undefined is NONE:
+        undefined = descriptor.field.get_default()
+    if fallbacks_enabled() and descriptor.fallback_value is not NONE:
+        fallback = descriptor.fallback_value
+    else:
+        fallback = descriptor.field.get_default()
+    columns = [build_localized_fieldname(column, language)
+               for language in resolution_order(get_language(), descriptor.fallback_languages)]
+
+    def read(row: dict) -> Any:
+        for name in columns:
+            value = row[name]
+            if value is not None and value != undefined:
+                return value
+        return fallback
+
+    return columns, read
+
+
+def get_representation(field: serializers.Field) -> Callable[[Any], Any]:
+    """
+    Gets the function that represents a value of a serializer field read from a values() row.
+
+    :param field: The serializer field.
+    :return: The function, the same as field.to_representation for the supported fields.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        # values() gives the primary key itself
+        return lambda value: value
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, (serializers.DecimalField, serializers.BooleanField)):
+        return field.to_representation
+    raise TypeError(f'{type(field).__name__} {field.field_name} is not supported')
+
+
+def get_product_readers(fields: List[str]) -> Tuple[List[str], List[Tuple[str, Callable]]]:
+    """
+    Builds the readers of the fields of ProductSerializer from values() rows for the current
+    language, see serialize_product_values.
+
+    :param fields: The names of the serializer fields.
+    :return: The columns to select and, for each field, its name and the function that reads
+             its representation from a row.
+    """
+    columns, readers = [], []
+    for name, field in ProductSerializer(fields=fields).fields.items():
+        *relations, attribute = field.source.split('.')
+        model = Product
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        column = '__'.join([*relations, attribute])
+
+        descriptor = model.__dict__.get(attribute)
+        if isinstance(descriptor, TranslationFieldDescriptor):
+            field_columns, read_value = get_translation_reader(descriptor, column)
+        else:
+            field_columns, read_value = [column], lambda row, column=column: row[column]
+        # A field of a missing relation is None, like DRF gives the default of the field
+        guard = '__'.join(relations)
+        if guard:
+            field_columns.append(guard)
+        columns.extend(field_columns)
+
+        def read(row: dict, read_value=read_value, represent=get_representation(field),
+                 guard=guard) -> Any:
+            if guard and row[guard] is None:
+                return None
+            value = read_value(row)
+            return None if value is None else represent(value)
+
+        readers.append((name, read))
+    return list(dict.fromkeys(columns)), readers
+
+
+def select_product_values(queryset: QuerySet, columns: List[str]) -> QuerySet:
+    """
+    Selects the columns of products as values() rows, with the translated columns named
+    explicitly, so modeltranslation does not rewrite the rows again.
+    """
+    if hasattr(queryset, 'rewrite'):
+        queryset = queryset.rewrite(False)
+    return queryset.values(*columns)
+
+
+def serialize_product_values(rows: Iterable[Dict[str, Any]],
+                             readers: List[Tuple[str, Callable]]) -> List[Dict[str, Any]]:
+    """
+    Read-only fast path of ProductSerializer: serializes products straight from values() rows,
+    without model instances and without calling the serializer fields for each product.
+    The result is rendered to the same JSON as the data of ProductSerializer.
+
+    Example:
+        columns, readers = get_product_readers(['id', 'title', 'price_now'])
+        data = serialize_product_values(select_product_values(products, columns), readers)
+
+    :param rows: The values() rows of the products, see select_product_values.
+    :param readers: The readers of the fields, see get_product_readers.
+    :return: The list of the serialized products.
+    """
+    return [{name: read(row) for name, read in readers} for row in rows]
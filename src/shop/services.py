@@ -1,19 +1,72 @@
+import hashlib
+import hmac
+import json
 import logging
+import math
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
 from typing import Union
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
 
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.handlers.wsgi import WSGIRequest
 from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
 from django.db.models import Count
+from django.db.models import F
+from django.db.models import FloatField
 from django.db.models import Q
 from django.db.models import QuerySet
+from django.db.models import Value
+from django.db.models.functions import Abs
+from django.db.models.functions import Greatest
+from django.db.models.functions import Log
+from django.db.models.functions import Power
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils import translation
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from django_filters import rest_framework as filters
 from modeltranslation.manager import MultilingualQuerySet
 
+from online_store.settings import AUTOCOMPLETE_CACHE_TIMEOUT
+from online_store.settings import AUTOCOMPLETE_LIMIT
+from online_store.settings import AUTOCOMPLETE_MIN_LENGTH
+from online_store.settings import BANNER_REGISTRY_CACHE_TIMEOUT
+from online_store.settings import CACHE_LOCK_TIMEOUT
+from online_store.settings import CACHE_LOCK_WAIT
+from online_store.settings import CATALOG_FEED_API_KEYS
+from online_store.settings import CATALOG_FEED_BATCH_SIZE
+from online_store.settings import CATALOG_FEED_FORMATS
+from online_store.settings import CATALOG_FEED_RATE_LIMIT
+from online_store.settings import CATALOG_FEED_RATE_PERIOD
+from online_store.settings import CATALOG_FEED_ROOT
 from online_store.settings import EMAIL_HOST_USER
+from online_store.settings import LANGUAGES
+from online_store.settings import LISTING_CACHE_TIMEOUT
+from online_store.settings import PRODUCT_RAIL_CACHE_TIMEOUT
+from online_store.settings import PRODUCT_RAIL_LIMIT
+from online_store.settings import REVIEWS_CACHE_TIMEOUT
+from online_store.settings import REVIEWS_PAGINATE_BY
+from online_store.settings import SALES_RANK_EPOCH
+from online_store.settings import SALES_RANK_HALF_LIFE
 from shop.forms import ReviewsForm
 from shop.models import AttributeColor
 from shop.models import AttributeSize
@@ -22,12 +75,89 @@ from shop.models import Category
 from shop.models import Color
 from shop.models import Manufacturer
 from shop.models import Product
+from shop.models import RatingHistogram
 from shop.models import Reviews
 from shop.models import Size
 from shop.models import Tag
 
 logger = logging.getLogger(__name__)
 
+# The fields of the products in a catalog feed and the columns they are read from
+CATALOG_FEED_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'price': 'price',
+    'discount': 'discount',
+    'price_now': 'price_now',
+    'currency': 'currency__title',
+    'category': 'category__title',
+    'manufacturer': 'manufacturer__title',
+    'available': 'available',
+    'rating': 'rating',
+    'updated_at': 'updated_at',
+}
+
+
+def get_cache_version(name: str) -> int:
+    """
+    Gets the current version of a group of cache keys.
+
+    Keys of the group include the version, so changing it invalidates the whole group at once.
+
+    :param name: The name of the group of cache keys.
+    :return: The current version of the group.
+    """
+    return cache.get_or_set(f'{name}_version', time.time_ns, None)
+
+
+def invalidate_cache_version(name: str) -> None:
+    """
+    Invalidates a group of cache keys by changing its version.
+
+    :param name: The name of the group of cache keys.
+    """
+    try:
+        cache.incr(f'{name}_version')
+    except ValueError:
+        cache.set(f'{name}_version', time.time_ns(), None)
+
+
+def get_or_set_locked(cache_name: str, default: Callable[[], Any], timeout: int) -> Any:
+    """
+    Gets a value from the cache, or computes and caches it if it is missing.
+
+    Only one worker computes a missing value: the others wait until it appears in the cache
+    and compute it themselves only if the lock expires before that.
+
+    :param cache_name: The cache key of the value.
+    :param default: A function that computes the value.
+    :param timeout: The number of seconds to keep the value in the cache.
+    :return: The cached or computed value.
+    """
+    value = cache.get(cache_name)
+    if value is not None:
+        return value
+
+    lock_name = f'{cache_name}:lock'
+    if cache.add(lock_name, 1, CACHE_LOCK_TIMEOUT):
+        try:
+            value = default()
+            cache.set(cache_name, value, timeout)
+        finally:
+            cache.delete(lock_name)
+        return value
+
+    deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LOCK_WAIT)
+        value = cache.get(cache_name)
+        if value is not None:
+            return value
+
+    logger.warning(f'Cache lock {lock_name} expired')
+    return default()
+
 
 def get_filter_products(limit: int = 99999, **kwargs) -> QuerySet:
     """
@@ -38,7 +168,108 @@ def get_filter_products(limit: int = 99999, **kwargs) -> QuerySet:
     :return: A QuerySet of matching products
     """
     return Product.objects.filter(**kwargs).prefetch_related('default_varieties').order_by(
-        '-available', '-count_sale')[0:int(limit)]
+        '-available', '-popularity')[0:int(limit)]
+
+
+def get_popularity_log_weight(moment: datetime) -> float:
+    """
+    Gets the base 2 logarithm of the weight of a unit sold at a moment in the popularity of a
+    product.
+
+    The popularity decays by half every SALES_RANK_HALF_LIFE days. Instead of decaying all the
+    scores as time passes, the weight of a sale grows at the same rate from SALES_RANK_EPOCH,
+    which keeps the scores in the same order, so a sale only changes the score of its product.
+    The weight doubles every half-life and would overflow a float after some decades, so only
+    its logarithm is used and the popularity is stored as log2(1 + the sum of the weights).
+
+    :param moment: The time of the sale.
+    :return: The number of half-lives from SALES_RANK_EPOCH to the sale.
+    """
+    return (moment.timestamp() - SALES_RANK_EPOCH) / (SALES_RANK_HALF_LIFE * 24 * 60 * 60)
+
+
+def add_popularity(popularity: float, log_weight: float) -> float:
+    """
+    Adds a weight to a popularity score without leaving the logarithmic scale, see
+    get_popularity_log_weight.
+
+    :param popularity: The score, log2(1 + the sum of the weights).
+    :param log_weight: The base 2 logarithm of the added weight.
+    :return: The new score.
+    """
+    high, low = max(popularity, log_weight), min(popularity, log_weight)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def record_product_sales(units: Dict[int, int], moment: Optional[datetime] = None) -> None:
+    """
+    Adds sold units to the sales count and the popularity of products.
+
+    The counters are incremented by the database, so concurrent checkouts do not lose sales.
+    The popularity is added up like add_popularity does it. The updates send no signals, so the
+    product rails ranked by the sales are invalidated once the transaction is committed.
+
+    :param units: The number of sold units by product id.
+    :param moment: The time of the sale, now by default.
+    """
+    log_weight = get_popularity_log_weight(moment or timezone.now())
+    with transaction.atomic():
+        # The rows are locked in the same order by all checkouts to avoid deadlocks
+        for product_id, number in sorted(units.items()):
+            sale = Value(math.log2(number) + log_weight, output_field=FloatField())
+            Product.objects.filter(pk=product_id).update(
+                count_sale=F('count_sale') + number,
+                popularity=Greatest(F('popularity'), sale) + Log(
+                    2, Power(2, -Abs(F('popularity') - sale)) + 1))
+        transaction.on_commit(lambda: invalidate_cache_version('product_rail'))
+
+
+def get_product_rail_cache_name(limit: int = PRODUCT_RAIL_LIMIT, **kwargs) -> str:
+    """
+    Builds the cache key of a product rail.
+
+    :param limit: The maximum number of products in the rail.
+    :param kwargs: Filters applied to the products of the rail (e.g. tags=6).
+    :return: The cache key of the product rail.
+    """
+    version = get_cache_version('product_rail')
+    rail = ','.join(f'{key}={getattr(value, "pk", value)}'
+                    for key, value in sorted(kwargs.items()))
+    return f'product_rail:{version}:{rail}:{limit}'
+
+
+def get_product_rail(limit: int = PRODUCT_RAIL_LIMIT, **kwargs) -> List[Product]:
+    """
+    Gets the top products matching the filters from the cache, or selects them from the database.
+
+    Only one worker selects a rail that was invalidated, the others wait for it.
+
+    :param limit: The maximum number of products in the rail.
+    :param kwargs: Filters applied to the products of the rail (e.g. tags=6).
+    :return: A list of products sorted by availability and sales.
+    """
+    return get_or_set_locked(get_product_rail_cache_name(limit, **kwargs),
+                             lambda: list(get_filter_products(limit=limit, **kwargs)),
+                             PRODUCT_RAIL_CACHE_TIMEOUT)
+
+
+def warm_product_rails(limit: int = PRODUCT_RAIL_LIMIT) -> int:
+    """
+    Precomputes the global bestsellers and the top products of every active tag and category.
+
+    :param limit: The maximum number of products in each rail.
+    :return: The number of precomputed rails.
+    """
+    rails = [{}]
+    rails += [{'tags': pk}
+              for pk in Tag.objects.filter(is_active=True).values_list('pk', flat=True)]
+    rails += [{'category': pk} for pk in Category.objects.values_list('pk', flat=True)]
+
+    for rail in rails:
+        cache.set(get_product_rail_cache_name(limit, **rail),
+                  list(get_filter_products(limit=limit, **rail)),
+                  PRODUCT_RAIL_CACHE_TIMEOUT)
+    return len(rails)
 
 
 def get_review_for_user_and_product(user_id: int, product_id: int) -> Optional[Reviews]:
@@ -56,28 +287,134 @@ def get_review_for_user_and_product(user_id: int, product_id: int) -> Optional[R
         return None
 
 
-def get_rating_html(rating: int = 5) -> str:
+def update_rating_histogram(product_id: int, old_rating: Optional[int] = None,
+                            new_rating: Optional[int] = None) -> None:
+    """
+    Moves one review between the star counters of the product rating histogram.
+
+    The counters are changed with a single UPDATE, so concurrent reviews do not overwrite
+    each other.
+
+    :param product_id: The ID of the product whose histogram should be updated.
+    :param old_rating: The previous rating of the review, or None if the review was created.
+    :param new_rating: The new rating of the review, or None if the review was deleted.
+    """
+    if old_rating == new_rating:
+        return
+
+    counters = {}
+    if old_rating:
+        counters[f'rating_{old_rating}'] = F(f'rating_{old_rating}') - 1
+    if new_rating:
+        counters[f'rating_{new_rating}'] = F(f'rating_{new_rating}') + 1
+
+    if new_rating:
+        RatingHistogram.get_histogram(product_id)
+    RatingHistogram.objects.filter(product_id=product_id).update(**counters)
+
+
+def get_rating_histogram(product: Product) -> RatingHistogram:
+    """
+    Gets the rating histogram of the product.
+
+    :param product: The product to get the histogram for.
+    :return: The rating histogram of the product.
+    """
+    try:
+        return product.rating_histogram
+    except RatingHistogram.DoesNotExist:
+        return RatingHistogram.get_histogram(product.pk)
+
+
+def get_reviews_page(product_id: int, after: Optional[int] = None,
+                     limit: int = REVIEWS_PAGINATE_BY) -> Tuple[List[Reviews], Optional[int]]:
+    """
+    Gets a page of product reviews using keyset pagination, newest reviews first.
+
+    Pages are cached until a review of the product is created, updated or deleted.
+
+    :param product_id: The ID of the product.
+    :param after: The ID of the last review on the previous page, or None for the first page.
+    :param limit: The number of reviews on the page.
+    :return: A tuple containing the list of reviews and the cursor of the next page,
+        or None if this is the last page.
+    """
+    version = get_cache_version(f'reviews:{product_id}')
+    cache_name = f'reviews:{product_id}:{version}:{after or 0}:{limit}'
+    page = cache.get(cache_name)
+
+    if page is None:
+        reviews = Reviews.objects.filter(product_id=product_id).select_related('user')
+        if after:
+            reviews = reviews.filter(pk__lt=after)
+        reviews = list(reviews.order_by('-pk')[:limit + 1])
+        next_cursor = reviews[limit - 1].pk if len(reviews) > limit else None
+        page = (reviews[:limit], next_cursor)
+        cache.set(cache_name, page, REVIEWS_CACHE_TIMEOUT)
+
+    return page
+
+
+def get_reviews_cursor(value: Optional[str]) -> Optional[int]:
+    """
+    Converts the review page cursor from the request to an integer.
+
+    :param value: The cursor received in the request.
+    :return: The ID of the last review on the previous page, or None if the cursor is invalid.
+    """
+    try:
+        return int(value) if value else None
+    except ValueError:
+        logger.warning(f'Invalid reviews cursor: {value}')
+        return None
+
+
+STAR_FULL_HTML = '<i class="fas fa-star text-primary mr-1"></i>'
+STAR_HALF_HTML = '<i class="fas fa-star-half-alt text-primary mr-1"></i>'
+STAR_EMPTY_HTML = '<i class="far fa-star text-primary mr-1"></i>'
+
+# Star rating HTML for every number of full stars and a half star after them.
+# The keys are (full, half) pairs, and numbers that are equal have the same hash,
+# so an integer rating like Decimal('4'), 4 or 4.0 finds its HTML directly as (rating, 0).
+RATING_HTML_TABLE = {
+    (full, half): mark_safe(STAR_FULL_HTML * full +
+                            STAR_HALF_HTML * half +
+                            STAR_EMPTY_HTML * (5 - full - half))
+    for full in range(6)
+    for half in range(2)
+    if full + half <= 5
+}
+
+
+def get_rating_stars(rating: Union[int, float, Decimal, str, None]) -> Tuple[int, int]:
+    """
+    Counts the stars drawn for a rating. A star is full if the rating covers at least a half
+    of it, and half if the rating covers more than 0.3 of it.
+
+    :param rating: The rating to draw, on a scale of 0 to 5.
+    :return: The number of full stars and 1 if a half star follows them, or (0, 0) if the
+             rating is not a number.
+    """
+    try:
+        rating = float(rating)
+        full = min(max(math.floor(rating + 0.5), 0), 5)
+    except (TypeError, ValueError, OverflowError):
+        logger.warning(f'Invalid rating: {rating}')
+        return 0, 0
+    return full, int(full < 5 and rating - full > 0.3)
+
+
+def get_rating_html(rating: Union[int, float, Decimal, str, None] = 5) -> str:
     """
     Draws product rating stars based on average rating.
 
     :param rating: The average rating of the product, on a scale of 1 to 5.
     :return: A string containing the HTML for the star rating.
     """
-    rating = float(rating)
-    html_stars = ""
-
-    # Loop 5 times to create the 5 stars
-    for _x in range(5):
-        if rating >= 0.5:
-            html_stars += '<i class="fas fa-star text-primary mr-1"></i>'
-        elif rating > 0.3:
-            html_stars += '<i class="fas fa-star-half-alt text-primary mr-1"></i>'
-        else:
-            html_stars += '<i class="far fa-star text-primary mr-1"></i>'
-        rating -= 1
-
-    # Return the HTML for the star rating
-    return html_stars
+    try:
+        return RATING_HTML_TABLE[rating, 0]
+    except (KeyError, TypeError):
+        return RATING_HTML_TABLE[get_rating_stars(rating)]
 
 
 def get_tag_by_banner(pk_banner: int) -> Tag:
@@ -90,9 +427,9 @@ def get_tag_by_banner(pk_banner: int) -> Tag:
     """
     try:
         # Get the tag for the banner with the given primary key
-        tag = Tag.objects.get(title=Banner.objects.get(pk=pk_banner).tag)
-    except Exception as error:
-        logger.error(error)
+        tag = Banner.objects.select_related('tag').get(pk=pk_banner).tag
+    except Banner.DoesNotExist as error:
+        logger.error(f"{pk_banner}: {error}")
 
         # Return the last tag in the database as a default
         tag = Tag.objects.all().last()
@@ -100,6 +437,79 @@ def get_tag_by_banner(pk_banner: int) -> Tag:
     return tag
 
 
+def get_banner_tag_data(tag: Optional[Tag]) -> Optional[dict]:
+    """
+    Collects the banner data of the tag in the current language.
+
+    :param tag: The tag shown on the banner.
+    :return: A dictionary with the tag data, or None if there is no tag.
+    """
+    if tag is None:
+        return None
+
+    return {'pk': tag.pk,
+            'title': tag.title,
+            'title_two': tag.title_two,
+            'url': str(tag.get_absolute_url()),
+            'picture_url': tag.picture.url if tag.picture else ''}
+
+
+def build_banner_registry() -> Dict[Union[int, str], Optional[dict]]:
+    """
+    Resolves every banner to its tag.
+
+    :return: A dictionary where the key is the banner ID and the value is the banner data.
+        The 'default' key contains the data of the last tag, which is shown for unknown banners.
+    """
+    tags = {}
+    registry = {}
+    for banner in Banner.objects.select_related('tag'):
+        if banner.tag_id not in tags:
+            tags[banner.tag_id] = get_banner_tag_data(banner.tag)
+        registry[banner.pk] = tags[banner.tag_id]
+
+    registry['default'] = get_banner_tag_data(Tag.objects.all().last())
+    return registry
+
+
+def get_banner_registry() -> Dict[Union[int, str], Optional[dict]]:
+    """
+    Gets the banner registry for the current language from the cache, or builds it.
+
+    :return: A dictionary where the key is the banner ID and the value is the banner data.
+    """
+    cache_name = f'banner_registry:{get_language()}'
+    registry = cache.get(cache_name)
+
+    if registry is None:
+        registry = build_banner_registry()
+        cache.set(cache_name, registry, BANNER_REGISTRY_CACHE_TIMEOUT)
+
+    return registry
+
+
+def get_banner(pk_banner: int) -> Optional[dict]:
+    """
+    Gets the tag data for a given banner. If no banner with the given primary key exists,
+    return the data of the last tag as a default.
+
+    :param pk_banner: The primary key of the banner.
+    :return: A dictionary with the tag data.
+    """
+    registry = get_banner_registry()
+    if pk_banner not in registry:
+        logger.error(f"Banner {pk_banner} does not exist")
+        return registry['default']
+    return registry[pk_banner]
+
+
+def invalidate_banner_registry() -> None:
+    """
+    Removes the banner registry from the cache for all languages.
+    """
+    cache.delete_many([f'banner_registry:{language}' for language, _name in LANGUAGES])
+
+
 def filter_colors_by_products(product_list_pk: list) -> MultilingualQuerySet:
     """
     Gets the color filter for a list of products.
@@ -144,6 +554,301 @@ def filter_manufacturers_by_products(product_list_pk: list) -> QuerySet:
     return manufacturer_filter
 
 
+def get_product_stamp() -> float:
+    """
+    Gets the version stamp of the products, the time of the last change of a product or a
+    category, see touch_product_stamp.
+
+    :return: The time of the last change as a timestamp.
+    """
+    return cache.get_or_set('product_stamp', time.time, None)
+
+
+def touch_product_stamp() -> None:
+    """
+    Changes the version stamp of the products, which invalidates the cached API responses and
+    the ETags the clients hold.
+    """
+    cache.set('product_stamp', time.time(), None)
+
+
+def get_product_api_etag(url: str, params: QueryDict, stamp: float) -> str:
+    """
+    Builds the ETag of a product API response, which is also the cache key of the response.
+
+    The responses hold absolute links to the other pages, so the URL includes the scheme and
+    the host the response was requested with.
+
+    :param url: The URL of the request without the query string.
+    :param params: The GET parameters of the request.
+    :param stamp: The version stamp of the products.
+    :return: The ETag, without quotes.
+    """
+    query = '&'.join(f'{key}={",".join(sorted(params.getlist(key)))}' for key in sorted(params))
+    return hashlib.md5(f'{stamp}:{get_language()}:{url}:{query}'.encode()).hexdigest()
+
+
+def get_catalog_feed_products(since: Optional[datetime] = None,
+                              batch_size: int = CATALOG_FEED_BATCH_SIZE) \
+        -> Iterator[Dict[str, Any]]:
+    """
+    Reads the products of a catalog feed with their variants, prices and availability.
+
+    The products are read in batches by their ids, so only one batch of rows is held in memory,
+    also on MySQL where a queryset iterator still fetches all the rows at once. The variants of
+    a batch are read with one more query.
+
+    :param since: Only the products changed since this time, for a delta feed.
+    :param batch_size: The number of products read by each query.
+    :return: An iterator of the products as dictionaries.
+    """
+    products = Product.objects.order_by('pk').values(*CATALOG_FEED_FIELDS.values())
+    if since is not None:
+        products = products.filter(updated_at__gte=since)
+
+    last_id = 0
+    while True:
+        rows = list(products.filter(pk__gt=last_id)[:batch_size])
+        variants = defaultdict(list)
+        for size in AttributeSize.objects.filter(
+                product__product__in=[row['id'] for row in rows]).order_by('pk').values(
+                'product__product', 'product__color__value', 'size__value', 'available'):
+            variants[size['product__product']].append({'color': size['product__color__value'],
+                                                       'size': size['size__value'],
+                                                       'available': size['available']})
+        for row in rows:
+            product = {name: row[column] for name, column in CATALOG_FEED_FIELDS.items()}
+            product['variants'] = variants[row['id']]
+            yield product
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def get_feed_xml_value(value: Any) -> str:
+    """
+    Formats a value of a catalog feed for XML.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return escape(str(value))
+
+
+def format_catalog_feed(products: Iterable[Dict[str, Any]], output_format: str) -> Iterator[str]:
+    """
+    Formats the products of a catalog feed as JSON lines or as XML.
+
+    :param products: The products, see get_catalog_feed_products.
+    :param output_format: 'jsonl' or 'xml', see CATALOG_FEED_FORMATS.
+    :return: An iterator of lines.
+    """
+    if output_format == 'jsonl':
+        for product in products:
+            yield json.dumps(product, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        return
+
+    yield '<?xml version="1.0" encoding="utf-8"?>\n<catalog>\n'
+    for product in products:
+        variants = ''.join(
+            f'<variant color={quoteattr(get_feed_xml_value(variant["color"]))} '
+            f'size={quoteattr(get_feed_xml_value(variant["size"]))} '
+            f'available="{get_feed_xml_value(variant["available"])}"/>'
+            for variant in product['variants'])
+        fields = ''.join(f'<{name}>{get_feed_xml_value(product[name])}</{name}>'
+                         for name in CATALOG_FEED_FIELDS if name != 'id')
+        yield (f'<product id="{product["id"]}">{fields}'
+               f'<variants>{variants}</variants></product>\n')
+    yield '</catalog>\n'
+
+
+def gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    """
+    Compresses a stream of text with gzip on the fly.
+
+    :param chunks: The text.
+    :return: An iterator of the compressed bytes.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_catalog_feed_client(request: WSGIRequest) -> Optional[str]:
+    """
+    Identifies the partner downloading a catalog feed by the API key in the X-Api-Key header,
+    see CATALOG_FEED_API_KEYS, or a signed in staff user.
+
+    :param request: The request of the feed.
+    :return: The name the downloads of the client are counted under, None for other visitors.
+    """
+    api_key = request.headers.get('X-Api-Key', '').encode()
+    for index, partner_key in enumerate(CATALOG_FEED_API_KEYS):
+        if hmac.compare_digest(api_key, partner_key.encode()):
+            return f'key:{index}'
+    if request.user.is_staff:
+        return f'user:{request.user.pk}'
+    return None
+
+
+def count_catalog_feed_download(client: str, rate_limit: int = CATALOG_FEED_RATE_LIMIT) -> bool:
+    """
+    Counts a catalog feed read from the database in the cache, per CATALOG_FEED_RATE_PERIOD.
+
+    :param client: The client, see get_catalog_feed_client.
+    :param rate_limit: The maximum number of feeds per period.
+    :return: True if the feed fits in the rate limit.
+    """
+    period = int(time.time()) // CATALOG_FEED_RATE_PERIOD
+    cache_name = f'catalog_feed_rate:{client}:{period}'
+    cache.add(cache_name, 0, CATALOG_FEED_RATE_PERIOD)
+    try:
+        return cache.incr(cache_name) <= rate_limit
+    except ValueError:
+        # The period ended in the meantime
+        return True
+
+
+def get_catalog_feed_path(language: str, output_format: str) -> str:
+    """
+    Gets the path of the gzipped snapshot of the full catalog feed.
+    """
+    return os.path.join(CATALOG_FEED_ROOT, f'catalog.{language}.{output_format}.gz')
+
+
+def write_catalog_feeds() -> List[str]:
+    """
+    Writes the gzipped snapshots of the full catalog feed in all the languages and formats.
+    Each file is written next to the old one and replaces it at once, so a snapshot is never
+    served half written. The modification time of a snapshot is the time it was started.
+
+    :return: The paths of the written snapshots.
+    """
+    os.makedirs(CATALOG_FEED_ROOT, exist_ok=True)
+    paths = []
+    for language, _name in LANGUAGES:
+        for output_format in CATALOG_FEED_FORMATS:
+            path = get_catalog_feed_path(language, output_format)
+            started_at = time.time()
+            with translation.override(language), open(f'{path}.tmp', 'wb') as file:
+                for chunk in gzip_stream(format_catalog_feed(get_catalog_feed_products(),
+                                                             output_format)):
+                    file.write(chunk)
+            # The modification time is the start, changes made while writing are in the deltas
+            os.utime(f'{path}.tmp', (started_at, started_at))
+            os.replace(f'{path}.tmp', path)
+            paths.append(path)
+    return paths
+
+
+def get_listing_cache_name(view_name: str, slug: str, params: QueryDict,
+                           param_names: Iterable[str]) -> str:
+    """
+    Builds the cache key of a product listing.
+
+    :param view_name: The name of the listing view.
+    :param slug: The slug of the category, tag or brand of the listing, if any.
+    :param params: The GET parameters of the request.
+    :param param_names: The GET parameters the listing is read with, the others are ignored.
+    :return: The cache key of the product listing.
+    """
+    version = get_cache_version('listing')
+    filters = '&'.join(f'{key}={",".join(sorted(params.getlist(key)))}'
+                       for key in sorted(param_names) if key in params)
+    filters_hash = hashlib.md5(filters.encode()).hexdigest()
+    return f'listing:{version}:{view_name}:{slug}:{get_language()}:{filters_hash}'
+
+
+def get_listing(view_name: str, slug: str, params: QueryDict, param_names: Iterable[str],
+                get_products: Callable[[], QuerySet],
+                get_facet_ids: Callable[[List[int]], List[int]]) -> dict:
+    """
+    Gets the product ids of a product listing from the cache, or computes them.
+
+    :param view_name: The name of the listing view.
+    :param slug: The slug of the category, tag or brand of the listing, if any.
+    :param params: The GET parameters of the request.
+    :param param_names: The GET parameters the listing is read with.
+    :param get_products: A function that returns the products of the listing.
+    :param get_facet_ids: A function that returns the product ids used to build the filters.
+    :return: A dictionary with the cache key, the product ids and the product ids of the filters.
+    """
+    cache_name = get_listing_cache_name(view_name, slug, params, param_names)
+
+    def compute() -> dict:
+        ids = get_product_ids(get_products())
+        return {'ids': ids, 'facet_ids': get_facet_ids(ids)}
+
+    listing = get_or_set_locked(cache_name, compute, LISTING_CACHE_TIMEOUT)
+    return {**listing, 'cache_name': cache_name}
+
+
+def get_listing_facets(listing: dict) -> dict:
+    """
+    Gets the color, size and manufacturer filters of a listing from the cache, or computes them.
+
+    :param listing: The product listing returned by get_listing.
+    :return: A dictionary with the lists of colors, sizes and manufacturers.
+    """
+    def compute() -> dict:
+        return {
+            'colors': list(filter_colors_by_products(listing['facet_ids'])),
+            'sizes': list(filter_size_by_products(listing['facet_ids'])),
+            'manufacturers': list(filter_manufacturers_by_products(listing['facet_ids'])),
+        }
+
+    return get_or_set_locked(f'{listing["cache_name"]}:facets', compute, LISTING_CACHE_TIMEOUT)
+
+
+def get_listing_page(listing: dict, number: int, ids: List[int]) -> List[Product]:
+    """
+    Gets the products of a listing page from the cache, or selects them from the database.
+
+    :param listing: The product listing returned by get_listing.
+    :param number: The number of the page.
+    :param ids: The product ids of the page, in the order of the listing.
+    :return: A list of products of the page.
+    """
+    def compute() -> List[Product]:
+        products = Product.objects.filter(pk__in=ids).prefetch_related('default_varieties')
+        products = {product.pk: product for product in products}
+        return [products[pk] for pk in ids if pk in products]
+
+    return get_or_set_locked(f'{listing["cache_name"]}:page:{number}', compute,
+                             LISTING_CACHE_TIMEOUT)
+
+
+def get_autocomplete_products(text: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Dict[str, str]]:
+    """
+    Gets the titles and urls of the products whose title contains the text, for the search
+    suggestions. The suggestions are cached per text and language until the listings change.
+
+    :param text: The text typed in the search field.
+    :param limit: The maximum number of products.
+    :return: A list of dictionaries with the title and the url of each product.
+    """
+    text = text.strip()
+    if len(text) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+
+    text_hash = hashlib.md5(text.lower().encode()).hexdigest()
+    cache_name = (f'autocomplete:{get_cache_version("listing")}:{get_language()}:'
+                  f'{text_hash}:{limit}')
+
+    def compute() -> List[Dict[str, str]]:
+        return [{'title': product.title, 'url': str(product.get_absolute_url())}
+                for product in Product.objects.filter(title__icontains=text).order_by(
+                    '-available', '-popularity')[:limit]]
+
+    return get_or_set_locked(cache_name, compute, AUTOCOMPLETE_CACHE_TIMEOUT)
+
+
 def convert_str_to_int_list(string_of_numbers: str) -> list:
     """
     Converts a string of numbers in list format to a list of integers.
@@ -281,6 +986,7 @@ def get_nested_category_ids(category_slug: str) -> List[int]:
 def send_contact_form_message(request: WSGIRequest) -> None:
     """
     Sends a message from a user using a contact form on a website.
+    The email is stored in the outbox and sent by the worker, see EMAIL_BACKEND.
 
     :param request: A WSGIRequest object containing the message to send.
     :return: None.
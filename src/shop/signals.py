@@ -1,3 +1,15 @@
+from django.db import transaction
+from django.db.models import FileField
+from django.utils import timezone
+
+from shop.models import AttributeSize
+from shop.models import Product
+from shop.models import Reviews
+from shop.services import invalidate_banner_registry
+from shop.services import invalidate_cache_version
+from shop.services import touch_product_stamp
+from shop.services import update_rating_histogram
+from shop.tasks import make_image_thumbnails
 from shop.tasks import update_product_rating
 
 
@@ -7,3 +19,104 @@ def rating_in_product_post_save(sender, instance, created=None, **kwargs) -> Non
     Updates the average product rating and the number of reviews.
     """
     update_product_rating.delay(instance.product.pk)
+
+
+def rating_histogram_pre_save(sender, instance, **kwargs) -> None:
+    """
+    Remembers the previous rating of the review before it is changed.
+    """
+    instance.previous_rating = None
+    if instance.pk:
+        instance.previous_rating = Reviews.objects.filter(pk=instance.pk).values_list(
+            'rating', flat=True).first()
+
+
+def rating_histogram_post_save(sender, instance, created=None, **kwargs) -> None:
+    """
+    Reacts to the change or addition of product reviews.
+    Updates the rating histogram of the product and invalidates the cached review pages.
+    """
+    old_rating = None if created else getattr(instance, 'previous_rating', None)
+    update_rating_histogram(instance.product_id, old_rating=old_rating,
+                            new_rating=instance.rating)
+    invalidate_cache_version(f'reviews:{instance.product_id}')
+
+
+def rating_histogram_post_delete(sender, instance, **kwargs) -> None:
+    """
+    Reacts to the removal of product reviews.
+    Updates the rating histogram of the product and invalidates the cached review pages.
+    """
+    update_rating_histogram(instance.product_id, old_rating=instance.rating)
+    invalidate_cache_version(f'reviews:{instance.product_id}')
+
+
+def banner_registry_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of banners or tags.
+    Removes the cached banner registry.
+    """
+    invalidate_banner_registry()
+
+
+def product_rails_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of products, their default varieties or tags.
+    Invalidates the cached product rails, the next visitor of a rail selects it again and the
+    periodic warm_product_rails task precomputes all of them.
+    """
+    invalidate_cache_version('product_rail')
+
+
+def listing_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of products or the categories, tags, brands and attributes they refer to.
+    Invalidates the cached product listings.
+    """
+    invalidate_cache_version('listing')
+
+
+def product_stamp_changed(sender, **kwargs) -> None:
+    """
+    Reacts to the change of products or their categories.
+    Changes the version stamp of the products served by the API.
+    """
+    touch_product_stamp()
+
+
+def variant_changed(sender, instance, **kwargs) -> None:
+    """
+    Reacts to the change of the colors or sizes of a product.
+    Marks the product as updated for the delta catalog feeds.
+    """
+    if isinstance(instance, AttributeSize):
+        products = Product.objects.filter(attribute_color=instance.product_id)
+    else:
+        products = Product.objects.filter(pk=instance.product_id)
+    products.update(updated_at=timezone.now())
+
+
+def image_pre_save(sender, instance, **kwargs) -> None:
+    """
+    Remembers the names of the images of a model before it is changed.
+    """
+    fields = [field.attname for field in instance._meta.fields if isinstance(field, FileField)]
+    instance.previous_images = {}
+    if instance.pk:
+        instance.previous_images = sender.objects.filter(pk=instance.pk).values(
+            *fields).first() or {}
+
+
+def image_saved(sender, instance, **kwargs) -> None:
+    """
+    Reacts to the save of a model with images.
+    Generates the derivatives of its new or replaced images in the background, once the
+    transaction is committed.
+    """
+    previous_images = getattr(instance, 'previous_images', {})
+    for field in instance._meta.fields:
+        if not isinstance(field, FileField):
+            continue
+        name = getattr(instance, field.attname).name
+        if name and name != previous_images.get(field.attname):
+            transaction.on_commit(lambda name=name: make_image_thumbnails.delay(name))
@@ -18,3 +18,44 @@ def update_product_rating(product_pk: int) -> None:
         product.rating = reviews['rating__avg']
         product.count_reviews = reviews['rating__count']
         product.save(force_update=True)
+
+
+@shared_task(base=Singleton)
+def warm_product_rails() -> int:
+    """
+    Precomputes the product rails shown on the home and detail pages.
+
+    :return: The number of precomputed rails.
+    """
+    from shop import services
+
+    return services.warm_product_rails()
+
+
+@shared_task(base=Singleton)
+def write_catalog_feeds() -> int:
+    """
+    Writes the gzipped snapshots of the full catalog feeds served to the partners.
+
+    :return: The number of written snapshots.
+    """
+    from shop import services
+
+    return len(services.write_catalog_feeds())
+
+
+@shared_task(base=Singleton)
+def make_image_thumbnails(name: str) -> int:
+    """
+    Generates the derivatives of an uploaded image beside it, unless they were generated before.
+
+    :param name: The name of the image in the media storage.
+    :return: The number of saved derivatives.
+    """
+    from online_store import thumbnails
+
+    if thumbnails.has_thumbnails(name):
+        return 0
+    names = thumbnails.make_thumbnails(name)
+    thumbnails.record_thumbnails(name, names)
+    return len(names)
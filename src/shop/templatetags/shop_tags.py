@@ -5,13 +5,18 @@ from typing import Union
 from django import template
 from django.core.paginator import Paginator
 from django.db.models import QuerySet
+from django.template.defaulttags import CsrfTokenNode
+from django.utils.safestring import mark_safe
 
+from online_store.thumbnails import get_thumbnail_srcset
+from online_store.thumbnails import get_thumbnail_url
 from shop.models import Category
 from shop.models import Manufacturer
-from shop.services import get_filter_products
+from shop.models import Product
+from shop.services import get_product_rail
 from shop.services import get_rating_html
 from shop.services import get_review_for_user_and_product
-from shop.services import get_tag_by_banner
+from shop.services import get_banner
 
 register = template.Library()
 
@@ -35,10 +40,10 @@ def show_banner(pk_banner: int):
     """
     Displays a banner on the website using the specified tag.
 
-    :param pk_banner: The ID of the tag that should be used to retrieve the banner.
-    :return: A dictionary containing the tag to be rendered in the template.
+    :param pk_banner: The ID of the banner.
+    :return: A dictionary containing the tag data to be rendered in the template.
     """
-    return {'tag': get_tag_by_banner(pk_banner)}
+    return {'tag': get_banner(pk_banner)}
 
 
 @register.inclusion_tag('shop/inc/carousel_banner.html')
@@ -46,10 +51,10 @@ def show_carousel_banner(pk_banner: int):
     """
     Displays a carousel banner on the website using the specified tag.
 
-    :param pk_banner: The ID of the tag that should be used to retrieve the banner.
-    :return: A dictionary containing the tag to be rendered in the template.
+    :param pk_banner: The ID of the banner.
+    :return: A dictionary containing the tag data to be rendered in the template.
     """
-    return {'tag': get_tag_by_banner(pk_banner)}
+    return {'tag': get_banner(pk_banner)}
 
 
 @register.inclusion_tag('shop/inc/carousel_brand.html')
@@ -80,15 +85,15 @@ def show_card_product(context, item):
 
 
 @register.simple_tag()
-def get_products(limit: int = 8, **kwargs) -> QuerySet:
+def get_products(limit: int = 8, **kwargs) -> List[Product]:
     """
-    Returns a QuerySet of products with applied filters.
+    Returns a cached list of top products with applied filters.
 
     :param limit: The maximum number of products to return.
     :param kwargs: Filters to apply to the products.
-    :return: A QuerySet of products with applied filters.
+    :return: A list of products with applied filters.
     """
-    return get_filter_products(limit=limit, **kwargs)
+    return get_product_rail(limit=limit, **kwargs)
 
 
 @register.simple_tag()
@@ -143,3 +148,63 @@ def get_fa_star(rating: int = 5) -> str:
     :return: The HTML for a star icon to display the rating.
     """
     return get_rating_html(rating)
+
+
+@register.filter(is_safe=True)
+def rating_stars(rating: int = 5) -> str:
+    """
+    Returns the HTML for the star icons of the rating from the precomputed table.
+
+    Usage: {{ product.rating|rating_stars }}
+
+    :param rating: The rating to display, from 0 to 5.
+    :return: The HTML for the star icons to display the rating.
+    """
+    return get_rating_html(rating)
+
+
+@register.filter
+def thumbnail(url: str, size: str) -> str:
+    """
+    Returns the URL of the derivative of an image for the size, or the URL of the original
+    while the derivative is being generated.
+
+    Usage: {{ item.picture.url|thumbnail:'card' }}
+
+    :param url: The URL of the original image.
+    :param size: The size of the derivative, one of THUMBNAIL_SIZES.
+    :return: The URL of the image to display.
+    """
+    return get_thumbnail_url(url, size)
+
+
+@register.inclusion_tag('shop/inc/picture.html')
+def picture(url: str, size: str, css_class: str = '', style: str = ''):
+    """
+    Displays an image by its derivatives for the size, the WebP ones for the browsers that
+    support them, and the derivative of the next size for the high density screens.
+
+    Usage: {% picture item.picture.url 'card' 'img-fluid w-100' %}
+
+    :param url: The URL of the original image.
+    :param size: The size of the derivatives, one of THUMBNAIL_SIZES.
+    :param css_class: The CSS classes of the image.
+    :param style: The inline style of the image.
+    :return: A dictionary containing the URLs of the image to be rendered in the template.
+    """
+    return {'url': get_thumbnail_url(url, size), 'srcset': get_thumbnail_srcset(url, size),
+            'webp_srcset': get_thumbnail_srcset(url, size, webp=True),
+            'css_class': css_class, 'style': style}
+
+
+@register.simple_tag(takes_context=True)
+def user_csrf_token(context) -> str:
+    """
+    Returns the CSRF token field of a form, left empty in the pages shared by the anonymous
+    visitors, where the script of inc/_user_state.html fills it in.
+
+    Usage: <form method="post">{% user_csrf_token %}
+    """
+    if getattr(context.get('request'), 'cacheable_shell', False):
+        return mark_safe('<input type="hidden" name="csrfmiddlewaretoken" value="">')
+    return CsrfTokenNode().render(context)
@@ -2,26 +2,39 @@ from django.urls import include
 from django.urls import path
 from rest_framework import routers
 
+from online_store.settings import ASYNC_VIEWS
 from .views import *
 
 router = routers.SimpleRouter()
 router.register(r'product', ProductViewSet)
 
+
+def as_view(view, async_view):
+    """
+    Returns the async version of a hot read view under ASGI, see ASYNC_VIEWS.
+    """
+    return (async_view if ASYNC_VIEWS else view).as_view()
+
+
 urlpatterns = [
     path('', HomeView.as_view(), name='home'),
-    path('shop/', ShopView.as_view(), name='shop'),
-    path('detail/<str:slug>/', ProductDetailView.as_view(), name='detail'),
+    path('shop/', as_view(ShopView, AsyncShopView), name='shop'),
+    path('detail/<str:slug>/', as_view(ProductDetailView, AsyncProductDetailView), name='detail'),
     path('contact/', ContactView.as_view(), name='contact'),
-    path('category/<str:slug>/', CategoryView.as_view(), name='category'),
-    path('tag/<str:slug>/', TagView.as_view(), name='tag'),
-    path('brand/<str:slug>/', BrandView.as_view(), name='brand'),
+    path('category/<str:slug>/', as_view(CategoryView, AsyncCategoryView), name='category'),
+    path('tag/<str:slug>/', as_view(TagView, AsyncTagView), name='tag'),
+    path('brand/<str:slug>/', as_view(BrandView, AsyncBrandView), name='brand'),
     path('about-us/', AboutView.as_view(), name='about'),
     path('help/', HelpView.as_view(), name='help'),
     path('terms/', TermsView.as_view(), name='terms'),
-    path('search/', SearchView.as_view(), name='search'),
+    path('search/', as_view(SearchView, AsyncSearchView), name='search'),
+    path('search/autocomplete/', as_view(AutocompleteView, AsyncAutocompleteView),
+         name='autocomplete'),
     path('filter/', view=FilterView.as_view(), name='filter'),
     path('skip_filter/', view=SkipFilterView.as_view(), name='skip_filter'),
     path('add_review/', AddReviewView.as_view(), name='add_review'),
     path('send_user_mail', SendUserMailView.as_view(), name='send_user_mail'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('feed/', CatalogFeedView.as_view(), name='catalog_feed'),
     path('api/', include(router.urls)),
 ]
@@ -1,36 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import ListView
 
+from online_store.async_utils import run_concurrently
+from online_store.shell import CacheableShellMixin
 from .models import *
-from .services import filter_colors_by_products
-from .services import filter_manufacturers_by_products
-from .services import filter_size_by_products
+from .services import get_filter_products
+from .services import get_listing
+from .services import get_listing_facets
+from .services import get_listing_page
 
 
-class ShopMixin(ListView):
+class ShopMixin(CacheableShellMixin, ListView):
     """
     Generic mixin is for a product listing page
 
+    The product ids, the filters and the products of each page are cached per view, slug,
+    GET parameters and language, see get_listing, get_listing_facets and get_listing_page.
+    Subclasses define the products of the listing in get_listing_queryset, the GET parameters it
+    is read with in listing_params and the category, tag or brand of the page in
+    get_listing_object. Other GET parameters do not change the listing or its cache key.
+
     Passes the following data to the template:
     :title: Page title
     :parent: The ID of the parent category to filter by.
     :product_list_pk: List of product PKs
-    :color_filter: A queryset of colors that are associated with the given products
-    :size_filter: A queryset of size that are associated with the given products
-    :manufacturer_filter: A queryset of manufacturer that are associated with the given products
+    :color_filter: A list of colors that are associated with the given products
+    :size_filter: A list of size that are associated with the given products
+    :manufacturer_filter: A list of manufacturer that are associated with the given products
     """
     template_name = 'shop/shop.html'
     paginate_by = 9
     model = Product
     context_object_name = 'product_list'
     allow_empty = True
+    listing_object = None
+    listing_params = ()
+
+    def get_listing_queryset(self):
+        """
+        Returns the products of the listing, in the order they are displayed, all products by
+        default.
+        """
+        return get_filter_products()
+
+    def get_listing_facet_ids(self, ids: list) -> list:
+        """
+        Returns the product ids used to build the color, size and manufacturer filters.
+        """
+        return ids
+
+    def get_listing_object(self):
+        """
+        Returns the category, tag or brand of the page, or None.
+        """
+        return None
+
+    def resolve_listing_object(self):
+        """
+        Returns the category, tag or brand of the page, before its listing is read and cached.
+
+        :raises Http404: If there is no category, tag or brand with the slug of the page.
+        """
+        listing_object = self.get_listing_object()
+        if listing_object is None and 'slug' in self.kwargs:
+            raise Http404
+        return listing_object
+
+    def get_listing_name(self) -> str:
+        """
+        Returns the name the listing is cached under.
+        """
+        return type(self).__name__
+
+    def load_listing(self) -> dict:
+        return get_listing(view_name=self.get_listing_name(),
+                           slug=self.kwargs.get('slug', ''),
+                           params=self.request.GET,
+                           param_names=self.listing_params,
+                           get_products=self.get_listing_queryset,
+                           get_facet_ids=self.get_listing_facet_ids)
+
+    def load_facets(self) -> dict:
+        return get_listing_facets(self.listing)
+
+    def load_page(self, page) -> list:
+        return get_listing_page(self.listing, page.number, list(page.object_list))
+
+    def get_queryset(self):
+        self.listing_object = self.resolve_listing_object()
+        self.listing = self.load_listing()
+        self.product_list_pk = self.listing['facet_ids']
+        return self.listing['ids']
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = self.load_page(page)
+        return paginator, page, page.object_list, is_paginated
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
+        facets = self.load_facets()
         context['title'] = _("All products")
         context['parent'] = None
         context['product_list_pk'] = self.product_list_pk
-        context['color_filter'] = filter_colors_by_products(self.product_list_pk)
-        context['size_filter'] = filter_size_by_products(self.product_list_pk)
-        context['manufacturer_filter'] = filter_manufacturers_by_products(self.product_list_pk)
+        context['color_filter'] = facets['colors']
+        context['size_filter'] = facets['sizes']
+        context['manufacturer_filter'] = facets['manufacturers']
         return context
+
+
+class AsyncShopMixin:
+    """
+    Serves a ShopMixin view asynchronously, for the ASGI deployment, see ASYNC_VIEWS.
+
+    The category, tag or brand of the page is read first, so an unknown slug is answered with 404
+    before a listing is cached for it, then the listing, then the filters at the same time as the
+    products of the page. The listing is shared with the synchronous view. The template is
+    rendered by Django in a thread, the context processors and template tags query the database.
+    """
+
+    def get_listing_name(self) -> str:
+        return type(self).__name__.removeprefix('Async')
+
+    async def get(self, request, *args, **kwargs):
+        self.listing_object = await sync_to_async(self.resolve_listing_object)()
+        self.listing = await sync_to_async(self.load_listing)()
+        self.product_list_pk = self.listing['facet_ids']
+        self.object_list = self.listing['ids']
+
+        paginator, page, ids, is_paginated = super(ShopMixin, self).paginate_queryset(
+            self.object_list, self.paginate_by)
+        self.facets, self.page_products = await run_concurrently(
+            lambda: get_listing_facets(self.listing),
+            lambda: get_listing_page(self.listing, page.number, list(ids)))
+
+        return self.render_to_response(self.get_context_data())
+
+    def load_facets(self) -> dict:
+        return self.facets
+
+    def load_page(self, page) -> list:
+        return self.page_products
@@ -1,23 +1,66 @@
-from django.core.cache import cache
+import os
+import time
+from typing import List
+from typing import Tuple
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.paginator import InvalidPage
+from django.http import Http404
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.middleware.gzip import re_accepts_gzip
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from django.views import View
 from django.views.generic import DetailView
 from django.views.generic import TemplateView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-
+from rest_framework.response import Response
+
+from online_store.cache_stats import InstrumentedCache
+from online_store.file_responses import get_protected_file_response
+from online_store.shell import CacheableShellMixin
+from online_store.settings import CATALOG_FEED_RATE_PERIOD
+from online_store.settings import PRODUCT_API_CACHE_TIMEOUT
+from online_store.settings import PRODUCT_API_MAX_IDS
+from .forms import CatalogFeedForm
 from .forms import ReviewsForm
 from .serializers import ProductSerializer
+from .serializers import get_product_readers
+from .serializers import select_product_values
+from .serializers import serialize_product_values
 from .services import add_or_update_review, ProductFilter
 from .services import apply_product_filters
+from .services import count_catalog_feed_download
+from .services import format_catalog_feed
+from .services import get_autocomplete_products
+from .services import get_catalog_feed_client
+from .services import get_catalog_feed_path
+from .services import get_catalog_feed_products
 from .services import get_filter_products
 from .services import get_nested_category_ids
 from .services import get_product_active_color
 from .services import get_product_active_size
+from .services import get_product_api_etag
 from .services import get_product_ids
+from .services import get_product_stamp
+from .services import get_rating_histogram
+from .services import get_reviews_cursor
+from .services import get_reviews_page
+from .services import gzip_stream
 from .services import send_contact_form_message
 from .utils import *
 
@@ -28,8 +71,10 @@ class FilterView(ShopMixin):
     """
     A view for filtering products by selected attributes.
     """
+    listing_params = ('min_price', 'max_price', 'color', 'size', 'manufacturer',
+                      'product_list_pk')
 
-    def get_queryset(self):
+    def get_listing_queryset(self):
         """
         Filters the product by the selected attributes.
 
@@ -43,8 +88,10 @@ class FilterView(ShopMixin):
         Returns:
             A queryset of filtered products.
         """
-        self.product_list_pk = get_product_ids(self.request.GET.get('product_list_pk'))
-        return apply_product_filters(request=self.request, pk_list=self.product_list_pk)
+        return apply_product_filters(request=self.request, pk_list=self.get_listing_facet_ids())
+
+    def get_listing_facet_ids(self, ids: list = None) -> list:
+        return get_product_ids(self.request.GET.get('product_list_pk'))
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -56,11 +103,13 @@ class SkipFilterView(ShopMixin):
     """
     A view for resetting enabled filters.
     """
+    listing_params = ('product_list_pk',)
 
-    def get_queryset(self):
-        self.product_list_pk = get_product_ids(self.request.GET.get('product_list_pk'))
-        queryset = get_filter_products(pk__in=self.product_list_pk)
-        return queryset
+    def get_listing_queryset(self):
+        return get_filter_products(pk__in=self.get_listing_facet_ids())
+
+    def get_listing_facet_ids(self, ids: list = None) -> list:
+        return get_product_ids(self.request.GET.get('product_list_pk'))
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -73,19 +122,6 @@ class ShopView(ShopMixin):
     A view for displaying all available products.
     """
 
-    def get_queryset(self):
-        price_cashe_name = 'shop_view'
-        product_cache = cache.get(price_cashe_name)
-
-        if product_cache:
-            product = product_cache
-        else:
-            product = get_filter_products()
-            cache.set(price_cashe_name, product, 60 * 60)
-
-        self.product_list_pk = get_product_ids()
-        return product
-
 
 class CategoryView(ShopMixin):
     """
@@ -93,19 +129,19 @@ class CategoryView(ShopMixin):
     """
     slug_url_kwarg = 'slug'
 
-    def get_queryset(self):
-        self.cat = Category.get_category_by_slug(slug=self.kwargs['slug'])
+    def get_listing_object(self):
+        return Category.get_category_by_slug(slug=self.kwargs['slug'])
+
+    def get_listing_queryset(self):
         list_categories_pk = get_nested_category_ids(category_slug=self.kwargs['slug'])
-        product = get_filter_products(category_id__in=list_categories_pk)
-        self.product_list_pk = get_product_ids(product)
-        return product
+        return get_filter_products(category_id__in=list_categories_pk)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['title'] = self.cat
-        context['slug'] = self.cat.slug
-        context['parent'] = self.cat.pk
+        context['title'] = self.listing_object
+        context['slug'] = self.listing_object.slug
+        context['parent'] = self.listing_object.pk
         return context
 
 
@@ -115,16 +151,16 @@ class TagView(ShopMixin):
     """
     slug_url_kwarg = 'slug'
 
-    def get_queryset(self):
-        self.tag = Tag.get_tag_by_slug(self.kwargs['slug'])
-        product = get_filter_products(tags=self.tag)
-        self.product_list_pk = get_product_ids(product)
-        return product
+    def get_listing_object(self):
+        return Tag.get_tag_by_slug(self.kwargs['slug'])
+
+    def get_listing_queryset(self):
+        return get_filter_products(tags__slug=self.kwargs['slug'])
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['title'] = self.tag
-        context['slug'] = self.tag.pk
+        context['title'] = self.listing_object
+        context['slug'] = self.listing_object.pk
         context['parent'] = False
         return context
 
@@ -135,21 +171,45 @@ class BrandView(ShopMixin):
     """
     slug_url_kwarg = 'slug'
 
-    def get_queryset(self):
-        self.brand = Manufacturer.get_brand_by_slug(self.kwargs['slug'])
-        product = get_filter_products(manufacturer=self.brand)
-        self.product_list_pk = get_product_ids(product)
-        return product
+    def get_listing_object(self):
+        return Manufacturer.get_brand_by_slug(self.kwargs['slug'])
+
+    def get_listing_queryset(self):
+        return get_filter_products(manufacturer__slug=self.kwargs['slug'])
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['title'] = self.brand
-        context['slug'] = self.brand.pk
+        context['title'] = self.listing_object
+        context['slug'] = self.listing_object.pk
         context['parent'] = False
         return context
 
 
-class HomeView(ListView):
+class AsyncShopView(AsyncShopMixin, ShopView):
+    """
+    The async version of ShopView.
+    """
+
+
+class AsyncCategoryView(AsyncShopMixin, CategoryView):
+    """
+    The async version of CategoryView.
+    """
+
+
+class AsyncTagView(AsyncShopMixin, TagView):
+    """
+    The async version of TagView.
+    """
+
+
+class AsyncBrandView(AsyncShopMixin, BrandView):
+    """
+    The async version of BrandView.
+    """
+
+
+class HomeView(CacheableShellMixin, ListView):
     """
     A view for displaying the main page of the site.
     """
@@ -176,32 +236,76 @@ class SendUserMailView(TemplateView):
         return render(request, self.template_name)
 
 
-class ProductDetailView(DetailView):
+class ProductDetailView(CacheableShellMixin, DetailView):
     """
     A view for displaying the detailed page of a product card.
     """
     model = Product
     template_name = 'shop/detail.html'
     context_object_name = 'context'
+    product_data = None
+
+    def get_object(self, queryset=None):
+        try:
+            return Product.get_product_by_slug(self.kwargs['slug'])
+        except Product.DoesNotExist:
+            raise Http404
+
+    def get_active_variety(self, product: Product) -> tuple:
+        """
+        Returns the color and the size selected in the GET parameters, or the default ones.
+        """
+        active_color = get_product_active_color(product=product,
+                                                color=self.request.GET.get('color'))
+        active_size = get_product_active_size(active_color=active_color,
+                                              size=self.request.GET.get('size'))
+        return active_color, active_size
+
+    def get_product_queries(self, product: Product) -> dict:
+        """
+        Returns the independent reads of the product page by the name of their data.
+        """
+        return {
+            'colors': lambda: list(product.get_color(available=False)),
+            'active_variety': lambda: self.get_active_variety(product),
+            'reviews': lambda: get_reviews_page(
+                product_id=product.pk,
+                after=get_reviews_cursor(self.request.GET.get('reviews_after'))),
+            'rating_histogram': lambda: get_rating_histogram(product),
+        }
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = Product.get_product_by_slug(self.kwargs['slug'])
-        active_size = self.request.GET.get('size')
-        active_color = self.request.GET.get('color')
+        product = self.object
+        data = self.product_data
+        if data is None:
+            data = {name: query() for name, query in self.get_product_queries(product).items()}
 
         context['title'] = product.title
         context['product'] = product
         context['slug'] = product.category.pk
-        context['colors'] = product.get_color(available=False)
+        context['colors'] = data['colors']
         context['form'] = ReviewsForm
-        context['active_color'] = get_product_active_color(product=product, color=active_color)
-        context['active_size'] = get_product_active_size(active_color=context['active_color'],
-                                                         size=active_size,
-                                                         )
+        context['active_color'], context['active_size'] = data['active_variety']
+        context['reviews'], context['reviews_next'] = data['reviews']
+        context['rating_histogram'] = data['rating_histogram']
         return context
 
 
+class AsyncProductDetailView(ProductDetailView):
+    """
+    The async version of ProductDetailView.
+    Reads the colors, the active variety, the reviews and the rating histogram of the product
+    at the same time.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await sync_to_async(self.get_object)()
+        queries = self.get_product_queries(self.object)
+        self.product_data = dict(zip(queries, await run_concurrently(*queries.values())))
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
 class AboutView(TemplateView):
     """
     A view for displaying the about page.
@@ -273,6 +377,54 @@ class SearchView(ListView):
         return context
 
 
+class AsyncSearchView(SearchView):
+    """
+    The async version of SearchView.
+    Counts the found products, then reads the products of the page, like SearchView pages them.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        paginator = self.get_paginator(self.object_list, self.paginate_by)
+        page_number = self.kwargs.get(self.page_kwarg) or request.GET.get(self.page_kwarg) or 1
+        await sync_to_async(lambda: paginator.count)()
+        try:
+            number = paginator.num_pages if page_number == 'last' else int(page_number)
+        except ValueError:
+            raise Http404(_('That page number is not an integer'))
+        try:
+            page = paginator.page(number)
+        except InvalidPage as error:
+            raise Http404(str(error))
+
+        page.object_list = await sync_to_async(list)(page.object_list)
+        self.pagination = (paginator, page, page.object_list, page.has_other_pages())
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.pagination
+
+
+class AutocompleteView(View):
+    """
+    A view for the search suggestions, returns the titles and urls of the products whose title
+    contains the text in JSON.
+    """
+
+    def get(self, request):
+        return JsonResponse({'products': get_autocomplete_products(request.GET.get('text', ''))})
+
+
+class AsyncAutocompleteView(View):
+    """
+    The async version of AutocompleteView.
+    """
+
+    async def get(self, request):
+        products = await sync_to_async(get_autocomplete_products)(request.GET.get('text', ''))
+        return JsonResponse({'products': products})
+
+
 class AddReviewView(View):
     """
     A view for adding a product review if the form is valid and the user is authenticated.
@@ -303,13 +455,169 @@ def custom_page_server_error(request):
     return render(request, 'shop/page_error.html', context=context, status=500)
 
 
+@method_decorator(staff_member_required, name='dispatch')
+class CacheStatsView(View):
+    """
+    A view for displaying the hits, misses, sets, deletes and evictions of the default cache
+    per key namespace in JSON, for staff only.
+    Pass keys=1 to also count the keys and their memory per namespace.
+    """
+
+    def get(self, request):
+        if not isinstance(caches['default'], InstrumentedCache):
+            raise Http404
+        return JsonResponse(caches['default'].get_stats(keys=request.GET.get('keys') == '1'))
+
+
+class CatalogFeedView(View):
+    """
+    A view for downloading the catalog feed in JSON lines or XML, for the partners.
+
+    The partners pass their API key in the X-Api-Key header, the staff may download the feeds
+    when signed in. Pass format as jsonl or xml, and since as a date and time for a delta feed of
+    the products changed since then. The full feed is served from the snapshot written by
+    write_catalog_feeds if the client accepts gzip, by nginx in production, the other feeds are
+    read from the database in batches while they are streamed and compressed on the fly.
+    The Last-Modified date of a feed is the since of the next delta feed. The feeds read from the
+    database are rate limited per client, see count_catalog_feed_download.
+    """
+    content_types = {'jsonl': 'application/jsonl', 'xml': 'application/xml'}
+
+    def get(self, request):
+        client = get_catalog_feed_client(request)
+        if client is None:
+            return JsonResponse({'detail': 'A valid API key is required'}, status=403)
+        form = CatalogFeedForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(form.errors, status=400)
+        since, output_format = form.cleaned_data['since'], form.cleaned_data['format']
+        accepts_gzip = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        path = get_catalog_feed_path(get_language(), output_format)
+
+        if since is None and accepts_gzip and os.path.exists(path):
+            response = get_protected_file_response(path, self.content_types[output_format])
+            response['Last-Modified'] = http_date(os.path.getmtime(path))
+        else:
+            if not count_catalog_feed_download(client):
+                response = JsonResponse({'detail': 'Too many feeds requested'}, status=429)
+                response['Retry-After'] = int(
+                    CATALOG_FEED_RATE_PERIOD - time.time() % CATALOG_FEED_RATE_PERIOD) + 1
+                return response
+            started_at = time.time()
+            content = format_catalog_feed(get_catalog_feed_products(since), output_format)
+            if accepts_gzip:
+                content = gzip_stream(content)
+            response = StreamingHttpResponse(content,
+                                             content_type=self.content_types[output_format])
+            response['Last-Modified'] = http_date(started_at)
+        if accepts_gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     """
     This viewset provides read-only functionality for the Product model. It allows users to list
     all products and retrieve a specific product instance.
+
+    Clients choose the fields with ?fields=id,title,price_now and retrieve several products at
+    once with ?ids=1,2,3. Responses carry an ETag and a Last-Modified date from the version stamp
+    of the products, so a conditional request is answered with 304 before the products are
+    selected. List responses are serialized from values() rows and cached until a product or
+    a category changes.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ProductFilter
     permission_classes = [IsAuthenticated]
+
+    def get_requested_fields(self) -> List[str]:
+        """
+        Gets the fields requested with ?fields=, all the fields if none are requested.
+        """
+        fields = [name for name in self.request.query_params.get('fields', '').split(',') if name]
+        unknown = set(fields) - set(ProductSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        return fields or ProductSerializer.Meta.fields
+
+    def get_requested_ids(self) -> List[int]:
+        """
+        Gets the ids of the products requested with ?ids=, an empty list if none are requested.
+        """
+        try:
+            ids = [int(pk) for pk in self.request.query_params.get('ids', '').split(',') if pk]
+        except ValueError:
+            raise ValidationError({'ids': 'The ids must be integers'})
+        if len(ids) > PRODUCT_API_MAX_IDS:
+            raise ValidationError({'ids': f'At most {PRODUCT_API_MAX_IDS} ids are allowed'})
+        return ids
+
+    def get_queryset(self):
+        fields = ProductSerializer.get_only_fields(self.get_requested_fields())
+        queryset = super().get_queryset().only(*fields)
+        if any(field.startswith('category__') for field in fields):
+            queryset = queryset.select_related('category')
+        ids = self.get_requested_ids()
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, fields=self.get_requested_fields(), **kwargs)
+
+    def paginate_queryset(self, queryset):
+        # The products requested by ids are returned at once
+        if self.get_requested_ids():
+            return None
+        return super().paginate_queryset(queryset)
+
+    def get_validators(self, request) -> Tuple[str, float]:
+        """
+        Gets the ETag and the time of the last change of the response.
+        """
+        stamp = get_product_stamp()
+        return get_product_api_etag(request.build_absolute_uri(request.path),
+                                    request.query_params, stamp), stamp
+
+    @staticmethod
+    def set_validators(response: HttpResponseBase, etag: str, stamp: float) -> HttpResponseBase:
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(stamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag, stamp = self.get_validators(request)
+        not_modified = get_conditional_response(request, etag=quote_etag(etag),
+                                                last_modified=int(stamp))
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, stamp)
+
+        cache_name = f'product_api:{etag}'
+        data = caches['default'].get(cache_name)
+        if data is None:
+            data = self.get_list_data()
+            caches['default'].set(cache_name, data, PRODUCT_API_CACHE_TIMEOUT)
+        return self.set_validators(Response(data), etag, stamp)
+
+    def get_list_data(self):
+        """
+        Serializes a list of products on the fast path from values() rows, see
+        serialize_product_values, the data is the same as the one of ProductSerializer.
+        """
+        columns, readers = get_product_readers(self.get_requested_fields())
+        rows = select_product_values(self.filter_queryset(self.get_queryset()), columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_product_values(page, readers)).data
+        return serialize_product_values(rows, readers)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, stamp = self.get_validators(request)
+        not_modified = get_conditional_response(request, etag=quote_etag(etag),
+                                                last_modified=int(stamp))
+        if not_modified is not None:
+            return self.set_validators(not_modified, etag, stamp)
+        return self.set_validators(super().retrieve(request, *args, **kwargs), etag, stamp)
@@ -0,0 +1,26 @@
+from django.contrib import admin
+
+from .models import StockReservation
+from .services import release_reservations
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'size', 'user_authenticated', 'quantity', 'created', 'expires']
+    list_select_related = ['size__product__product', 'size__size']
+    actions = ['release']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting a reservation without releasing it would lose its units
+        return False
+
+    @admin.action(description='Release to the stock')
+    def release(self, request, queryset):
+        released = release_reservations(queryset)
+        self.message_user(request, f'{released} units released')
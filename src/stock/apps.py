@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class StockConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'stock'
+    verbose_name = 'stock'
@@ -0,0 +1,25 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from shop.models import AttributeSize
+
+
+class StockReservation(models.Model):
+    """
+    Units of a size held for a basket in the checkout until they expire.
+
+    The units are taken from the quantity of the size when they are reserved and given back
+    when the reservation is released, see stock.services.
+    """
+    size = models.ForeignKey(AttributeSize, related_name='reservations', on_delete=models.CASCADE)
+    user_authenticated = models.CharField(max_length=128, db_index=True)
+    quantity = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.size_id} x {self.quantity}'
+
+    class Meta:
+        verbose_name = _('Stock reservation')
+        verbose_name_plural = _('Stock reservations')
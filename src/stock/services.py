@@ -0,0 +1,175 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from typing import Iterable
+from typing import List
+from typing import Set
+
+from django.db import transaction
+from django.db.models import Exists
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from basket.models import ProductInBasket
+from online_store.settings import STOCK_RESERVATION_TIMEOUT
+from shop.models import AttributeColor
+from shop.models import AttributeSize
+from shop.models import Product
+from shop.services import invalidate_cache_version
+from shop.services import touch_product_stamp
+from stock.models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """
+    Raised to roll back a reservation when some sizes do not have enough units.
+    """
+
+    def __init__(self, size_ids: Set[int]):
+        super().__init__(f'Not enough stock for the sizes {sorted(size_ids)}')
+        self.size_ids = size_ids
+
+
+def take_stock(size_id: int, quantity: int) -> bool:
+    """
+    Takes units of a size from the stock with a single conditional UPDATE, so concurrent
+    checkouts can never take more units than there are. Sizes without a quantity are not
+    tracked and always have stock.
+
+    :param size_id: The id of the size.
+    :param quantity: The number of units.
+    :return: Whether the units were taken.
+    """
+    return AttributeSize.objects.filter(
+        Q(quantity__isnull=True) | Q(quantity__gte=quantity), pk=size_id).update(
+        quantity=F('quantity') - quantity) == 1
+
+
+def return_stock(quantities: Counter) -> None:
+    """
+    Gives units of sizes back to the stock.
+
+    :param quantities: The number of units by size id.
+    """
+    # The rows are locked in the same order by all the processes to avoid deadlocks
+    for size_id, quantity in sorted(quantities.items()):
+        AttributeSize.objects.filter(pk=size_id).update(quantity=F('quantity') + quantity)
+
+
+def update_stock_availability(size_ids: Iterable[int]) -> int:
+    """
+    Derives the availability of sizes from their quantities, then the availability of their
+    colors and products, with a few UPDATE statements instead of saving each object.
+
+    :param size_ids: The ids of the sizes whose quantity changed.
+    :return: The number of sizes whose availability changed.
+    """
+    sizes = AttributeSize.objects.filter(pk__in=list(size_ids), quantity__isnull=False)
+    changed = sizes.filter(quantity__gt=0, available=False).update(available=True) + \
+        sizes.filter(quantity=0, available=True).update(available=False)
+    if not changed:
+        return 0
+
+    color_ids = set(sizes.values_list('product', flat=True))
+    product_ids = set(AttributeColor.objects.filter(pk__in=color_ids).values_list('product',
+                                                                                  flat=True))
+    with transaction.atomic():
+        AttributeColor.objects.filter(pk__in=color_ids).update(available=Exists(
+            AttributeSize.objects.filter(product=OuterRef('pk'), available=True)))
+        Product.objects.filter(pk__in=product_ids).update(available=Exists(
+            AttributeColor.objects.filter(product=OuterRef('pk'), available=True)),
+            updated_at=timezone.now())
+    for product in Product.objects.filter(pk__in=product_ids).select_related(
+            'default_varieties__size'):
+        product.set_default_variates()
+    invalidate_cache_version('listing')
+    touch_product_stamp()
+    return changed
+
+
+def _release_reservations(reservations: QuerySet) -> Counter:
+    """
+    Deletes reservations and gives their units back to the stock. The reservations locked by
+    another process are skipped, that process is releasing or replacing them.
+
+    :param reservations: The reservations to release.
+    :return: The number of released units by size id.
+    """
+    quantities = Counter()
+    with transaction.atomic():
+        rows = list(reservations.select_for_update(skip_locked=True).values_list(
+            'pk', 'size', 'quantity'))
+        StockReservation.objects.filter(pk__in=[pk for pk, _size, _quantity in rows]).delete()
+        for _pk, size_id, quantity in rows:
+            quantities[size_id] += quantity
+        return_stock(quantities)
+    return quantities
+
+
+def release_reservations(reservations: QuerySet) -> int:
+    """
+    Gives the units of reservations back to the stock and updates the availability.
+
+    :param reservations: The reservations to release.
+    :return: The number of released units.
+    """
+    quantities = _release_reservations(reservations)
+    update_stock_availability(quantities)
+    return sum(quantities.values())
+
+
+def release_expired_reservations() -> int:
+    """
+    Gives the units of the expired reservations back to the stock.
+
+    :return: The number of released units.
+    """
+    return release_reservations(StockReservation.objects.filter(expires__lte=timezone.now()))
+
+
+def reserve_stock(user_authenticated: str, items: Iterable[ProductInBasket],
+                  hold: bool = True) -> List[ProductInBasket]:
+    """
+    Reserves the units of the products in a basket, all or nothing.
+
+    The previous reservations of the basket are released in the same transaction, so the basket
+    keeps the units it already held. With hold, the units are held for STOCK_RESERVATION_TIMEOUT
+    seconds while the checkout form is filled in, otherwise they are taken for good for an
+    order; call it inside the transaction that creates the order.
+
+    :param user_authenticated: The key of the basket.
+    :param items: The products in the basket.
+    :param hold: Whether to hold the units in reservations or to take them for an order.
+    :return: The products without enough stock, nothing is reserved then.
+    """
+    items = list(items)
+    quantities = Counter()
+    for item in items:
+        if item.size_id:
+            quantities[item.size_id] += item.nmb
+
+    try:
+        with transaction.atomic():
+            released = _release_reservations(StockReservation.objects.filter(
+                user_authenticated=user_authenticated))
+            missing = {size_id for size_id, quantity in sorted(quantities.items())
+                       if not take_stock(size_id, quantity)}
+            if missing:
+                raise InsufficientStock(missing)
+            if hold:
+                expires = timezone.now() + timedelta(seconds=STOCK_RESERVATION_TIMEOUT)
+                StockReservation.objects.bulk_create(
+                    [StockReservation(size_id=size_id, user_authenticated=user_authenticated,
+                                      quantity=quantity, expires=expires)
+                     for size_id, quantity in quantities.items()])
+    except InsufficientStock as error:
+        logger.info(f'Basket {user_authenticated}: {error}')
+        return [item for item in items if item.size_id in error.size_ids]
+
+    update_stock_availability(set(quantities) | set(released))
+    return []
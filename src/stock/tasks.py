@@ -0,0 +1,14 @@
+from celery import shared_task
+from celery_singleton import Singleton
+
+
+@shared_task(base=Singleton)
+def release_expired_reservations() -> int:
+    """
+    Gives the units of the expired reservations back to the stock.
+
+    :return: The number of released units.
+    """
+    from stock import services
+
+    return services.release_expired_reservations()
@@ -1,19 +1,77 @@
 import datetime
+import io
+import json
+import math
 import tempfile
+import threading
 from decimal import Decimal
+from smtplib import SMTPException
+from unittest import mock
 
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db import transaction
 from django.db.models import QuerySet
+from django.http import QueryDict
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test import skipUnlessDBFeature
+from django.utils import timezone
+from django.utils import translation
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
 
 from basket.models import ProductInBasket
 from favorite.models import Favorite
 from news.models import Category
 from news.models import News
+from news.models import NewsletterDelivery
+from news.services import count_news_from_categories
+from news.services import create_newsletter
+from news.services import get_news_cursor
+from news.services import get_news_page
+from news.services import get_newsletter_stats
+from news.services import send_newsletter_chunk
+from news.services import start_newsletter
+from online_store.cache_policy import get_table_policy
+from online_store.cache_policy import table_stats
+from online_store.cache_stats import InstrumentedCache
+from online_store.thumbnails import get_thumbnail_srcset
+from online_store.thumbnails import get_thumbnail_url
+from online_store.thumbnails import get_thumbnails
+from online_store.thumbnails import is_thumbnail_name
+from online_store.thumbnails import make_thumbnails
+from online_store.two_tier_cache import TwoTierCache
+from online_store.two_tier_cache import get_process_id
 from orders.models import GoodsInTheOrder
 from orders.models import Order
 from orders.models import PaymentMethod
 from orders.models import PromoCode
 from orders.models import Status
+from orders.services import PROMO_CODE_ALPHABET
+from orders.services import PromoCodeUnavailable
+from orders.services import add_products_to_the_order_list
+from orders.services import format_sales_report
+from orders.services import generate_promo_codes
+from orders.services import get_promo_code
+from orders.services import get_sales_report
+from orders.services import place_order
+from orders.services import rebuild_sales_ranks
+from orders.services import redeem_promo_code
+from orders.services import reprice_order_products
+from orders.services import update_all_order_prices
+from orders.services import update_daily_sales
+from orders.services import update_order_prices
+from outbox.models import OutgoingEmail
+from outbox.services import send_outbox_emails
+from shop.admin import ProductAdminLevel
+from shop.management.commands.bench_rating_stars import get_legacy_fa_star
 from shop.models import AttributeColor
+from shop.models import AttributeColorImage
 from shop.models import AttributeSize
 from shop.models import Banner
 from shop.models import Category as Category_Product
@@ -23,9 +81,30 @@ from shop.models import Currency
 from shop.models import Delivery
 from shop.models import Manufacturer
 from shop.models import Product
+from shop.models import RatingHistogram
 from shop.models import Reviews
 from shop.models import Size
 from shop.models import Tag
+from shop.serializers import ProductSerializer
+from shop.serializers import get_product_readers
+from shop.serializers import select_product_values
+from shop.serializers import serialize_product_values
+from shop.services import add_popularity
+from shop.services import get_banner
+from shop.services import get_listing
+from shop.services import get_listing_facets
+from shop.services import get_listing_page
+from shop.services import get_or_set_locked
+from shop.services import get_popularity_log_weight
+from shop.services import get_product_rail
+from shop.services import get_rating_html
+from shop.services import get_reviews_page
+from shop.services import record_product_sales
+from shop.services import warm_product_rails
+from shop.tasks import make_image_thumbnails
+from stock.models import StockReservation
+from stock.services import release_expired_reservations
+from stock.services import reserve_stock
 from tests.test_settings import Settings
 from users.models import EmailForNews
 from users.models import User
@@ -141,6 +220,112 @@ class NewsModelTest(Settings):
         self.assertEqual(category.slug, 'big_news')
         self.assertIn(self.category_news.slug, self.category_news.get_absolute_url())
 
+    def test_news_counts(self):
+        other_category = Category.objects.create(title='Small news', slug='small_news')
+        news = News.objects.create(title='News 2', content='', category=other_category,
+                                   slug='news_2')
+        News.objects.create(title='News 3', content='', category=other_category, slug='news_3')
+        self.assertEqual(count_news_from_categories(), ([other_category, self.category_news], 3))
+        with self.assertNumQueries(0):
+            categories, _total = count_news_from_categories()
+        self.assertEqual(categories[0].cnt, 2)
+
+        news.is_published = False
+        news.save()
+        self.assertEqual(count_news_from_categories(), ([self.category_news, other_category], 2))
+        news.category = self.category_news
+        news.is_published = True
+        news.save()
+        categories, total = count_news_from_categories()
+        self.assertEqual(([category.cnt for category in categories], total), ([2, 1], 3))
+        news.delete()
+        self.assertEqual(count_news_from_categories()[1], 2)
+
+    def test_get_news_page(self):
+        other_category = Category.objects.create(title='Small news', slug='small_news')
+        for number in range(2, 5):
+            News.objects.create(title=f'News {number}', content='', category=self.category_news,
+                                slug=f'news_{number}')
+        News.objects.create(title='News 5', content='', category=other_category, slug='news_5')
+
+        news, next_cursor = get_news_page(self.category_news, limit=3)
+        self.assertEqual([item.slug for item in news], ['news_4', 'news_3', 'news_2'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_news_page(self.category_news, limit=3)[0], news)
+        cursor = next_cursor
+        news, next_cursor = get_news_page(self.category_news, get_news_cursor(cursor), 3)
+        self.assertEqual((news, next_cursor), ([self.news], None))
+        # Only the first page is cached, any cursor from a request would add a cache entry
+        with mock.patch('news.services.cache.set') as cache_set:
+            self.assertEqual(get_news_page(self.category_news, get_news_cursor(f'+0{cursor}'),
+                                           3)[0], news)
+        cache_set.assert_not_called()
+        self.assertEqual(len(get_news_page(limit=3)[0]), 3)
+
+        News.objects.filter(slug='news_4').get().delete()
+        self.assertEqual(get_news_page(self.category_news, limit=3)[0][0].slug, 'news_3')
+        self.assertIsNone(get_news_cursor('page-1'))
+        self.assertIsNone(get_news_cursor(f'{10 ** 30}-1'))
+        self.assertIsNone(get_news_cursor(f'1-{2 ** 63}'))
+        self.assertIsNone(get_news_cursor('1-0'))
+
+    def test_newsletter(self):
+        EmailForNews.objects.create(email='en@gmail.com')
+        EmailForNews.objects.create(email='uk@gmail.com', language='uk')
+        EmailForNews.objects.create(email='off@gmail.com', is_active=False)
+        self.news.title_uk = 'Новина 1'
+        self.news.save()
+
+        newsletter = create_newsletter(self.news)
+        self.assertEqual(newsletter.content['uk']['subject'], 'Новина 1')
+        self.assertIn('/uk/', newsletter.content['uk']['html'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_mock:
+            self.assertEqual(start_newsletter(newsletter, send_chunk=send_newsletter_chunk,
+                                              chunk_size=1), 2)
+        # One connection per chunk
+        self.assertEqual(open_mock.call_count, 2)
+
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['News 1', 'Новина 1'])
+        stats = get_newsletter_stats(newsletter)
+        self.assertEqual((stats['sent'], stats['pending'], stats['failed']), (2, 0, 0))
+        newsletter.refresh_from_db()
+        self.assertIsNotNone(newsletter.finished)
+        self.assertEqual(start_newsletter(newsletter, send_chunk=send_newsletter_chunk), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_newsletter_resume(self):
+        EmailForNews.objects.create(email='first@gmail.com')
+        EmailForNews.objects.create(email='second@gmail.com')
+        newsletter = create_newsletter(self.news)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=[1, SMTPException('Timeout')]):
+            with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_mock:
+                start_newsletter(newsletter, send_chunk=send_newsletter_chunk)
+        # Opened again after the SMTP error
+        self.assertEqual(open_mock.call_count, 2)
+        self.assertEqual(NewsletterDelivery.objects.filter(
+            status=NewsletterDelivery.PENDING).get().last_error, 'Timeout')
+        newsletter.refresh_from_db()
+        self.assertIsNone(newsletter.finished)
+
+        # The worker stopped while it was sending the delivery again
+        NewsletterDelivery.objects.filter(status=NewsletterDelivery.PENDING).update(
+            status=NewsletterDelivery.SENDING,
+            claimed=timezone.now() - datetime.timedelta(hours=1))
+
+        def wait_for_rate_limit():
+            # The delivery is marked before the worker waits and sends it
+            self.assertEqual(NewsletterDelivery.objects.filter(
+                status=NewsletterDelivery.SENDING).count(), 1)
+
+        with mock.patch('news.services.wait_for_rate_limit', side_effect=wait_for_rate_limit):
+            self.assertEqual(start_newsletter(newsletter, send_chunk=send_newsletter_chunk), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['second@gmail.com']])
+        self.assertEqual(get_newsletter_stats(newsletter)['sent'], 2)
+        self.assertEqual(NewsletterDelivery.objects.get(
+            subscriber__email='second@gmail.com').attempts, 3)
+
 
 class OrderModelTest(Settings):
 
@@ -208,6 +393,142 @@ class OrderModelTest(Settings):
         order = Order.objects.last()
         self.assertEqual(order.total_price, 4850)
 
+    def test_order_prices(self):
+        Product.objects.filter(pk=self.product.pk).update(price_now=2000)
+        product = GoodsInTheOrder.objects.last()
+        product.nmb = 2
+        product.save()
+        self.assertEqual(product.price_per_item, 1000)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.subtotal, order.total_price), (2000, 1850))
+
+        self.assertEqual(reprice_order_products(Order.objects.filter(pk=self.order.pk)), 1)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.subtotal, order.total_price), (4000, 3850))
+
+        empty_order = Order.objects.create(phone_number='3805000001', promo_code=self.promo_code,
+                                           delivery=self.delivery, total_price=100)
+        # Two updates in a savepoint
+        with self.assertNumQueries(4):
+            self.assertEqual(update_order_prices(Order.objects.filter(pk=empty_order.pk)), 1)
+        empty_order.refresh_from_db()
+        self.assertEqual((empty_order.total_price, empty_order.delivery), (0, None))
+        self.assertEqual(update_all_order_prices(batch_size=1), 2)
+
+    def test_place_order(self):
+        ProductInBasket.objects.create(user_authenticated='basket',
+                                       product=Product.objects.get(pk=self.product.pk), nmb=2,
+                                       size_id=self.product.get_default_size_id(),
+                                       color_id=self.product.get_default_color_id())
+        order, missing = place_order(Order(phone_number='3805000000', checkout_key='key'),
+                                     'basket')
+        self.assertEqual(missing, [])
+        self.assertEqual(Order.objects.get(pk=order.pk).total_price, 2100)
+        self.assertFalse(ProductInBasket.objects.exists())
+
+        # A repeated submit returns the order without placing it again, two queries in a savepoint
+        with self.assertNumQueries(4):
+            self.assertEqual(place_order(Order(phone_number='3805000000', checkout_key='key'),
+                                         'basket'), (order, []))
+        self.assertEqual(place_order(Order(phone_number='3805000000', checkout_key='other'),
+                                     'basket'), (None, []))
+        self.assertEqual(Order.objects.filter(checkout_key__isnull=False).count(), 1)
+
+    def test_promo_codes(self):
+        # The lookup is normalized and cached, unknown codes too
+        self.assertEqual(get_promo_code('  PROMO   1 '), self.promo_code)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_promo_code('Promo 1'), self.promo_code)
+        self.assertIsNone(get_promo_code('promo 3'))
+        PromoCode.objects.create(title='Promo 3', max_uses=1)
+        self.assertEqual(get_promo_code('promo 3').title, 'promo 3')
+
+        # Limited uses in total and per customer, the existing order of the user counts
+        promo_code = PromoCode.objects.get(title='promo 3')
+        redeem_promo_code(Order(phone_number='3805000001', promo_code=promo_code))
+        with self.assertRaises(PromoCodeUnavailable):
+            redeem_promo_code(Order(phone_number='3805000002', promo_code=promo_code))
+        PromoCode.objects.filter(pk=self.promo_code.pk).update(max_uses_per_user=1)
+        with self.assertRaises(PromoCodeUnavailable):
+            redeem_promo_code(Order(user=self.user, promo_code=self.promo_code))
+        redeem_promo_code(Order(phone_number='3805000000', promo_code=self.promo_code))
+        self.assertEqual(list(PromoCode.objects.values_list('uses', flat=True).order_by('pk')),
+                         [1, 1])
+
+        codes = generate_promo_codes(50, 100, prefix='Sale-', length=6, batch_size=20)
+        self.assertEqual(len(set(codes)), 50)
+        self.assertTrue(all(code.startswith('sale-') and len(code) == 11 for code in codes))
+        promo_code = get_promo_code(codes[0].upper())
+        self.assertEqual((promo_code.price, promo_code.max_uses), (100, 1))
+
+        with self.assertRaises(ValueError):
+            generate_promo_codes(1, 100, length=0)
+        with self.assertRaises(ValueError):
+            generate_promo_codes(len(PROMO_CODE_ALPHABET) + 1, 100, prefix='one-', length=1)
+        self.assertEqual(len(generate_promo_codes(len(PROMO_CODE_ALPHABET), 100, prefix='one-',
+                                                  length=1)), len(PROMO_CODE_ALPHABET))
+        with self.assertRaises(ValueError):
+            generate_promo_codes(1, 100, prefix='one-', length=1)
+
+    def test_sales_report(self):
+        today = timezone.localdate()
+        yesterday = today - datetime.timedelta(days=1)
+        self.assertEqual(update_daily_sales(yesterday, today + datetime.timedelta(days=1)),
+                         [yesterday, today])
+        self.assertEqual(update_daily_sales(yesterday, today), [])
+
+        product = GoodsInTheOrder.objects.last()
+        product.nmb = 3
+        product.save()
+        self.assertEqual(update_daily_sales(yesterday, today), [today])
+
+        rows = list(get_sales_report(today, today))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['orders'], rows[0]['quantity'], rows[0]['revenue']),
+                         (1, 3, 3000))
+        rows = list(get_sales_report(today, today, group_by='category'))
+        self.assertEqual((rows[0]['category'], rows[0]['category__title']),
+                         (self.category.pk, 'Bags'))
+        lines = list(format_sales_report(get_sales_report(today, today, group_by='product'),
+                                         group_by='product'))
+        self.assertEqual(lines[0].strip(), 'product,product__title,orders,quantity,revenue')
+        self.assertTrue(lines[1].startswith(f'{self.product.pk},Mini bag,1,3,3000'))
+
+    def test_sales_ranks(self):
+        now = timezone.now()
+        self.assertAlmostEqual(get_popularity_log_weight(now) - get_popularity_log_weight(
+            now - datetime.timedelta(days=14)), 1)
+        self.assertAlmostEqual(add_popularity(0, 0), 1)
+        self.assertAlmostEqual(add_popularity(1, 1), 2)
+        # The weights of sales made centuries after the epoch do not overflow
+        self.assertAlmostEqual(add_popularity(10000, 10000), 10001)
+
+        ProductInBasket.objects.create(product=Product.objects.get(pk=self.product.pk), nmb=3,
+                                       size_id=self.product.get_default_size_id(),
+                                       color_id=self.product.get_default_color_id())
+        add_products_to_the_order_list(ProductInBasket.objects.all(), self.order.pk)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.count_sale, self.product.count_sale + 3)
+        self.assertAlmostEqual(product.popularity, add_popularity(
+            self.product.popularity, math.log2(3) + get_popularity_log_weight(now)), places=4)
+        self.assertFalse(ProductInBasket.objects.exists())
+
+        self.assertEqual(rebuild_sales_ranks(), 1)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.count_sale, 4)
+        self.assertAlmostEqual(product.popularity, add_popularity(0, 2 + get_popularity_log_weight(
+            timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0))))
+
+    def test_sales_ranks_admin_save(self):
+        product = Product.objects.get(pk=self.product.pk)
+        record_product_sales({product.pk: 2})
+        product.discount = 10
+        ProductAdminLevel(Product, admin.site).save_model(None, product, None, change=True)
+        product.refresh_from_db()
+        self.assertEqual((product.count_sale, product.discount),
+                         (self.product.count_sale + 2, 10))
+        self.assertGreater(product.popularity, self.product.popularity)
+
 
 class ShopModelTest(Settings):
 
@@ -321,6 +642,146 @@ class ShopModelTest(Settings):
         self.assertEqual(banner.title, 'Ban')
         self.assertEqual(banner.tag, self.tag)
 
+    def test_get_banner(self):
+        banner = Banner.objects.create(title='Ban', tag=self.tag)
+        data = get_banner(banner.pk)
+        self.assertEqual(data['title'], 'Sale')
+        self.assertIn(self.tag.slug, data['url'])
+        self.assertEqual(get_banner(banner.pk + 1), data)
+
+        self.tag.title = 'Black Friday'
+        self.tag.save()
+        self.assertEqual(get_banner(banner.pk)['title'], 'Black Friday')
+
+    def test_get_product_rail(self):
+        self.assertEqual(warm_product_rails(), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_product_rail(tags=self.tag.pk), [self.product])
+            self.assertEqual(get_product_rail(), [self.product])
+
+        self.product.count_sale = 10
+        self.product.save()
+        self.assertEqual(get_product_rail(category=self.category.pk)[0].count_sale, 10)
+        # The sales are counted without signals
+        with self.captureOnCommitCallbacks(execute=True):
+            record_product_sales({self.product.pk: 2})
+        self.assertEqual(get_product_rail(category=self.category.pk)[0].count_sale, 12)
+
+    def test_get_listing(self):
+        def get_listing_for_tag(params='page=2'):
+            return get_listing(view_name='TagView', slug=self.tag.slug,
+                               params=QueryDict(params), param_names=('color',),
+                               get_products=lambda: Product.objects.filter(tags=self.tag),
+                               get_facet_ids=lambda ids: ids)
+
+        listing = get_listing_for_tag()
+        self.assertEqual(listing['ids'], [self.product.pk])
+        self.assertEqual(get_listing_facets(listing)['colors'], [self.color])
+        self.assertEqual(get_listing_facets(listing)['manufacturers'], [self.manufacturer])
+        self.assertEqual(get_listing_page(listing, 1, listing['ids']), [self.product])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_listing_for_tag()['cache_name'], listing['cache_name'])
+            self.assertEqual(get_listing_for_tag('utm_source=mail')['cache_name'],
+                             listing['cache_name'])
+            self.assertEqual(get_listing_facets(listing)['sizes'], [self.size])
+            self.assertEqual(get_listing_page(listing, 1, listing['ids']), [self.product])
+
+        self.assertNotEqual(get_listing_for_tag('color=red')['cache_name'], listing['cache_name'])
+
+        self.tag.title = 'New title'
+        self.tag.save()
+        self.assertNotEqual(get_listing_for_tag()['cache_name'], listing['cache_name'])
+
+    def test_get_or_set_locked(self):
+        cache.delete('locked_value')
+        cache.add('locked_value:lock', 1)
+        cache.set('locked_value', 'cached', 60)
+        self.assertEqual(get_or_set_locked('locked_value', lambda: 'computed', 60), 'cached')
+
+        cache.delete('locked_value')
+        cache.delete('locked_value:lock')
+        self.assertEqual(get_or_set_locked('locked_value', lambda: 'computed', 60), 'computed')
+        self.assertIsNone(cache.get('locked_value:lock'))
+        self.assertEqual(cache.get('locked_value'), 'computed')
+
+    def test_cache_table_policy(self):
+        self.assertEqual(get_table_policy('shop_category'), 'cachalot')
+        self.assertEqual(get_table_policy('shop_product'), 'read_model')
+        self.assertEqual(get_table_policy('basket_productinbasket'), 'never')
+        self.assertEqual(get_table_policy('captcha_captchastore'), 'never')
+
+        table_stats.reset()
+        table_stats.record('shop_category', 'hit', 3)
+        table_stats.record('shop_category', 'miss')
+        stats = table_stats.get()
+        self.assertEqual(stats['shop_category'],
+                         {'policy': 'cachalot', 'hit': 3, 'miss': 1, 'invalidation': 0})
+        table_stats.record('shop_category', 'invalidation')
+        self.assertEqual(table_stats.get()['shop_category']['invalidation'], 1)
+        table_stats.reset()
+        self.assertEqual(table_stats.get()['shop_category']['hit'], 0)
+
+    def test_instrumented_cache(self):
+        cache = InstrumentedCache('instrumented', {
+            'WRAPPED_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 20, 'CULL_FREQUENCY': 2}})
+        cache.clear()
+        cache.set('reviews:1', 'page')
+        self.assertEqual(cache.get('reviews:1'), 'page')
+        self.assertIsNone(cache.get('reviews:2'))
+        self.assertEqual(cache.get_many(['reviews:1', 'banner_registry:en']), {'reviews:1': 'page'})
+        cache.delete('reviews:1')
+        for number in range(21):
+            cache.set(f'listing:{number}', number)
+
+        stats = cache.get_stats(keys=True)
+        self.assertEqual(stats['backend'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(stats['namespaces']['reviews'],
+                         {'hit': 2, 'miss': 1, 'set': 1, 'delete': 1, 'eviction': 0,
+                          'hit_rate': 0.667})
+        self.assertEqual(stats['namespaces']['banner_registry']['miss'], 1)
+        self.assertEqual(stats['namespaces']['listing']['eviction'], 10)
+        self.assertEqual(stats['namespaces']['listing']['keys'], 11)
+
+        cache.reset_stats()
+        self.assertEqual(cache.get_stats()['namespaces'], {})
+
+    def test_two_tier_cache(self):
+        cache = TwoTierCache('two_tier', {
+            'REMOTE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'INVALIDATION_CHANNEL': 'two_tier', 'LOCAL_MAX_ENTRIES': 2, 'LOCAL_TIMEOUT': 60,
+            'REMOTE_ONLY_KEYS': ['*_version']})
+        cache.clear()
+        cache.set('currency', 'UAH')
+        self.assertEqual(cache.get('currency'), 'UAH')
+
+        # Another process changes the value in the shared cache
+        cache.remote.set('currency', 'USD')
+        self.assertEqual(cache.get('currency'), 'UAH')
+        self.assertEqual(cache.get_many(['currency', 'delivery']), {'currency': 'UAH'})
+        cache.apply_invalidation(json.dumps({'origin': 'other',
+                                             'keys': [cache.make_key('currency')]}))
+        self.assertEqual(cache.get('currency'), 'USD')
+
+        cache.apply_invalidation(json.dumps({'origin': get_process_id(), 'keys': None}))
+        self.assertEqual(len(cache.local), 1)
+        cache.set('colors', ['black'])
+        cache.set('sizes', ['XL'])
+        self.assertEqual(cache.get_many(['currency', 'colors', 'sizes']),
+                         {'currency': 'USD', 'colors': ['black'], 'sizes': ['XL']})
+        self.assertEqual(len(cache.local), 2)
+        self.assertTrue(cache.add('sizes_count', 1))
+        self.assertEqual(cache.incr('sizes_count'), 2)
+
+        # The versions are not kept in the local cache
+        cache.local.clear()
+        cache.set('listing_version', 1)
+        self.assertEqual(cache.get_many(['listing_version']), {'listing_version': 1})
+        cache.remote.set('listing_version', 2)
+        self.assertEqual(cache.get('listing_version'), 2)
+        self.assertTrue(cache.has_key('listing_version'))
+        self.assertEqual(len(cache.local), 0)
+
     def test_model_currency(self):
         currency = Currency.objects.last()
         self.assertEqual(currency.title, 'UAH')
@@ -344,6 +805,119 @@ class ShopModelTest(Settings):
         self.assertEqual(product.rating, 2)
         self.assertEqual(product.count_reviews, 1)
 
+    def test_model_rating_histogram(self):
+        histogram = RatingHistogram.get_histogram(self.product.pk)
+        self.assertEqual(histogram.get_counts(), [0, 0, 0, 1, 0])
+        self.assertEqual(histogram.get_count(), 1)
+        self.assertEqual(histogram.get_average(), 4)
+        self.assertEqual(histogram.get_distribution()[1], {'stars': 4, 'count': 1, 'percent': 100})
+
+    def test_model_rating_histogram_update_and_delete(self):
+        review = Reviews.objects.last()
+        review.rating = Reviews.RATINGS[1][0]
+        review.save()
+        histogram = RatingHistogram.get_histogram(self.product.pk)
+        self.assertEqual(histogram.get_counts(), [0, 1, 0, 0, 0])
+
+        review.delete()
+        histogram.refresh_from_db()
+        self.assertEqual(histogram.get_count(), 0)
+        self.assertEqual(histogram.get_average(), 0)
+
+    def test_get_rating_html(self):
+        self.assertEqual(get_rating_html(Decimal(4)), get_rating_html(4.0))
+        self.assertEqual(get_rating_html(4).count('fas fa-star '), 4)
+        self.assertEqual(get_rating_html(3.5).count('fas fa-star '), 4)
+        self.assertEqual(get_rating_html(3.8).count('fas fa-star '), 4)
+        self.assertEqual(get_rating_html(Decimal('4.4')).count('fa-star-half-alt'), 1)
+        self.assertEqual(get_rating_html(4.3), get_rating_html(4))
+        self.assertEqual(get_rating_html(4.7), get_rating_html(5))
+        # The same stars as drawn by the loop the lookup table replaced
+        for hundredths in range(501):
+            self.assertEqual(get_rating_html(Decimal(hundredths) / 100),
+                             get_legacy_fa_star(hundredths / 100))
+        self.assertEqual(get_rating_html(None).count('far fa-star'), 5)
+
+    def test_get_reviews_page(self):
+        for number in range(3):
+            user = User.objects.create(email=f'user{number}@gmail.com', password='aaaa12154')
+            Reviews.objects.create(user=user, product=self.product, text='Text', rating=5)
+
+        reviews, next_cursor = get_reviews_page(self.product.pk, limit=2)
+        self.assertEqual(len(reviews), 2)
+        self.assertEqual(next_cursor, reviews[-1].pk)
+
+        reviews, next_cursor = get_reviews_page(self.product.pk, after=next_cursor, limit=2)
+        self.assertEqual(len(reviews), 2)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(reviews[-1], self.review)
+
+    def test_product_values_serializer(self):
+        Product.objects.create(title='Без категорії', title_en='', slug='no-category',
+                               description='', param='', price=10, category=None, currency=None,
+                               country=None, manufacturer=None)
+        products = Product.objects.order_by('pk')
+
+        for language, fields in (('en', ProductSerializer.Meta.fields), ('uk', ['title', 'rating']),
+                                 ('uk', ['category_title', 'price_now', 'available'])):
+            with translation.override(language):
+                columns, readers = get_product_readers(fields)
+                with self.assertNumQueries(1):
+                    data = serialize_product_values(select_product_values(products, columns),
+                                                    readers)
+                self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(
+                    ProductSerializer(products, many=True, fields=fields).data))
+        self.assertEqual(data[-1]['category_title'], None)
+
+    def test_thumbnails(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            buffer = io.BytesIO()
+            Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+            name = default_storage.save('images/bag.jpg', ContentFile(buffer.getvalue()))
+            url = default_storage.url(name)
+            self.assertEqual(get_thumbnail_url(url, 'card'), url)
+
+            with mock.patch('shop.tasks.make_image_thumbnails.delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                AttributeColorImage.objects.create(product=self.attribute_color, images=name)
+            delay.assert_called_once_with(name)
+            # Only a new or replaced image is resized again
+            image = AttributeColorImage.objects.get(images=name)
+            with mock.patch('shop.tasks.make_image_thumbnails.delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                image.save()
+            delay.assert_not_called()
+
+            self.assertEqual(make_image_thumbnails(name), 6)
+            self.assertEqual(make_image_thumbnails(name), 0)
+            # The derivatives are found without checking the storage on each render
+            with mock.patch.object(default_storage, 'exists') as exists:
+                self.assertEqual(get_thumbnail_url(url, 'card'), '/media/images/bag.card.jpg')
+            exists.assert_not_called()
+
+            names = make_thumbnails(name)
+            self.assertEqual(len(names), 6)
+            self.assertTrue(all(is_thumbnail_name(thumbnail) for thumbnail in names))
+            self.assertFalse(is_thumbnail_name(name))
+            with default_storage.open('images/bag.card.webp') as file:
+                self.assertEqual(Image.open(file).size, (400, 200))
+            self.assertEqual(get_thumbnail_url(url, 'card'), '/media/images/bag.card.jpg')
+            self.assertEqual(get_thumbnail_srcset(url, 'card', webp=True),
+                             '/media/images/bag.card.webp 1x, /media/images/bag.detail.webp 2x')
+            self.assertEqual(get_thumbnail_url('/static/empty.png', 'card'), '/static/empty.png')
+
+            # A partial set found in the storage is cached briefly, the full one for long
+            with mock.patch('online_store.thumbnails.cache') as thumbnails_cache, \
+                    mock.patch('online_store.thumbnails.THUMBNAIL_CACHE_TIMEOUT', 100), \
+                    mock.patch('online_store.thumbnails.THUMBNAIL_MISSING_CACHE_TIMEOUT', 10):
+                thumbnails_cache.get.return_value = None
+                self.assertEqual(len(get_thumbnails(name)), 6)
+                default_storage.delete('images/bag.zoom.webp')
+                self.assertEqual(len(get_thumbnails(name)), 5)
+            self.assertEqual([call.args[2] for call in thumbnails_cache.set.call_args_list],
+                             [100, 10])
+
 
 class UserModelTest(Settings):
 
@@ -383,3 +957,227 @@ class UserModelTest(Settings):
         self.assertEqual(email.email, 'zsu@gmail.com')
         self.assertTrue(email.is_active)
 
+
+@override_settings(EMAIL_BACKEND='outbox.backends.OutboxEmailBackend')
+class OutboxModelTest(Settings):
+
+    def test_outbox_send(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            mail.send_mail('Subject', 'Text', 'shop@example.com', ['user@example.com'],
+                           html_message='<p>Text</p>')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        self.assertEqual(email.to, ['user@example.com'])
+
+        self.assertEqual(send_outbox_emails(batch_size=1), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Text</p>', 'text/html')])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(send_outbox_emails(), 0)
+
+    def test_outbox_retry(self):
+        mail.send_mail('Subject', 'Text', 'shop@example.com', ['user@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=SMTPException('Timeout')):
+            self.assertEqual(send_outbox_emails(), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'Timeout')
+        self.assertGreater(email.send_after, timezone.now())
+        self.assertEqual(send_outbox_emails(), 0)
+
+        OutgoingEmail.objects.update(send_after=timezone.now(), attempts=4)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=SMTPException('Timeout')):
+            send_outbox_emails()
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_outbox_connection(self):
+        for _ in range(3):
+            mail.send_mail('Subject', 'Text', 'shop@example.com', ['user@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_mock, \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.close') as close_mock:
+            self.assertEqual(send_outbox_emails(batch_size=2), 3)
+        self.assertEqual((open_mock.call_count, close_mock.call_count), (1, 1))
+        self.assertEqual(len(mail.outbox), 3)
+
+        OutgoingEmail.objects.update(status=OutgoingEmail.PENDING)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_mock, \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                           side_effect=[SMTPException('Timeout'), 1, ValueError('Header')]):
+            self.assertEqual(send_outbox_emails(), 3)
+        # Opened again after the SMTP error
+        self.assertEqual(open_mock.call_count, 2)
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list('status', 'last_error').order_by('pk')),
+            [(OutgoingEmail.PENDING, 'Timeout'), (OutgoingEmail.SENT, ''),
+             (OutgoingEmail.PENDING, 'Header')])
+
+    def test_outbox_claim(self):
+        mail.send_mail('Subject', 'Text', 'shop@example.com', ['user@example.com'])
+
+        def send_messages(messages):
+            # The email is marked before it is sent
+            self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.SENDING)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=send_messages):
+            self.assertEqual(send_outbox_emails(), 1)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.SENT)
+
+        # The worker stopped after it took the email
+        OutgoingEmail.objects.update(status=OutgoingEmail.SENDING,
+                                     claimed=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(send_outbox_emails(), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.PENDING, 2))
+        self.assertGreater(email.send_after, timezone.now())
+
+
+class StockModelTest(Settings):
+
+    def setUp(self):
+        super().setUp()
+        AttributeSize.objects.filter(pk=self.attribute_size.pk).update(quantity=5)
+
+    def get_quantity(self):
+        return AttributeSize.objects.get(pk=self.attribute_size.pk).quantity
+
+    def test_stock_reservation(self):
+        basket = [ProductInBasket(product=self.product, size=self.attribute_size, nmb=3)]
+        self.assertEqual(reserve_stock('basket 1', basket), [])
+        self.assertEqual(self.get_quantity(), 2)
+        # The units held by the basket are reserved again, not twice
+        self.assertEqual(reserve_stock('basket 1', basket), [])
+        self.assertEqual(self.get_quantity(), 2)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+
+        self.assertEqual(reserve_stock('basket 2', basket), basket)
+        self.assertEqual(self.get_quantity(), 2)
+        self.assertFalse(StockReservation.objects.filter(user_authenticated='basket 2').exists())
+
+        StockReservation.objects.update(expires=timezone.now())
+        self.assertEqual(release_expired_reservations(), 3)
+        self.assertEqual(self.get_quantity(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_stock_availability(self):
+        basket = [ProductInBasket(product=self.product, size=self.attribute_size, nmb=5)]
+        self.assertEqual(reserve_stock('basket 1', basket, hold=False), [])
+        self.assertEqual(self.get_quantity(), 0)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(AttributeSize.objects.get(pk=self.attribute_size.pk).available)
+        self.assertFalse(AttributeColor.objects.get(pk=self.attribute_color.pk).available)
+        self.assertFalse(Product.objects.get(pk=self.product.pk).available)
+
+        size = AttributeSize.objects.get(pk=self.attribute_size.pk)
+        size.quantity = 1
+        size.save()
+        self.assertTrue(AttributeSize.objects.get(pk=self.attribute_size.pk).available)
+        self.assertTrue(Product.objects.get(pk=self.product.pk).available)
+
+
+class CheckoutConcurrencyTest(TransactionTestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(title='Bag', slug='bag', description='', param='',
+                                              price_now=100, currency=None, country=None,
+                                              manufacturer=None)
+        self.color = AttributeColor.objects.create(product=self.product)
+        self.size = AttributeSize.objects.create(product=self.color, quantity=10)
+        Status.objects.create(pk=1, title='New')
+
+    def run_in_threads(self, func, count):
+        """
+        Calls the function with the numbers up to count from as many threads started at once.
+        The tests that use it need a database that locks the rows with select_for_update, SQLite
+        fails a second write transaction instead of waiting for it.
+
+        :return: The results of the calls.
+        """
+        results = []
+        start = threading.Barrier(count)
+
+        def run(number):
+            start.wait()
+            try:
+                results.append(func(number))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), count)
+        return results
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_stock_no_oversell(self):
+        def checkout(number):
+            basket = [ProductInBasket(product=self.product, size=self.size, nmb=1)]
+            # Like the checkout, which creates the order in the same transaction
+            with transaction.atomic():
+                return not reserve_stock(f'basket {number}', basket, hold=False)
+
+        sold = self.run_in_threads(checkout, 30)
+        self.size.refresh_from_db()
+        self.assertEqual((sold.count(True), self.size.quantity), (10, 0))
+        self.assertFalse(self.size.available)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_submits(self):
+        ProductInBasket.objects.create(user_authenticated='basket', product=self.product,
+                                       color=self.color, size=self.size, nmb=2)
+
+        def submit(number):
+            order, _missing = place_order(Order(phone_number='3805000000', checkout_key='key'),
+                                          'basket')
+            return order.pk
+
+        order_ids = self.run_in_threads(submit, 10)
+        self.assertEqual(len(set(order_ids)), 1)
+        self.assertEqual(Order.objects.get().pk, order_ids[0])
+        self.assertEqual(GoodsInTheOrder.objects.get().nmb, 2)
+        self.assertEqual(AttributeSize.objects.get(pk=self.size.pk).quantity, 8)
+
+        # Submits of the same basket with different keys create one order
+        ProductInBasket.objects.create(user_authenticated='basket', product=self.product,
+                                       color=self.color, size=self.size, nmb=2)
+
+        def submit_form(number):
+            order, _missing = place_order(
+                Order(phone_number='3805000000', checkout_key=f'key {number}'), 'basket')
+            return order and order.pk
+
+        order_ids = [pk for pk in self.run_in_threads(submit_form, 10) if pk]
+        self.assertEqual(len(order_ids), 1)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(ProductInBasket.objects.exists())
+
+    def test_submit_after_parallel_order(self):
+        ProductInBasket.objects.create(user_authenticated='basket', product=self.product,
+                                       color=self.color, size=self.size, nmb=2)
+        ProductInBasket.objects.create(user_authenticated='other', product=self.product,
+                                       color=self.color, size=self.size, nmb=1)
+        first_order, _missing = place_order(
+            Order(phone_number='3805000000', checkout_key='key'), 'basket')
+
+        # The other submit with the same key created its order after the lookup of this one
+        with mock.patch('orders.services.get_order_by_checkout_key',
+                        side_effect=[None, first_order]):
+            order, missing = place_order(Order(phone_number='3805000000', checkout_key='key'),
+                                         'other')
+
+        self.assertEqual((order, missing), (first_order, []))
+        self.assertEqual(Order.objects.get(), first_order)
+        self.assertEqual(GoodsInTheOrder.objects.get().nmb, 2)
+        self.assertEqual(AttributeSize.objects.get(pk=self.size.pk).quantity, 8)
+        self.assertTrue(ProductInBasket.objects.filter(user_authenticated='other').exists())
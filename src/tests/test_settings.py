@@ -4,7 +4,9 @@ import tempfile
 import tracemalloc
 
 from django.conf import settings
+from django.core.cache import caches
 from django.test import TestCase
+from django.test import override_settings
 from django.utils.translation import activate
 
 from shop.models import AttributeColor
@@ -23,12 +25,20 @@ from shop.models import Tag
 from users.models import User
 
 
+# The queries of the async views run in the thread of the test transaction to see its data,
+# the files are served by Django, the static files are not collected for the tests
+@override_settings(ASYNC_CONCURRENT_QUERIES=False, SERVE_FILES_WITH_NGINX=False,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
 class Settings(TestCase):
 
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
         os.environ.setdefault("DJANGO_SETTINGS_MODULE", "online_store.settings")
+        # Start from empty caches, entries left by an earlier run or test class
+        # would otherwise be served instead of this class's data
+        for cache in caches.all():
+            cache.clear()
         # Create a temporary folder
         tracemalloc.start()
         activate('en')
@@ -1,10 +1,22 @@
+import datetime
+import gzip
+import json
+import os
 import tempfile
+from unittest import mock
 
+from django.core.cache import cache
+from django.db import connection
 from django.db.models import QuerySet
+from django.http import Http404
+from django.test import AsyncRequestFactory
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from modeltranslation.manager import MultilingualQuerySet
+from django.utils import timezone
 
 from basket.models import ProductInBasket
+from basket.views import AsyncBasketCountView
 from favorite.models import Favorite
 from news.models import Category
 from news.models import News
@@ -14,8 +26,14 @@ from orders.models import Order
 from orders.models import PaymentMethod
 from orders.models import PromoCode
 from orders.models import Status
+from orders.services import update_daily_sales
 from shop.models import Product
 from shop.models import Reviews
+from shop.services import count_catalog_feed_download
+from shop.services import write_catalog_feeds
+from shop.views import AsyncCategoryView
+from shop.views import AsyncProductDetailView
+from shop.views import AsyncSearchView
 from tests.test_settings import Settings
 from users.forms import CommunicationForm
 from users.forms import PasswordResetForm
@@ -23,6 +41,7 @@ from users.forms import SubscriberEmailForm
 from users.forms import UpdateUserDataForm
 from users.forms import UserLoginForm
 from users.forms import UserRegisterForm
+from users.models import User
 
 
 class BasketViewsTest(Settings):
@@ -78,6 +97,22 @@ class BasketViewsTest(Settings):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(ProductInBasket.objects.last().nmb, 5)
 
+    def test_views_basket_count(self):
+        ProductInBasket.objects.create(product=self.product,
+                                       is_active=True,
+                                       size_id=self.product.get_default_size_id(),
+                                       color_id=self.product.get_default_color_id())
+        response = self.client.get(reverse('basket_count'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'count': 1})
+
+    async def test_views_async_basket_count(self):
+        request = AsyncRequestFactory().get(reverse('basket_count'))
+        request.session = {'user_authenticated': 'session'}
+        response = await AsyncBasketCountView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'count': 0})
+
 
 class FavoriteViewsTest(Settings):
     def setUp(self):
@@ -131,17 +166,24 @@ class NewsViewsTest(Settings):
                                        slug='news_1')
 
     def test_views_news(self):
-        response = self.client.get(reverse('news'))
+        response = self.client.get(reverse('news'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(type(response.context['news']), list)
+        self.assertEqual(len(response.context['news']), 1)
+        self.assertIsNone(response.context['news_next'])
+
+        # An invalid cursor gives the first page
+        response = self.client.get(reverse('news'), {'after': f'{10 ** 30}-1'}, secure=True)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(type(response.context['news']), MultilingualQuerySet)
         self.assertEqual(len(response.context['news']), 1)
 
     def test_views_news_category(self):
         response = self.client.get(
-            reverse('news_category', kwargs={'slug': self.category_news.slug}))
+            reverse('news_category', kwargs={'slug': self.category_news.slug}), secure=True)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(type(response.context['news']), MultilingualQuerySet)
+        self.assertEqual(type(response.context['news']), list)
         self.assertEqual(len(response.context['news']), 1)
+        self.assertEqual(response.context['title'], self.category_news)
 
     def test_views_news_detail(self):
         response = self.client.get(reverse('news_detail', kwargs={'slug': self.news.slug}))
@@ -159,6 +201,70 @@ class OrdersViewsTest(Settings):
         response = self.client.get(reverse('create_order'))
         self.assertEqual(response.status_code, 200)
 
+    def create_orders(self, number):
+        status = Status.objects.create(title='New')
+        payment_method = PaymentMethod.objects.create(title='Card')
+        for _x in range(number):
+            order = Order.objects.create(phone_number='3805000000', status=status,
+                                         payment_method=payment_method)
+            GoodsInTheOrder.objects.create(order=order, product=self.product,
+                                           size_id=self.product.get_default_size_id(),
+                                           color_id=self.product.get_default_color_id())
+
+    def test_views_admin_orders(self):
+        self.client.force_login(User.objects.create_superuser('admin@gmail.com', 'aaaa12154'))
+        urls = (reverse('admin:orders_order_changelist'),
+                reverse('admin:orders_goodsintheorder_changelist'))
+        self.create_orders(2)
+        for url in urls:
+            self.client.get(url, secure=True)
+
+        queries = []
+        for number in (0, 3):
+            self.create_orders(number)
+            for url in urls:
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, secure=True)
+                self.assertEqual(response.status_code, 200)
+                queries.append(len(context))
+        # The number of queries does not grow with the number of rows
+        self.assertEqual(queries[:2], queries[2:])
+
+    def test_views_admin_export_orders(self):
+        self.client.force_login(User.objects.create_superuser('admin@gmail.com', 'aaaa12154'))
+        self.create_orders(3)
+        response = self.client.post(reverse('admin:orders_order_changelist'),
+                                    {'action': 'export_csv', 'select_across': 1, 'index': 0,
+                                     '_selected_action': Order.objects.first().pk},
+                                    secure=True)
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('id,created,status__title'))
+        self.assertIn('New', lines[1])
+
+    def test_views_sales_report(self):
+        response = self.client.get(reverse('sales_report'), secure=True)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(User.objects.create_superuser('admin@gmail.com', 'aaaa12154'))
+        self.create_orders(2)
+        # The view does not roll up the orders
+        response = self.client.get(reverse('sales_report'), {'format': 'jsonl'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+        today = timezone.localdate()
+        update_daily_sales(today - datetime.timedelta(days=30), today)
+        response = self.client.get(reverse('sales_report'), {'format': 'jsonl'}, secure=True)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[-1]['orders'], 2)
+        self.assertEqual(len(rows), 31)
+
+        response = self.client.get(reverse('sales_report'), {'start': '2023-02-01',
+                                                             'end': '2023-01-01'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
 
 class UserViewsTest(Settings):
     def test_views_login(self):
@@ -241,12 +347,16 @@ class UserViewsTest(Settings):
 
 class ShopViewsTest(Settings):
     def test_views_home(self):
-        Favorite.objects.create(product=self.product,
+        self.client.get(reverse('user_state'))
+        user_authenticated = self.client.session.session_key
+        Favorite.objects.create(user_authenticated=user_authenticated,
+                                product=self.product,
                                 is_active=True,
                                 size_id=self.product.get_default_size_id(),
                                 color_id=self.product.get_default_color_id())
 
-        ProductInBasket.objects.create(product=self.product,
+        ProductInBasket.objects.create(user_authenticated=user_authenticated,
+                                       product=self.product,
                                        is_active=True,
                                        size_id=self.product.get_default_size_id(),
                                        color_id=self.product.get_default_color_id())
@@ -254,15 +364,19 @@ class ShopViewsTest(Settings):
         response = self.client.get(reverse('home'))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['category']), 1)
-        self.assertEqual(response.context['PRODUCTS_BASKET_NMB'], 1)
-        self.assertEqual(response.context['PRODUCTS_BASKET_LIST'][0], 1)
-        self.assertEqual(response.context['PRODUCTS_FAVORITE_LIST'][0], 1)
-        self.assertEqual(response.context['PRODUCTS_FAVORITE_NMB'], 1)
+        # The shared page leaves the badges to the fragment endpoint
+        self.assertEqual(response.context['PRODUCTS_BASKET_NMB'], 0)
+
+        state = self.client.get(reverse('user_state')).json()
+        self.assertEqual(state['basket_count'], 1)
+        self.assertEqual(state['basket'][0], 1)
+        self.assertEqual(state['favorite'][0], 1)
+        self.assertEqual(state['favorite_count'], 1)
 
     def test_views_shop(self):
         response = self.client.get(reverse('shop'))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(type(response.context['product_list']), MultilingualQuerySet)
+        self.assertEqual(type(response.context['product_list']), list)
         self.assertEqual(len(response.context['product_list']), 1)
         self.assertEqual(response.context['parent'], None)
 
@@ -284,6 +398,8 @@ class ShopViewsTest(Settings):
         self.assertEqual(type(response.context['product_list']), list)
         self.assertEqual(len(response.context['product_list']), 1)
         self.assertEqual(response.context['parent'], 1)
+        response = self.client.get(reverse('category', kwargs={'slug': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
 
     def test_views_tag(self):
         response = self.client.get(reverse('tag', kwargs={'slug': self.tag.slug}))
@@ -318,7 +434,7 @@ class ShopViewsTest(Settings):
     def test_views_filter(self):
         response = self.client.get(reverse('filter'))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(type(response.context['product_list']), MultilingualQuerySet)
+        self.assertEqual(type(response.context['product_list']), list)
         self.assertEqual(len(response.context['product_list']), 1)
         self.assertEqual(response.context['parent'], None)
         self.assertEqual(len(response.context['product_list_pk']), 1)
@@ -329,11 +445,57 @@ class ShopViewsTest(Settings):
     def test_views_skip_filter(self):
         response = self.client.get(reverse('skip_filter'))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(type(response.context['product_list']), MultilingualQuerySet)
+        self.assertEqual(type(response.context['product_list']), list)
         self.assertEqual(len(response.context['product_list']), 1)
         self.assertEqual(response.context['parent'], None)
         self.assertEqual(len(response.context['product_list_pk']), 1)
 
+    def test_views_autocomplete(self):
+        response = self.client.get(reverse('autocomplete'), {'text': self.product.title[:3]},
+                                   secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][0]['url'],
+                         reverse('detail', kwargs={'slug': self.product.slug}))
+
+        response = self.client.get(reverse('autocomplete'), {'text': 'a'}, secure=True)
+        self.assertEqual(response.json(), {'products': []})
+
+    async def test_views_async_category(self):
+        request = AsyncRequestFactory().get(reverse('category', kwargs={'slug': 'slug'}))
+        response = await AsyncCategoryView.as_view()(request, slug=self.category.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context_data['product_list']), 1)
+        self.assertEqual(response.context_data['title'], self.category)
+        self.assertEqual(response.context_data['color_filter'][0], self.color)
+
+        # An unknown category is not found before a listing is cached for it
+        with mock.patch('shop.utils.get_listing') as get_listing, self.assertRaises(Http404):
+            await AsyncCategoryView.as_view()(request, slug='unknown')
+        get_listing.assert_not_called()
+
+    async def test_views_async_detail(self):
+        request = AsyncRequestFactory().get(reverse('detail', kwargs={'slug': 'slug'}))
+        response = await AsyncProductDetailView.as_view()(request, slug=self.product.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['context'], self.product)
+        self.assertEqual(response.context_data['active_color'].pk, self.color.pk)
+        self.assertEqual(response.context_data['active_size'].pk, self.size.pk)
+
+    async def test_views_async_search(self):
+        request = AsyncRequestFactory().get(reverse('search'), {'text': self.product.title})
+        response = await AsyncSearchView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['paginator'].count, 1)
+        self.assertEqual(list(response.context_data['products']), [self.product])
+
+        request = AsyncRequestFactory().get(reverse('search'), {'page': 'last'})
+        response = await AsyncSearchView.as_view()(request)
+        self.assertEqual(response.context_data['page_obj'].number, 1)
+        for number in ('0', '-1', '2', 'first'):
+            request = AsyncRequestFactory().get(reverse('search'), {'page': number})
+            with self.assertRaises(Http404):
+                await AsyncSearchView.as_view()(request)
+
     def test_views_add_review(self):
         Reviews.objects.all().delete()
         count = Reviews.objects.count()
@@ -355,6 +517,152 @@ class ShopViewsTest(Settings):
         response = self.client.post(reverse('send_user_mail'), data=context)
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'online_store.cache_stats.InstrumentedCache',
+        'WRAPPED_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cache_stats'}})
+    def test_views_cache_stats(self):
+        response = self.client.get(reverse('cache_stats'), secure=True)
+        self.assertEqual(response.status_code, 302)
+
+        cache.set('listing:1', [self.product.pk])
+        cache.get('listing:1')
+        cache.get('listing:2')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cache_stats'), {'keys': '1'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()
+        self.assertEqual(stats['backend'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(stats['namespaces']['listing']['hit'], 1)
+        self.assertEqual(stats['namespaces']['listing']['miss'], 1)
+        self.assertEqual(stats['namespaces']['listing']['keys'], 1)
+
+    def test_views_product_api(self):
+        url = reverse('product-list')
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.user)
+        response = self.client.get(url, {'fields': 'id,title,category_title'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'],
+                         [{'id': self.product.pk, 'title': 'Mini bag', 'category_title': 'Bags'}])
+
+        # The ETag and the cached list are answered without selecting the products
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,title,category_title'}, secure=True,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.client.get(url, {'fields': 'id,title,category_title'}, secure=True)
+        self.assertFalse([query for query in queries if 'shop_product' in query['sql']])
+
+        # A product change gives a new ETag
+        etag = response['ETag']
+        self.product.title = 'Big bag'
+        self.product.save()
+        response = self.client.get(url, {'fields': 'id,title,category_title'}, secure=True,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Big bag')
+
+        # The links to the other pages are absolute, so each host has its own ETag
+        response = self.client.get(url, {'fields': 'id,title,category_title'}, secure=True,
+                                   HTTP_IF_NONE_MATCH=response['ETag'], HTTP_HOST='rocky.pp.ua')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, {'ids': f'{self.product.pk},0', 'fields': 'slug'},
+                                   secure=True)
+        self.assertEqual(response.json(), [{'slug': self.product.slug}])
+        response = self.client.get(url, {'fields': 'param'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('shop.services.CATALOG_FEED_API_KEYS', ['partner-key'])
+    def test_views_catalog_feed(self):
+        url = reverse('catalog_feed')
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(url, secure=True, HTTP_X_API_KEY='partner')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.defaults['HTTP_X_API_KEY'] = 'partner-key'
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        products = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(products), 1)
+        self.assertEqual((products[0]['slug'], products[0]['category']), ('mini_bag', 'Bags'))
+        self.assertEqual(products[0]['variants'],
+                         [{'color': 'black', 'size': 'XL', 'available': True}])
+
+        # A delta feed since the last change, a variant change updates the product
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get(url, {'since': timezone.now().isoformat()}, secure=True)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        changed_at = timezone.now()
+        self.attribute_size.available = False
+        self.attribute_size.save()
+        response = self.client.get(url, {'since': changed_at.isoformat(), 'format': 'xml'},
+                                   secure=True, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        xml = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(f'<product id="{self.product.pk}"><slug>mini_bag</slug>', xml)
+        self.assertIn('<variant color="black" size="XL" available="false"/>', xml)
+
+        # The full feed is served from the snapshot
+        with tempfile.TemporaryDirectory() as root, mock.patch('shop.services.CATALOG_FEED_ROOT',
+                                                               root):
+            self.assertEqual(len(write_catalog_feeds()), 4)
+            response = self.client.get(url, secure=True, HTTP_ACCEPT_ENCODING='gzip')
+            lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+            response.close()
+
+            # Behind nginx the view only tells nginx which file to send
+            with override_settings(SERVE_FILES_WITH_NGINX=True, MEDIA_ROOT=os.path.dirname(root)):
+                response = self.client.get(url, secure=True, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['X-Accel-Redirect'],
+                             f'/protected/{os.path.basename(root)}/catalog.en.jsonl.gz')
+            self.assertEqual(response.content, b'')
+        self.assertEqual(json.loads(lines[0])['variants'][0]['available'], False)
+
+        # The feeds read from the database are rate limited
+        self.assertTrue(count_catalog_feed_download('key:1', rate_limit=1))
+        self.assertFalse(count_catalog_feed_download('key:1', rate_limit=1))
+        with mock.patch('shop.views.count_catalog_feed_download', return_value=False):
+            response = self.client.get(url, {'since': changed_at.isoformat()}, secure=True)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
+
+    def test_views_cacheable_shell(self):
+        url = reverse('detail', kwargs={'slug': self.product.slug})
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(list(response.cookies), [])
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value=""')
+        self.assertContains(response, 'data-user-list="basket"')
+        response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # The state of the visitor is filled in from the fragment endpoint
+        state = self.client.get(reverse('user_state'), secure=True).json()
+        self.assertEqual((state['basket'], state['favorite_count']), ([], 0))
+        self.assertTrue(state['csrf_token'])
+        ProductInBasket.objects.create(user_authenticated=self.client.session.session_key,
+                                       product=self.product, color=self.attribute_color,
+                                       size=self.attribute_size, nmb=1)
+        response = self.client.get(reverse('user_state'), secure=True)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(response.json()['basket'], [self.attribute_size.pk])
+        response = self.client.get(url, secure=True)
+        self.assertNotIn('sessionid', response.cookies)
+
+        # The signed in visitors get their own pages and the cookie that tells nginx so
+        self.client.force_login(User.objects.last())
+        response = self.client.get(url, secure=True)
+        self.assertFalse(response.has_header('Cache-Control'))
+        self.assertEqual(response.cookies['authenticated'].value, '1')
+
     def test_views_custom_page_not_found_view(self):
         response = self.client.get('/w_my_code')
         self.assertEqual(response.status_code, 404)
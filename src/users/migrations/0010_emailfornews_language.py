@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailfornews',
+            name='language',
+            field=models.CharField(choices=[('en', 'English'), ('uk', 'Ukraine')], default='en', max_length=7),
+        ),
+    ]
@@ -3,6 +3,9 @@ from django.contrib.auth.models import UserManager
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from online_store.settings import LANGUAGE_CODE
+from online_store.settings import LANGUAGES
+
 
 class UserManger(UserManager):
     def _create_user(self, email, password, **extra_fields):
@@ -85,6 +88,7 @@ class User(AbstractUser):
 class EmailForNews(models.Model):
     email = models.EmailField(unique=True)
     is_active = models.BooleanField(default=True)
+    language = models.CharField(max_length=7, choices=LANGUAGES, default=LANGUAGE_CODE)
 
     def __str__(self):
         return self.email
@@ -5,7 +5,10 @@ from django.db.models import Q
 from django.db.models import QuerySet
 
 from basket.models import ProductInBasket
+from basket.services import get_basket_list
 from favorite.models import Favorite
+from favorite.services import get_favorite_list
+from online_store.settings import LANGUAGE_CODE
 from orders.models import Order
 from shop.models import Reviews
 from users.models import EmailForNews
@@ -50,7 +53,7 @@ def update_user_in_favorite(old_user: str, new_user: str) -> None:
         logger.error(f"Error updating user in favorites: {error}")
 
 
-def add_email_to_the_mailing_list(email: str) -> EmailForNews:
+def add_email_to_the_mailing_list(email: str, language: str = LANGUAGE_CODE) -> EmailForNews:
     """
     Add an email to the news mailing list, handling exceptions if necessary.
 
@@ -58,11 +61,12 @@ def add_email_to_the_mailing_list(email: str) -> EmailForNews:
     in the table, it raises a `EmailForNews.IntegrityError` exception.
 
     :param email: The email to add to the news mailing list.
+    :param language: The language of the newsletters sent to the email.
     :return: The `EmailForNews` object that was created.
     :raises EmailForNews.IntegrityError: If the email already exists in the `EmailForNews` table.
     """
     try:
-        return EmailForNews.objects.create(email=email)
+        return EmailForNews.objects.create(email=email, language=language)
     except EmailForNews.IntegrityError as error:
         logger.error(f"Email {email} already exists in the news mailing list: {error}")
         raise error
@@ -148,3 +152,20 @@ def get_user_reviews(request: WSGIRequest) -> QuerySet:
     except ValueError as error:
         logger.error(f"Error getting user reviews: {error}")
         raise error
+
+
+def get_user_state(user_authenticated: str) -> dict:
+    """
+    Gets the basket and favorite state of a visitor that the pages shared by the anonymous
+    visitors leave out.
+
+    :param user_authenticated: The unique identifier of the session or user's email, None for
+        a visitor without a session.
+    :return: The sizes of the products in the basket and in the favorites, and their numbers.
+    """
+    if not user_authenticated:
+        return {'basket': [], 'basket_count': 0, 'favorite': [], 'favorite_count': 0}
+    basket, basket_count = get_basket_list(user_authenticated)
+    favorite, favorite_count = get_favorite_list(user_authenticated)
+    return {'basket': list(basket), 'basket_count': basket_count,
+            'favorite': list(favorite), 'favorite_count': favorite_count}
@@ -18,4 +18,5 @@ urlpatterns = [
     path('my_product_review', login_required(MyProductReviewView.as_view()),
          name='my_product_review'),
     path('communication', login_required(CommunicationView.as_view()), name='communication'),
+    path('state/', UserStateView.as_view(), name='user_state'),
 ]
@@ -9,10 +9,14 @@ from django.contrib.auth.views import PasswordResetView as PasswordResetView_
 from django.http import Http404
 from django.http import HttpResponse
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.urls import reverse_lazy
+from django.middleware.csrf import get_token
+from django.utils.cache import add_never_cache_headers
 from django.utils.translation import gettext_lazy as _
+from django.views import View
 from django.views.generic import CreateView
 from django.views.generic import ListView
 from django.views.generic import TemplateView
@@ -32,6 +36,7 @@ from .services import get_email_from_email_the_news
 from .services import get_user
 from .services import get_user_orders
 from .services import get_user_reviews
+from .services import get_user_state
 from .services import update_user_in_basket
 from .services import update_user_in_favorite
 from .ultis import AuthorizedUserMixin
@@ -115,7 +120,7 @@ class RegisterUserView(CreateView):
         session_key = self.request.session.session_key
         update_user_in_basket(old_user=session_key, new_user=user)
         update_user_in_favorite(old_user=session_key, new_user=user)
-        add_email_to_the_mailing_list(email=user.email)
+        add_email_to_the_mailing_list(email=user.email, language=self.request.LANGUAGE_CODE)
         login(self.request, user)
         return redirect('home')
 
@@ -254,6 +259,7 @@ def subscriber_email(request) -> HttpResponse:
     if request.method == 'POST':
         form = SubscriberEmailForm(request.POST)
         if form.is_valid():
+            form.instance.language = request.LANGUAGE_CODE
             form.save()
             messages.success(request, _('Email added'))
             return HttpResponseRedirect(current)
@@ -273,3 +279,17 @@ def logout_user_view(requests):
     """
     logout(requests)
     return redirect('home')
+
+
+class UserStateView(View):
+    """
+    A view for the basket and favorite state of the visitor and their CSRF token in JSON, filled
+    in the pages shared by the anonymous visitors by the script of inc/_user_state.html.
+    """
+
+    def get(self, request):
+        state = get_user_state(request.session.get('user_authenticated'))
+        state['csrf_token'] = get_token(request)
+        response = JsonResponse(state)
+        add_never_cache_headers(response)
+        return response